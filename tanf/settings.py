@@ -267,6 +267,47 @@ if 'NOLOGINGOV' not in os.environ:
     LOGIN_URL = '/openid/openid/logingov_test'
 
 
+# How many processes to use to parse big TANF files.  1 means parse them
+# in the import task itself.
+TANF_PARSE_WORKERS = int(os.environ.get('TANF_PARSE_WORKERS', '1'))
+
+# How many records an import stores in each transaction.  If the worker
+# doing an import gets killed, the retry carries on from the last one.
+TANF_IMPORT_CHUNK_SIZE = int(os.environ.get('TANF_IMPORT_CHUNK_SIZE', '10000'))
+
+# How many records of each type the preview of an upload shows.
+TANF_PREVIEW_RECORDS = int(os.environ.get('TANF_PREVIEW_RECORDS', '5'))
+
+# How many lines that can't be parsed an import keeps to show people, and
+# how many it puts up with before giving up on the file.
+TANF_ERROR_SAMPLES = int(os.environ.get('TANF_ERROR_SAMPLES', '100'))
+TANF_ERROR_THRESHOLD = int(os.environ.get('TANF_ERROR_THRESHOLD', '1000'))
+
+# How imports find records that are in a file more than once (see
+# tanfparser/duplicates.py):  'exact' keeps the hashes of every record,
+# 'bloom' keeps a fixed size bloom filter for files of up to
+# TANF_DUPLICATE_BLOOM_CAPACITY records instead, which takes a lot less
+# memory but very occasionally calls a record a duplicate when it isn't,
+# and 'off' doesn't look for them at all.
+TANF_DUPLICATE_CHECK = os.environ.get('TANF_DUPLICATE_CHECK', 'exact').lower()
+TANF_DUPLICATE_BLOOM_CAPACITY = int(os.environ.get('TANF_DUPLICATE_BLOOM_CAPACITY', '10000000'))
+
+# Whether the parsed and validated records of uploads are kept around (see
+# upload/parsecache.py), so that uploading the same file again skips
+# straight to storing them, and how old (in seconds) and how big (in bytes)
+# the parse cache can get.
+TANF_PARSE_CACHE = os.environ.get('TANF_PARSE_CACHE', 'true').lower() in ('1', 'true', 'yes')
+TANF_PARSE_CACHE_MAX_AGE = int(os.environ.get('TANF_PARSE_CACHE_MAX_AGE', str(7 * 24 * 60 * 60)))
+TANF_PARSE_CACHE_MAX_SIZE = int(os.environ.get('TANF_PARSE_CACHE_MAX_SIZE', str(1024 * 1024 * 1024)))
+
+# Uploads are hashed as they come in, for the parse cache.
+FILE_UPLOAD_HANDLERS = [
+    'upload.parsecache.HashingUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+
 # Use this to turn on lots of debugging output
 if 'DEBUG' in os.environ:
     logging.basicConfig(level=logging.DEBUG)
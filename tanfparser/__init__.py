@@ -0,0 +1,19 @@
+# This is the code that parses the fixed-width txt files that STTs send us.
+# It doesn't know anything about django, so it is shared by the upload app
+# (which stores the records in the db) and the tanf2json command line tool.
+#
+# Keep it that way:  nothing in here should import django or the upload app,
+# and anything slow to import (like numpy) should only be imported by code
+# that needs it.
+
+from tanfparser.layouts import RecordLayout, recordlayouts, getLayout, parseFields, layoutVersion, LAYOUT_VERSION  # noqa: F401
+from tanfparser.ssn import encryptmap, decryptmap, encryptSsn, decryptSsn, decryptSsns  # noqa: F401
+from tanfparser.records import RecordType, recordtypes, LayoutCache, getRecordType  # noqa: F401
+from tanfparser.reader import readLines, mappedLines, streamLines, offsetLines, lineText, decompressed, CompressedFileError  # noqa: F401
+from tanfparser.values import parseDate, parseInt, parseDateBytes, parseIntBytes, parseText  # noqa: F401
+from tanfparser.errors import ErrorSink, TANFParseError  # noqa: F401
+from tanfparser.recordviews import RecordView, recordView, readRecords  # noqa: F401
+from tanfparser.preflight import preflight, preview  # noqa: F401
+from tanfparser.pipeline import Pipeline, Record, Sink, NullSink, scanRecords, splitStage, DecryptStage  # noqa: F401
+from tanfparser.tojson import jsonsections, JsonSink, tanf2jsonStream, tanf2json  # noqa: F401
+from tanfparser.caseindex import CaseIndex, caseKey  # noqa: F401
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+#
+# This parses the txt files that are sent by STT people to the TDRS app and
+# emits a json document.  The file can be gzipped or zipped.
+#
+# usage:  python3 -m tanfparser [--ndjson] sec1_encr_fake.txt > /tmp/sec1_encr_fake.json
+#
+
+import argparse
+import sys
+from tanfparser.errors import TANFParseError
+from tanfparser.reader import decompressed, CompressedFileError
+from tanfparser.tojson import tanf2jsonStream
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='tanf2json', description='Turn a TANF data file into json.')
+    parser.add_argument('--ndjson', action='store_true', help='write one json record per line instead of one document')
+    parser.add_argument('file', help='the TANF data file to parse')
+    args = parser.parse_args(argv)
+
+    with open(args.file, 'rb') as original:
+        try:
+            with decompressed(original) as f:
+                tanf2jsonStream(f, sys.stdout, ndjson=args.ndjson)
+        except CompressedFileError as e:
+            print(args.file + ': ' + str(e), file=sys.stderr)
+            sys.exit(1)
+        except TANFParseError as e:
+            sys.stdout.flush()
+            print('\n' + args.file + ': ' + e.summary(), file=sys.stderr)
+            for lineno, kind, line in e.lines:
+                print('line {}: {}: {}'.format(lineno, kind, line), file=sys.stderr)
+            sys.exit(1)
+    if not args.ndjson:
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import array
+import hashlib
+
+
+# Some edits are about how records relate to each other instead of about
+# one record, like "every adult and child has a family (T1) in the same
+# reporting month".  These are the reason codes for them, which go into
+# invalidreason just like the ones from the rules.
+NO_FAMILY = {'T2': 'T2-12', 'T3': 'T3-09'}
+UNKNOWN_PERSON = 'T5-01'
+
+caseindexmessages = {
+    'T2-12': 'there is no T1 for this casenumber in this reportingmonth',
+    'T3-09': 'there is no T1 for this casenumber in this reportingmonth',
+    'T5-01': 'there is no adult or child with this casenumber and socialsecuritynumber in this calendar quarter',
+}
+
+# These are where the people in each kind of record are.  A T3 can have
+# two children, and the second one can be blank.
+personfields = {
+    'T2': ('socialsecuritynumber',),
+    'T3': ('socialsecuritynumber_1', 'socialsecuritynumber_2'),
+    'T5': ('socialsecuritynumber',),
+}
+
+
+# This boils a key like (reportingmonth, casenumber) down to a 64 bit int,
+# so that the index only needs 8 bytes a key.  The values are compared as
+# stripped strings, so the padded strings from the file and the values that
+# were stored in the db give back the same key.  With a million keys in a
+# file, the chance of any two different ones colliding is about 1 in 40
+# million.
+def caseKey(*values):
+    text = '\x1f'.join(str(value).strip() for value in values)
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little', signed=True)
+
+
+# A CaseIndex is the part of a file that the cross record edits need,
+# collected as the records go by:  the (reportingmonth, casenumber) of every
+# family, and of every adult and child, which get checked against the
+# families once the whole file has been read.  The same goes for the
+# (casenumber, socialsecuritynumber) of every adult and child, which the
+# closed people get checked against.  The keys are hashed with caseKey()
+# and kept in arrays, rather than kept as tuples of strings in sets, so a
+# million record file takes a few tens of MB instead of hundreds.
+#
+# Records are added as (prefix, fields, values), like the upload app stores
+# them.  Records with a blank reportingmonth or casenumber are left out,
+# since the rules already complain about those, and so are adults and
+# children with a blank ssn.
+class CaseIndex:
+    def __init__(self):
+        self.families = array.array('q')
+        self.members = {prefix: array.array('q') for prefix in NO_FAMILY}
+        self.people = array.array('q')
+        self.closed = array.array('q')
+        self._positions = {}
+
+    def __repr__(self):
+        return '<CaseIndex {} families, {} members, {} closed>'.format(
+            len(self.families), sum(len(keys) for keys in self.members.values()), len(self.closed))
+
+    def add(self, prefix, fields, values):
+        if prefix != 'T1' and prefix not in personfields:
+            return
+        positions = self._positions.get((prefix, fields))
+        if positions is None:
+            positions = self._positions[prefix, fields] = (
+                fields.index('reportingmonth'), fields.index('casenumber'),
+                [fields.index(field) for field in personfields.get(prefix, ()) if field in fields])
+        month = values[positions[0]]
+        casenumber = values[positions[1]]
+        if month is None or not str(month).strip() or not str(casenumber).strip():
+            return
+        if prefix == 'T1':
+            self.families.append(caseKey(month, casenumber))
+        elif prefix in self.members:
+            self.members[prefix].append(caseKey(month, casenumber))
+        # a closed person with a blank ssn can't be anybody, so it goes in
+        # to come out of unknownClosed()
+        people = self.closed if prefix == 'T5' else self.people
+        for i in positions[2]:
+            if prefix == 'T5' or str(values[i]).strip():
+                people.append(caseKey(casenumber, values[i]))
+
+    # This gives back {prefix: the keys of the adults or children of that
+    # type that have no family} as a sorted numpy array for each prefix
+    # that has any, to check keys from somewhere else against with
+    # numpy.isin().
+    def orphans(self):
+        import numpy as np
+
+        families = np.unique(np.array(self.families, dtype=np.int64))
+        orphans = {}
+        for prefix, keys in self.members.items():
+            keys = np.unique(np.array(keys, dtype=np.int64))
+            missing = keys[~np.isin(keys, families, assume_unique=True)]
+            if len(missing):
+                orphans[prefix] = missing
+        return orphans
+
+    # This gives back the keys of the closed people that aren't an adult or
+    # child in the file, as a sorted numpy array.  They could still be
+    # someone from an earlier file in the same calendar quarter.
+    def unknownClosed(self):
+        import numpy as np
+
+        closed = np.unique(np.array(self.closed, dtype=np.int64))
+        return closed[~np.isin(closed, np.array(self.people, dtype=np.int64))]
@@ -0,0 +1,186 @@
+import array
+import math
+from tanfparser.caseindex import caseKey
+
+
+# A record that is in a file more than once is invalid the second (and
+# third...) time.  These are the reason codes for that, and what makes two
+# records the same:  a family is its casenumber in a reportingmonth, and an
+# adult or child is also their ssn.  Records with a blank reportingmonth or
+# casenumber, or people with no ssn, are left out, since the rules already
+# complain about those.
+DUPLICATE = {'T1': 'T1-16', 'T2': 'T2-13', 'T3': 'T3-10'}
+
+duplicatefields = {
+    'T1': ('reportingmonth', 'casenumber'),
+    'T2': ('reportingmonth', 'casenumber', 'socialsecuritynumber'),
+    'T3': ('reportingmonth', 'casenumber', 'socialsecuritynumber_1', 'socialsecuritynumber_2'),
+}
+
+duplicatemessages = {
+    'T1-16': 'there is already a T1 for this casenumber in this reportingmonth',
+    'T2-13': 'there is already a T2 for this casenumber and socialsecuritynumber in this reportingmonth',
+    'T3-10': 'there is already a T3 for this casenumber and these socialsecuritynumbers in this reportingmonth',
+}
+
+# How often a BloomFilter says it has seen a key that it hasn't, when it
+# isn't over capacity.
+BLOOM_ERROR_RATE = 1e-6
+
+
+# A KeySet is a set of the 64 bit ints that caseKey() gives back, kept in
+# one array of slots with open addressing, so it takes 8 to 16 bytes a key
+# instead of the 50 or so that a set of ints does.  Since the keys are
+# hashes already, their low bits are the slot to try first.  0 marks an empty
+# slot, so a key of 0 is stored as 1.
+class KeySet:
+    def __init__(self, size=1024):
+        self.slots = array.array('q', bytes(8 * size))
+        self.mask = size - 1
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return '<KeySet {} keys in {} slots>'.format(self.count, len(self.slots))
+
+    # This adds key, and gives back whether it was already there.
+    def add(self, key):
+        key = key or 1
+        slots = self.slots
+        mask = self.mask
+        i = key & mask
+        while slots[i]:
+            if slots[i] == key:
+                return True
+            i = (i + 1) & mask
+        slots[i] = key
+        self.count += 1
+        # never let it get more than half full, or finding an empty slot
+        # starts taking a while
+        if self.count * 2 > len(slots):
+            self._grow()
+        return False
+
+    def addMany(self, keys):
+        return [self.add(key) for key in keys]
+
+    def _grow(self):
+        old = self.slots
+        self.slots = array.array('q', bytes(16 * len(old)))
+        self.mask = len(self.slots) - 1
+        self.count = 0
+        for key in old:
+            if key:
+                self.add(key)
+
+
+# A BloomFilter is a set of 64 bit keys that takes a fixed amount of memory
+# however many keys go in it:  about 3.6 bytes a key for capacity keys, at
+# the default error rate.  The catch is that it sometimes says that it has
+# seen a key when it hasn't, which for duplicates means marking a record
+# invalid that isn't, about once in every 1/error rate records.  It gets
+# worse quickly once there are more than capacity keys in it, so capacity
+# should be more than the number of records in the biggest file.
+class BloomFilter:
+    def __init__(self, capacity, errorrate=BLOOM_ERROR_RATE):
+        self.size = max(64, int(-capacity * math.log(errorrate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return '<BloomFilter {} keys, {} bits, {} hashes>'.format(self.count, self.size, self.hashes)
+
+    # This adds key, and gives back whether it (probably) was already there.
+    # The bits for key come from its two halves, which are as good as two
+    # different hashes of it.
+    def add(self, key):
+        key &= 0xffffffffffffffff
+        first = key & 0xffffffff
+        step = (key >> 32) | 1
+        bits = self.bits
+        seen = True
+        for i in range(self.hashes):
+            bit = (first + i * step) % self.size
+            mask = 1 << (bit & 7)
+            if not bits[bit >> 3] & mask:
+                bits[bit >> 3] |= mask
+                seen = False
+        if not seen:
+            self.count += 1
+        return seen
+
+    # This is add() for a list of keys, which is a lot faster than adding
+    # them one at a time, since the bits get looked at with numpy.  A key is
+    # seen if it was there before any of them were added, or if it came up
+    # earlier in keys.
+    def addMany(self, keys):
+        import numpy as np
+
+        if not keys:
+            return []
+        keys = np.array(keys, dtype=np.int64).view(np.uint64)
+        first = keys & np.uint64(0xffffffff)
+        step = (keys >> np.uint64(32)) | np.uint64(1)
+        bits = (first[:, None] + np.arange(self.hashes, dtype=np.uint64) * step[:, None]) % np.uint64(self.size)
+        offsets = (bits >> np.uint64(3)).astype(np.intp)
+        masks = np.left_shift(1, bits & np.uint64(7)).astype(np.uint8)
+        array = np.frombuffer(self.bits, dtype=np.uint8)
+        seen = (array[offsets] & masks).all(axis=1)
+        repeats = np.ones(len(keys), dtype=bool)
+        repeats[np.unique(keys, return_index=True)[1]] = False
+        seen |= repeats
+        np.bitwise_or.at(array, offsets.ravel(), masks.ravel())
+        self.count += int(len(seen) - seen.sum())
+        return seen.tolist()
+
+
+# A DuplicateCheck finds the records in a file that are the same as one
+# that came before them, in one pass, as the records go by.  Records are
+# added as (prefix, fields, values), like with a CaseIndex, and add() gives
+# back the reason code if the record is a duplicate, or None.
+#
+# seen is where the keys of the records go, which is a KeySet by default,
+# or can be a BloomFilter to keep the memory down for very big files.
+class DuplicateCheck:
+    def __init__(self, seen=None):
+        self.seen = KeySet() if seen is None else seen
+        self._positions = {}
+
+    def __repr__(self):
+        return '<DuplicateCheck {!r}>'.format(self.seen)
+
+    def add(self, prefix, fields, values):
+        key = self._key(prefix, fields, values)
+        if key is not None and self.seen.add(key):
+            return DUPLICATE[prefix]
+        return None
+
+    # This is add() for a list of (prefix, fields, values), which is how
+    # the records should be added if they come in batches.
+    def addMany(self, records):
+        keys = [self._key(prefix, fields, values) for prefix, fields, values in records]
+        seen = iter(self.seen.addMany([key for key in keys if key is not None]))
+        return [DUPLICATE[prefix] if key is not None and next(seen) else None
+                for key, (prefix, fields, values) in zip(keys, records)]
+
+    def _key(self, prefix, fields, values):
+        positions = self._positions.get((prefix, fields))
+        if positions is None:
+            positions = self._positions[prefix, fields] = [fields.index(field) for field in duplicatefields.get(prefix, ()) if field in fields]
+        if not positions:
+            return None
+        month, casenumber, *ssns = [values[i] for i in positions]
+        if month is None or not str(month).strip() or not str(casenumber).strip():
+            return None
+        # a child is the same child whichever T3 layout they are in, so
+        # blank ssns are left out of the key
+        people = [ssn for ssn in ssns if ssn is not None and str(ssn).strip()]
+        if ssns and not people:
+            return None
+        return caseKey(prefix, month, casenumber, *people)
@@ -0,0 +1,99 @@
+import collections
+import tempfile
+
+
+# These are the kinds of problems that make a line impossible to parse.
+UNKNOWN_RECORD = 'unknown record type'
+SHORT_LINE = 'line too short'
+
+
+# This is what gets raised when a file has lines in it that couldn't be
+# parsed.  It has the counts of each kind of error, and the first lines that
+# had errors as (line number, kind, line).  If the import was given up on
+# because there were too many errors, aborted is True and the counts only
+# cover the part of the file that was read.
+class TANFParseError(Exception):
+    def __init__(self, errors, aborted=False):
+        self.counts = dict(errors.counts)
+        self.total = errors.total
+        self.lines = list(errors.lines)
+        self.spilled = errors.spilled
+        self.aborted = aborted
+        super().__init__('could not parse lines', self.summary())
+
+    def summary(self):
+        counts = ', '.join('{}: {}'.format(kind, count) for kind, count in sorted(self.counts.items()))
+        summary = '{} bad lines ({})'.format(self.total, counts)
+        if self.aborted:
+            summary = 'gave up after ' + summary
+        if self.lines:
+            lineno, kind, line = self.lines[0]
+            summary += ', first on line {} ({}): {!r}'.format(lineno, kind, line)
+        return summary
+
+
+# An ErrorSink collects the lines that couldn't be parsed without keeping
+# all of them in memory:  it counts them by kind, keeps the first keep of
+# them, and writes the rest out to the file that spill() gives back (a temp
+# file by default) as "line number<tab>kind<tab>line" lines.  Once there are
+# more than threshold errors it raises a TANFParseError right away, since a
+# file that is mostly garbage isn't going to get any better if we keep
+# reading it.
+class ErrorSink:
+    def __init__(self, keep=100, threshold=1000, spill=None):
+        self.keep = keep
+        self.threshold = threshold
+        self.counts = collections.Counter()
+        self.total = 0
+        self.lines = []
+        self.spilled = 0
+        self._spill = spill or (lambda: tempfile.TemporaryFile(mode='w+'))
+        self._spillfile = None
+
+    def __repr__(self):
+        return '<ErrorSink {} errors>'.format(self.total)
+
+    def __len__(self):
+        return self.total
+
+    def add(self, lineno, kind, line):
+        self.total += 1
+        self.counts[kind] += 1
+        if len(self.lines) < self.keep:
+            self.lines.append((lineno, kind, line))
+        else:
+            if self._spillfile is None:
+                self._spillfile = self._spill()
+            self._spillfile.write('{}\t{}\t{}\n'.format(lineno, kind, line))
+            self.spilled += 1
+        if self.threshold is not None and self.total > self.threshold:
+            self.close()
+            raise TANFParseError(self, aborted=True)
+
+    # This is for adding errors that somebody else collected, like the
+    # worker processes in the upload app.
+    def extend(self, errors, lineoffset=0):
+        for lineno, kind, line in errors:
+            self.add(lineno + lineoffset, kind, line)
+
+    # state() and restore() are for carrying the errors over to somebody
+    # who picks up reading the file where this left off.  The lines that
+    # were spilled are only counted.
+    def state(self):
+        return {'counts': dict(self.counts), 'total': self.total, 'lines': self.lines, 'spilled': self.spilled}
+
+    def restore(self, state):
+        self.counts = collections.Counter(state['counts'])
+        self.total = state['total']
+        self.lines = [tuple(line) for line in state['lines']]
+        self.spilled = state['spilled']
+
+    def check(self):
+        if self.total > 0:
+            self.close()
+            raise TANFParseError(self)
+
+    def close(self):
+        if self._spillfile is not None:
+            self._spillfile.close()
+            self._spillfile = None
@@ -0,0 +1,479 @@
+import hashlib
+import json
+import operator
+import struct
+
+
+##########################################################################
+# This is where the record types are defined:  The keys are the json
+# names for the fields, and the values are the size of the fields in bytes.
+# The field sizes and names are derived from the documentation under
+# https://www.acf.hhs.gov/ofa/resource/tanfedit/index
+
+# header records
+header_fields = {
+    "title": 6,
+    "calendarquarter": 5,
+    "datatype": 1,
+    "statefipscode": 2,
+    "tribecode": 3,
+    "programtype": 3,
+    "editindicator": 1,
+    "encryptionindicator": 1,
+    "updateindicator": 1
+}
+
+# T1 records
+section1_familydata_fields = {
+    "recordtype": 2,
+    "reportingmonth": 6,
+    "casenumber": 11,
+    "countyfipscode": 3,
+    "stratum": 2,
+    "zipcode": 5,
+    "fundingstream": 1,
+    "disposition": 1,
+    "newapplicant": 1,
+    "numfamilymembers": 2,
+    "typeoffamilyforworkparticipation": 1,
+    "receivessubsidizedhousing": 1,
+    "receivesmedicalassistance": 1,
+    "receivesfoodstamps": 1,
+    "amtoffoodstampassistance": 4,
+    "receivessubsidizedchildcare": 1,
+    "amtofsubsidizedchildcare": 4,
+    "amtofchildsupport": 4,
+    "amtoffamilycashresources": 4,
+    "cash_amount": 4,
+    "cash_nbr_month": 3,
+    "tanfchildcare_amount": 4,
+    "tanfchildcare_children_covered": 2,
+    "tanfchildcare_nbr_months": 3,
+    "transportation_amount": 4,
+    "transportation_nbr_months": 3,
+    "transitionalservices_amount": 4,
+    "transitionalservices_nbr_months": 3,
+    "other_amount": 4,
+    "other_nbr_months": 3,
+    "sanctionsreduction_amt": 4,
+    "workrequirementssanction": 1,
+    "familysanctionforadultnohsdiploma": 1,
+    "sanctionforteenparentnotattendingschool": 1,
+    "noncooperatewithchildsupport": 1,
+    "failuretocomploywithirp": 1,
+    "othersanction": 1,
+    "recoupmentofprioroverpayment": 4,
+    "othertotalreductionamt": 4,
+    "familycap": 1,
+    "reductionbasedonlengthofreceiptofassistance": 1,
+    "othernonsanction": 1,
+    "waiver_evaluation_control_gprs": 1,
+    "tanffamilyexemptfromtimelimits": 2,
+    "tanffamilynewchildonlyfamily": 1,
+    # "blank": 39
+}
+
+# T2 records
+section1_adultdata_fields = {
+    "recordtype": 2,
+    "reportingmonth": 6,
+    "casenumber": 11,
+    "familyafilliation": 1,
+    "noncustodialparent": 1,
+    "dateofbirth": 8,
+    "socialsecuritynumber": 9,
+    "racehispanic": 1,
+    "racenativeamerican": 1,
+    "raceasian": 1,
+    "raceblack": 1,
+    "racewhite": 1,
+    "gender": 1,
+    "oasdibenefits": 1,
+    "nonssabenefits": 1,
+    "titlexivapdtbenefits": 1,
+    "titlexviaabdbenefits": 1,
+    "titlexvissibenefits": 1,
+    "maritalstatus": 1,
+    "relationshiptohh": 2,
+    "parentminorchild": 1,
+    "pregnantneeds": 1,
+    "educationlevel": 2,
+    "citizenship": 1,
+    "coopwithchildsupport": 1,
+    "countablemonths": 3,
+    "countablemonthsremaining": 2,
+    "currentmonthexempt": 1,
+    "employmentstatus": 1,
+    "workeligibleindicator": 2,
+    "workparticipationstatus": 2,
+    "unsubsidizedemployment": 2,
+    "subsidizedprivateemployment": 2,
+    "subsidizedpublicemployment": 2,
+    "workexperiencehours": 2,
+    "workexperienceexcusedabsences": 2,
+    "workexperienceholidays": 2,
+    "onthejobtraining": 2,
+    "jobsearchhours": 2,
+    "jobsearchexcusedabsences": 2,
+    "jobsearchholidays": 2,
+    "communitysvchours": 2,
+    "communitysvcexcusedabsences": 2,
+    "communitysvcholidays": 2,
+    "vocationaltraininghours": 2,
+    "vocationaltrainingexcusedabsences": 2,
+    "vocationaltrainingholidays": 2,
+    "jobskillshours": 2,
+    "jobskillsexcusedabsences": 2,
+    "jobskillsholidays": 2,
+    "eduwithnodiplomahours": 2,
+    "eduwithnodiplomaexcusedabsences": 2,
+    "eduwithnodiplomaholidays": 2,
+    "satisfactoryschoolhours": 2,
+    "satisfactoryschoolexcusedabsences": 2,
+    "satisfactoryschoolholidays": 2,
+    "providingchildcarehours": 2,
+    "providingchildcareexcusedabsences": 2,
+    "providingchildcareholidays": 2,
+    "otherwork": 2,
+    "corehoursforoverallrate": 2,
+    "corehoursfortwoparentrate": 2,
+    "earnedincome": 4,
+    "unearnedincomeincometaxcredit": 4,
+    "unearnedincomesocialsecurity": 4,
+    "unearnedincomessi": 4,
+    "unearnedincomeworkerscomp": 4,
+    "unearnedincomeother": 4,
+}
+
+# T3 records
+# These are the full fields as depicted in
+# https://www.acf.hhs.gov/sites/default/files/ofa/tanf_data_report_section1_10_2008.pdf
+section1_childdata_fields = {
+    "recordtype": 2,
+    "reportingmonth": 6,
+    "casenumber": 11,
+
+    "familyafilliation_1": 1,
+    "dateofbirth_1": 8,
+    "socialsecuritynumber_1": 9,
+    "racehispanic_1": 1,
+    "racenativeamerican_1": 1,
+    "raceasian_1": 1,
+    "raceblack_1": 1,
+    "racepacific_1": 1,
+    "racewhite_1": 1,
+    "gender_1": 1,
+    "nonssabenefits_1": 1,
+    "titlexvissibenefits_1": 1,
+    "relationshiptohh_1": 2,
+    "parentminorchild_1": 1,
+    "educationlevel_1": 2,
+    "citizenship_1": 1,
+    "unearnedincomessi_1": 4,
+    "unearnedincomeother_1": 4,
+
+    "familyafilliation_2": 1,
+    "dateofbirth_2": 8,
+    "socialsecuritynumber_2": 9,
+    "racehispanic_2": 1,
+    "racenativeamerican_2": 1,
+    "raceasian_2": 1,
+    "raceblack_2": 1,
+    "racepacific_2": 1,
+    "racewhite_2": 1,
+    "gender_2": 1,
+    "nonssabenefits_2": 1,
+    "titlexvissibenefits_2": 1,
+    "relationshiptohh_2": 2,
+    "parentminorchild_2": 1,
+    "educationlevel_2": 2,
+    "citizenship_2": 1,
+    "unearnedincomessi_2": 4,
+    "unearnedincomeother_2": 4,
+
+    "blank": 55,
+
+    "jobsearchhours": 2,
+    "jobsearchexcusedabsences": 2,
+    "jobsearchholidays": 2,
+    "communitysvchours": 2,
+    "communitysvcexcusedabsences": 2,
+    "communitysvcholidays": 2,
+    "vocationaltraininghours": 2,
+    "vocationaltrainingexcusedabsences": 2,
+    "vocationaltrainingholidays": 2,
+    "jobskillshours": 2,
+    "jobskillsexcusedabsences": 2,
+    "jobskillsholidays": 2,
+    "eduwithnodiplomahours": 2,
+    "eduwithnodiplomaexcusedabsences": 2,
+    "eduwithnodiplomaholidays": 2,
+    "satisfactoryschoolhours": 2,
+    "satisfactoryschoolexcusedabsences": 2,
+    "satisfactoryschoolholidays": 2,
+    "providingchildcarehours": 2,
+    "providingchildcareexcusedabsences": 2,
+    "providingchildcareholidays": 2,
+    "otherwork": 2,
+    "corehoursforoverallrate": 2,
+    "corehoursfortwoparentrate": 2,
+    "earnedincome": 4,
+    "unearnedincomeincometaxcredit": 4,
+    "unearnedincomesocialsecurity": 4,
+    "unearnedincomessi": 4,
+    "unearnedincomeworkerscomp": 4,
+    "unearnedincomeother": 4,
+}
+
+# T3 records:  Our example data seems to be missing a character and is otherwise truncated,
+#      so let's hope that 3 chars for the last field is OK.
+section1_childdata_fields_exampledata = {
+    "recordtype": 2,
+    "reportingmonth": 6,
+    "casenumber": 11,
+
+    "familyafilliation_1": 1,
+    "dateofbirth_1": 8,
+    "socialsecuritynumber_1": 9,
+    "racehispanic_1": 1,
+    "racenativeamerican_1": 1,
+    "raceasian_1": 1,
+    "raceblack_1": 1,
+    "racepacific_1": 1,
+    "racewhite_1": 1,
+    "gender_1": 1,
+    "nonssabenefits_1": 1,
+    "titlexvissibenefits_1": 1,
+    "relationshiptohh_1": 2,
+    "parentminorchild_1": 1,
+    "educationlevel_1": 2,
+    "citizenship_1": 1,
+    "unearnedincomessi_1": 4,
+    "unearnedincomeother_1": 3,
+}
+
+# T3 records:  Our example data seems to be missing a character, sometimes
+#      has 2 children in it and is also truncated,
+#      so let's hope that 3 chars for the last field of the first child is OK.
+section1_childdata_fields_twochild = {
+    "recordtype": 2,
+    "reportingmonth": 6,
+    "casenumber": 11,
+
+    "familyafilliation_1": 1,
+    "dateofbirth_1": 8,
+    "socialsecuritynumber_1": 9,
+    "racehispanic_1": 1,
+    "racenativeamerican_1": 1,
+    "raceasian_1": 1,
+    "raceblack_1": 1,
+    "racepacific_1": 1,
+    "racewhite_1": 1,
+    "gender_1": 1,
+    "nonssabenefits_1": 1,
+    "titlexvissibenefits_1": 1,
+    "relationshiptohh_1": 2,
+    "parentminorchild_1": 1,
+    "educationlevel_1": 2,
+    "citizenship_1": 1,
+    "unearnedincomessi_1": 4,
+    "unearnedincomeother_1": 3,
+
+    "familyafilliation_2": 1,
+    "dateofbirth_2": 8,
+    "socialsecuritynumber_2": 9,
+    "racehispanic_2": 1,
+    "racenativeamerican_2": 1,
+    "raceasian_2": 1,
+    "raceblack_2": 1,
+    "racepacific_2": 1,
+    "racewhite_2": 1,
+    "gender_2": 1,
+    "nonssabenefits_2": 1,
+    "titlexvissibenefits_2": 1,
+    "relationshiptohh_2": 2,
+    "parentminorchild_2": 1,
+    "educationlevel_2": 2,
+    "citizenship_2": 1,
+    "unearnedincomessi_2": 4,
+    "unearnedincomeother_2": 4,
+}
+
+
+# T4 records
+section2_closedcase_fields = {
+    "recordtype": 2,
+    "reportingmonth": 6,
+    "casenumber": 11,
+    "countyfipscode": 3,
+    "stratum": 2,
+    "zipcode": 5,
+    "disposition": 1,
+    "reason": 2,
+    "receivessubsidizedhousing": 1,
+    "receivesmedicalassistance": 1,
+    "receivesfoodstamps": 1,
+    "receivessubsidizedchildcare": 1,
+}
+
+# T5 records
+section2_closedperson_fields = {
+    "recordtype": 2,
+    "reportingmonth": 6,
+    "casenumber": 11,
+    "familyafilliation": 1,
+    "dateofbirth": 8,
+    "socialsecuritynumber": 9,
+    "racehispanic": 1,
+    "racenativeamerican": 1,
+    "raceasian": 1,
+    "raceblack": 1,
+    "racepacific": 1,
+    "racewhite": 1,
+    "gender": 1,
+    "oasdibenefits": 1,
+    "nonssabenefits": 1,
+    "titlexivapdtbenefits": 1,
+    "titlexviaabdbenefits": 1,
+    "titlexvissibenefits": 1,
+    "maritalstatus": 1,
+    "relationshiptohh": 2,
+    "parentminorchild": 1,
+    "pregnantneeds": 1,
+    "educationlevel": 2,
+    "citizenship": 1,
+    "countablemonths": 3,
+    "countablemonthsremaining": 2,
+    "employmentstatus": 1,
+    "earnedincome": 4,
+    "unearnedincome": 4,
+}
+
+# T6 records
+section3_aggregatedata_fields = {
+    "recordtype": 2,
+    # XXX many more fields need to be added here
+}
+
+# T7 records
+section4_familiesbystratum_fields = {
+    "recordtype": 2,
+    # XXX many more fields need to be added here
+}
+
+# trailer records
+trailer_fields = {
+    "title": 7,
+    "numrecords": 7,
+    # "blank": 9
+}
+
+# The record type definitions end here.
+##########################################################################
+
+
+# itemgetter() with slices cuts all the fields out of a line in one C call,
+# without the encode/decode round trip that struct needs.  It only gives
+# back a tuple if there is more than one slice, though, so this always does.
+def sliceGetter(slices):
+    if len(slices) == 0:
+        return lambda line: ()
+    if len(slices) == 1:
+        getter = operator.itemgetter(slices[0])
+        return lambda line: (getter(line),)
+    return operator.itemgetter(*slices)
+
+
+# A RecordLayout is a record type definition compiled once into everything
+# we need to slice a line up:  the field names, the offsets of each field and
+# the total width.  Negative widths are padding that gets skipped, just like
+# 'x' in a struct format string.
+#
+# unpack() gives back a tuple of strings in field order, and parse() gives
+# back the same dictionary that parseFields() always has.  Lines can be
+# strings, or bytes/memoryviews straight out of the file.
+class RecordLayout:
+    def __init__(self, name, fieldinfo):
+        self.name = name
+        self.fieldinfo = fieldinfo
+        fields = []
+        slices = []
+        offset = 0
+        for field, width in fieldinfo.items():
+            if width > 0:
+                fields.append(field)
+                slices.append(slice(offset, offset + width))
+            offset += abs(width)
+        self.fields = tuple(fields)
+        self.slices = dict(zip(fields, slices))
+        self.size = offset
+        self._slice = sliceGetter(slices)
+
+    def __repr__(self):
+        return '<RecordLayout {} ({} fields, {} chars)>'.format(self.name, len(self.fields), self.size)
+
+    def unpack(self, line):
+        self.checkSize(line)
+        if not isinstance(line, str):
+            line = str(line, 'utf-8')
+        return self._slice(line)
+
+    # This is unpack() for lines that are bytes or memoryviews, which leaves
+    # the fields as bytes.
+    def unpackBytes(self, line):
+        self.checkSize(line)
+        return self._slice(bytes(line))
+
+    # Slicing never complains about short lines, so complain the same way
+    # that struct.unpack_from() would have.
+    def checkSize(self, line):
+        if len(line) < self.size:
+            raise struct.error('{} requires a line of at least {} chars, got {}'.format(self.name, self.size, len(line)))
+
+    def parse(self, line):
+        return dict(zip(self.fields, self.unpack(line)))
+
+
+# This is the registry of compiled layouts, keyed by the name of the record
+# type definition they came from (without the _fields).
+recordlayouts = {
+    'header': RecordLayout('header', header_fields),
+    'section1_familydata': RecordLayout('section1_familydata', section1_familydata_fields),
+    'section1_adultdata': RecordLayout('section1_adultdata', section1_adultdata_fields),
+    'section1_childdata': RecordLayout('section1_childdata', section1_childdata_fields),
+    'section1_childdata_exampledata': RecordLayout('section1_childdata_exampledata', section1_childdata_fields_exampledata),
+    'section1_childdata_twochild': RecordLayout('section1_childdata_twochild', section1_childdata_fields_twochild),
+    'section2_closedcase': RecordLayout('section2_closedcase', section2_closedcase_fields),
+    'section2_closedperson': RecordLayout('section2_closedperson', section2_closedperson_fields),
+    'section3_aggregatedata': RecordLayout('section3_aggregatedata', section3_aggregatedata_fields),
+    'section4_familiesbystratum': RecordLayout('section4_familiesbystratum', section4_familiesbystratum_fields),
+    'trailer': RecordLayout('trailer', trailer_fields),
+}
+
+
+# This changes whenever any of the record type definitions do, so that
+# anything that was worked out from an older version of them (like the
+# parse cache in the upload app) can tell that it is out of date.
+def layoutVersion(layouts=None):
+    layouts = recordlayouts if layouts is None else layouts
+    definitions = [[name, list(layout.fieldinfo.items())] for name, layout in sorted(layouts.items())]
+    return hashlib.sha1(json.dumps(definitions).encode()).hexdigest()[:16]
+
+
+LAYOUT_VERSION = layoutVersion()
+
+# parseFields() gets handed the field dicts themselves, so keep a way to get
+# from those back to their layouts without hashing the whole dict every line.
+_layoutsbyid = {id(layout.fieldinfo): layout for layout in recordlayouts.values()}
+
+
+def getLayout(fieldinfo):
+    layout = _layoutsbyid.get(id(fieldinfo))
+    if layout is None or layout.fieldinfo is not fieldinfo:
+        layout = RecordLayout('custom', fieldinfo)
+    return layout
+
+
+# This parses a particular record and gives back a dictionary
+def parseFields(fieldinfo, linestring):
+    return getLayout(fieldinfo).parse(linestring)
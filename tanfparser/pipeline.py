@@ -0,0 +1,292 @@
+import itertools
+import queue
+import struct
+import threading
+from tanfparser.errors import ErrorSink, UNKNOWN_RECORD, SHORT_LINE
+from tanfparser.reader import lineText
+from tanfparser.records import getRecordType, LayoutCache
+from tanfparser.ssn import decryptSsn
+
+
+# A Pipeline moves the records of a TANF file from a source, through some
+# stages, and into a sink, a batch at a time:
+#
+#   source:     an iterable of records, like scanRecords() gives back
+#   stages:     callables that take a list of records and give back the list
+#               of records to pass on, which can be the same list changed in
+#               place (like splitStage and DecryptStage do)
+#   sink:       where the records end up, see Sink
+#
+# So tanf2json is scanRecords() -> splitStage -> DecryptStage -> JsonSink,
+# and swapping the sink for NullSink gives a benchmark of everything but the
+# writing.  The imports in the upload app use one too, with chunks of
+# records as the things going through it and the db as the sink.
+#
+# If queuesize is more than 0, the source and each of the stages run in
+# their own thread, and hand their batches on through queues that hold at
+# most queuesize batches.  When a queue is full, whoever is putting things in
+# it waits, so a slow sink holds up the stages and the reading of the file,
+# and there are never more than about (stages + 1) * (queuesize + 1) batches
+# in memory.  Because of the GIL, that only buys anything when something
+# waits on I/O, like a sink that waits on the db or the worker processes
+# of a parallel parse.  queuesize 0 runs everything one batch at a time in
+# the calling thread.
+#
+# The sink always runs in the calling thread, so that a sink that uses the
+# db does it on the caller's connection and in the caller's transaction.
+# Anything that goes wrong in a thread is raised again by run().
+class Pipeline:
+    def __init__(self, source, stages=(), sink=None, batchsize=1000, queuesize=4):
+        self.source = source
+        self.stages = list(stages)
+        self.sink = NullSink() if sink is None else sink
+        self.batchsize = batchsize
+        self.queuesize = queuesize
+
+    def __repr__(self):
+        return '<Pipeline {} stages -> {}>'.format(len(self.stages), type(self.sink).__name__)
+
+    # This runs the whole thing and gives back what sink.finish() does.
+    def run(self):
+        try:
+            if self.queuesize > 0:
+                self._runThreaded()
+            else:
+                for batch in batches(self.source, self.batchsize):
+                    for stage in self.stages:
+                        batch = stage(batch)
+                    self.sink.write(batch)
+            return self.sink.finish()
+        finally:
+            self.sink.close()
+
+    def _runThreaded(self):
+        stop = threading.Event()
+        queues = [queue.Queue(self.queuesize) for i in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=_produce, args=(self.source, self.batchsize, queues[0], stop), daemon=True)]
+        for stage, inqueue, outqueue in zip(self.stages, queues, queues[1:]):
+            threads.append(threading.Thread(target=_transform, args=(stage, inqueue, outqueue, stop), daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                batch = _get(queues[-1], stop)
+                if batch is _DONE:
+                    break
+                if isinstance(batch, _Failed):
+                    raise batch.exception
+                self.sink.write(batch)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+
+# This is what goes down a queue after the last batch.
+_DONE = object()
+
+
+# This goes down a queue instead of a batch when something went wrong, so
+# that the exception makes it to run().
+class _Failed:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+# The threads check every so often whether run() has given up on them, so
+# that they don't wait forever on a queue that nobody is going to empty.
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def _produce(source, batchsize, outqueue, stop):
+    source = iter(source)
+    try:
+        for batch in batches(source, batchsize):
+            if not _put(outqueue, batch, stop):
+                return
+    except BaseException as e:
+        _put(outqueue, _Failed(e), stop)
+        return
+    finally:
+        # if the source is a generator that got given up on, let it clean up
+        # now instead of whenever it gets garbage collected
+        if hasattr(source, 'close'):
+            source.close()
+    _put(outqueue, _DONE, stop)
+
+
+def _transform(stage, inqueue, outqueue, stop):
+    while True:
+        batch = _get(inqueue, stop)
+        if batch is _DONE or isinstance(batch, _Failed):
+            _put(outqueue, batch, stop)
+            return
+        try:
+            batch = stage(batch)
+        except BaseException as e:
+            _put(outqueue, _Failed(e), stop)
+            return
+        if not _put(outqueue, batch, stop):
+            return
+
+
+# This gives back the things in iterable as lists of up to size of them.
+def batches(iterable, size):
+    iterable = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterable, size))
+        if not batch:
+            return
+        yield batch
+
+
+# A Record is one line of a TANF file on its way through a pipeline.  The
+# source fills in where it came from, and the stages fill in the rest:
+#  lineno:      the line number in the file
+#  rt:          the RecordType
+#  layout:      the RecordLayout the line was parsed with
+#  line:        the line, as bytes
+#  fields:      the names of the values, once the line has been split up
+#  values:      a tuple of the values (strings, unless a stage has turned
+#               them into something else)
+#  reasons:     a list of the reasons the record is invalid, if any
+#  extra:       a dict of things about the record that aren't in the line,
+#               which can be shared by all the records of a file
+class Record:
+    __slots__ = ('lineno', 'rt', 'layout', 'line', 'fields', 'values', 'reasons', 'extra')
+
+    def __init__(self, lineno, rt, layout, line):
+        self.lineno = lineno
+        self.rt = rt
+        self.layout = layout
+        self.line = line
+        self.fields = None
+        self.values = None
+        self.reasons = []
+        self.extra = None
+
+    def __repr__(self):
+        return '<Record {} line {}>'.format(self.rt.prefix, self.lineno)
+
+    # The header and trailer go through the pipeline like any other record,
+    # but most stages leave them alone.
+    def isData(self):
+        return self.rt.section not in ('header', 'trailer')
+
+    def asDict(self):
+        if self.values is None:
+            return self.layout.parse(self.line)
+        return dict(zip(self.fields, self.values))
+
+
+# This is the source for most pipelines:  it gives back a Record for every
+# line that could be parsed, including the header and trailer.  Lines that
+# can't be go to errors, and a TANFParseError is raised after the last line
+# if there were any, just like everything else that reads TANF files.
+def scanRecords(lines, errors=None):
+    if errors is None:
+        errors = ErrorSink()
+    layouts = LayoutCache()
+    try:
+        for lineno, line in enumerate(lines, 1):
+            # skip blank lines
+            if not line:
+                continue
+
+            rt = getRecordType(line)
+            if rt is None:
+                errors.add(lineno, UNKNOWN_RECORD, lineText(line))
+                continue
+
+            try:
+                layout = layouts.layoutFor(rt, line)
+                layout.checkSize(line)
+            except struct.error:
+                errors.add(lineno, SHORT_LINE, lineText(line))
+                continue
+
+            yield Record(lineno, rt, layout, bytes(line))
+
+        errors.check()
+    finally:
+        errors.close()
+
+
+# This stage splits every record up into the strings for its fields, which
+# is what layout.parse() would give back.
+def splitStage(batch):
+    for record in batch:
+        record.fields = record.layout.fields
+        record.values = record.layout._slice(str(record.line, 'utf-8'))
+    return batch
+
+
+# This stage decrypts the ssns of every record after an encrypted header.
+# It works on whatever the values are by then, as long as the ssns are still
+# strings, so it can go after splitStage or after a stage that converts
+# the values to other types.
+class DecryptStage:
+    def __init__(self):
+        self.encrypted = False
+        self.indexes = {}
+
+    def __call__(self, batch):
+        for record in batch:
+            if record.rt.section == 'header':
+                self.encrypted = record.asDict()['encryptionindicator'] == 'E'
+                continue
+            if not self.encrypted or not record.rt.ssnfields or record.values is None:
+                continue
+            key = (record.rt, record.fields)
+            indexes = self.indexes.get(key)
+            if indexes is None:
+                indexes = self.indexes[key] = [i for i, field in enumerate(record.fields) if field in record.rt.ssnfields]
+            values = list(record.values)
+            for i in indexes:
+                values[i] = decryptSsn(values[i])
+            record.values = tuple(values)
+        return batch
+
+
+# A Sink is where the records of a pipeline end up.  write() gets every
+# batch, finish() is called after the last one if nothing went wrong and
+# gives back whatever run() should, and close() is always called at the end,
+# to clean up.
+class Sink:
+    def write(self, batch):
+        pass
+
+    def finish(self):
+        return None
+
+    def close(self):
+        pass
+
+
+# This throws everything away, which is handy for timing everything that
+# comes before it.  It gives back how many records there were.
+class NullSink(Sink):
+    def __init__(self):
+        self.count = 0
+
+    def write(self, batch):
+        self.count += len(batch)
+
+    def finish(self):
+        return self.count
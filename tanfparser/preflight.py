@@ -0,0 +1,189 @@
+import os
+from tanfparser.errors import ErrorSink, UNKNOWN_RECORD, SHORT_LINE
+from tanfparser.reader import lineText
+from tanfparser.records import recordtypes, getRecordType
+from tanfparser.recordviews import readRecords
+
+
+# These are the kinds of problems that only preflight() finds, since they
+# are about the file as a whole instead of one line.
+NO_HEADER = 'no header'
+NO_TRAILER = 'no trailer'
+MISPLACED = 'header or trailer in the wrong place'
+TRAILER_COUNT = 'trailer count does not match'
+
+# How much of the file preflight() reads at once.
+PREFLIGHT_BLOCK_SIZE = 16 * 1024 * 1024
+
+# How many records of each type preview() gives back, and how many problems.
+PREVIEW_RECORDS = 5
+PREVIEW_PROBLEMS = 10
+
+# This is the shortest that each kind of line can be, keyed by the first two
+# bytes of the line like recordtypes is.
+_minimumsizes = {key: min(layout.size for layout in rt.layouts) for key, rt in recordtypes.items() if isinstance(key, bytes)}
+HEADER_KEY = ord('H') * 256 + ord('E')
+TRAILER_KEY = ord('T') * 256 + ord('R')
+
+
+# This is a quick look over a whole TANF file to see if it is worth
+# importing, before anything goes near the db:  every line has to be a
+# record type that we know about and long enough for it, the first line has
+# to be the header and the last one the trailer, and the number of records
+# that the trailer says there are has to be how many there really are.
+#
+# It doesn't parse anything but the header and trailer.  It reads the file
+# a block at a time, and finds the start, length and first two bytes of
+# every line in the block with numpy, so python only ever looks at the
+# lines that are wrong, and the header and trailer.  That makes it about as
+# fast as the file can be read.  numpy is only imported when this is used.
+#
+# The problems go to errors, just like the ones that parsing finds, and a
+# TANFParseError is raised at the end if there were any, unless check is
+# False.  Otherwise it gives back what it found out about the file:
+#  lines:       how many lines there are, including blank ones
+#  counts:      {record type prefix: how many of them there are}
+#  header:      the parsed header
+#  trailer:     the parsed trailer
+def preflight(f, errors=None, check=True):
+    import numpy as np
+
+    if errors is None:
+        errors = ErrorSink()
+    sizes = np.full(65536, -1, dtype=np.int64)
+    for key, size in _minimumsizes.items():
+        sizes[key[0] * 256 + key[1]] = size
+    counts = np.zeros(65536, dtype=np.int64)
+    lineno = 0
+    first = last = None
+    headerlines = []
+
+    try:
+        carry = b''
+        while True:
+            block = f.read(PREFLIGHT_BLOCK_SIZE)
+            if isinstance(block, str):
+                block = block.encode('utf-8')
+            if block:
+                # only look at whole lines, and save the rest for next time
+                block = carry + block
+                end = block.rfind(b'\n') + 1
+                text = block[:end]
+                carry = block[end:]
+            else:
+                text = carry
+                if text and not text.endswith(b'\n'):
+                    text += b'\n'
+            if not text:
+                if block:
+                    continue
+                break
+
+            data = np.frombuffer(text, dtype=np.uint8)
+            ends = np.flatnonzero(data == ord('\n'))
+            starts = np.empty_like(ends)
+            starts[0] = 0
+            starts[1:] = ends[:-1] + 1
+            lengths = ends - starts
+            lengths -= (lengths > 0) & (data[ends - 1] == ord('\r'))
+            keys = data[starts].astype(np.int64) * 256 + data[np.minimum(starts + 1, len(data) - 1)]
+            linesizes = sizes[keys]
+            nonblank = lengths > 0
+
+            # HEADER and TRAILER are the only prefixes longer than the two
+            # bytes in keys, so those lines get a closer look
+            special = np.flatnonzero(nonblank & ((keys == HEADER_KEY) | (keys == TRAILER_KEY)))
+            for i in special:
+                line = text[starts[i]:starts[i] + lengths[i]]
+                if getRecordType(line) is None:
+                    linesizes[i] = -1
+                else:
+                    headerlines.append((lineno + int(i) + 1, line))
+
+            bad = nonblank & ((linesizes < 0) | (lengths < linesizes))
+            for i in np.flatnonzero(bad):
+                line = text[starts[i]:starts[i] + lengths[i]]
+                errors.add(lineno + int(i) + 1, UNKNOWN_RECORD if linesizes[i] < 0 else SHORT_LINE, lineText(line))
+
+            counts += np.bincount(keys[nonblank & (linesizes >= 0)], minlength=65536)
+            nonblanklines = np.flatnonzero(nonblank)
+            if len(nonblanklines):
+                if first is None:
+                    first = lineno + int(nonblanklines[0]) + 1
+                last = lineno + int(nonblanklines[-1]) + 1
+
+            lineno += len(ends)
+            if not block:
+                break
+
+        header = trailer = {}
+        for headerlineno, line in headerlines:
+            rt = getRecordType(line)
+            if headerlineno != (first if rt.section == 'header' else last):
+                errors.add(headerlineno, MISPLACED, lineText(line))
+            elif len(line) < rt.maxsize:
+                # this has already been complained about
+                continue
+            elif rt.section == 'header':
+                header = rt.parse(line)
+            else:
+                trailer = rt.parse(line)
+
+        if counts[HEADER_KEY] == 0:
+            errors.add(1, NO_HEADER, '')
+        if counts[TRAILER_KEY] == 0:
+            errors.add(lineno, NO_TRAILER, '')
+
+        records = int(counts.sum() - counts[HEADER_KEY] - counts[TRAILER_KEY])
+        if trailer:
+            numrecords = trailer['numrecords']
+            if not numrecords.isdigit() or int(numrecords) != records:
+                errors.add(last, TRAILER_COUNT, 'trailer says {}, but there are {} records'.format(numrecords.strip(), records))
+
+        if check:
+            errors.check()
+    finally:
+        errors.close()
+
+    return {
+        'lines': lineno,
+        'counts': {recordtypes[key].prefix: int(counts[key[0] * 256 + key[1]]) for key in _minimumsizes if counts[key[0] * 256 + key[1]]},
+        'header': header,
+        'trailer': trailer,
+    }
+
+
+# This is a first look at a TANF file for whoever just uploaded it, without
+# waiting for the import:  what preflight() finds out about it, along with
+# the first size records of each type as RecordViews, so that a file for the
+# wrong quarter or state, or one that is all wrong, shows up right away.  It
+# gives back preflight()'s dict with these added:
+#  records:     {record type prefix: [the first size records of that type]}
+#  problems:    the first PREVIEW_PROBLEMS problems, as (line number, kind,
+#               line), which don't get raised
+#  problemcount: how many problems there are in all
+#
+# f gets read twice, so it has to be able to seek, but the second time only
+# as far as it takes to find size of every type that preflight() counted.
+def preview(f, size=PREVIEW_RECORDS):
+    errors = ErrorSink(keep=PREVIEW_PROBLEMS, threshold=None, spill=lambda: open(os.devnull, 'w'))
+    info = preflight(f, errors, check=False)
+    info['problems'] = errors.lines
+    info['problemcount'] = errors.total
+
+    f.seek(0)
+    wanted = {prefix: min(size, count) for prefix, count in info['counts'].items() if prefix not in ('HEADER', 'TRAILER')}
+    records = {prefix: [] for prefix in wanted}
+    views = readRecords(f, ErrorSink(keep=0, threshold=None, spill=lambda: open(os.devnull, 'w')))
+    try:
+        for rt, record in views:
+            found = records.get(rt.prefix)
+            if found is None or len(found) >= size:
+                continue
+            found.append(record)
+            if all(len(records[prefix]) >= count for prefix, count in wanted.items()):
+                break
+    finally:
+        views.close()
+    info['records'] = records
+    return info
@@ -0,0 +1,176 @@
+import gzip
+import io
+import itertools
+import mmap
+import zipfile
+import zlib
+
+
+# These are what compressed files start with.
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+
+
+# This is what gets raised when a file looks compressed but can't be
+# decompressed, or is a zip file without exactly one file in it.
+class CompressedFileError(ValueError):
+    pass
+
+
+# This gives back the lines of a TANF file as bytes, without the line endings.
+#
+# If the file is a real file (on local disk, or a spooled temp file that has
+# rolled over to disk), it is memory mapped and each line is a memoryview
+# slice of the map, so the kernel page cache serves the file and nothing gets
+# copied.  Otherwise (S3 streams, lists of lines in tests, etc) we just read
+# it a line at a time.
+def readLines(f):
+    try:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        # no fileno, or an empty file, which can't be mapped
+        yield from streamLines(f)
+        return
+    yield from mappedLines(mapped)
+
+
+# This gives back the lines of a memory mapped file that start between
+# start and end, and then closes the map.  start has to be the start of a line.
+# If offsets is True, it gives back (offset of the next line, line) instead,
+# which is where somebody that stopped after the line would carry on from.
+def mappedLines(mapped, start=0, end=None, offsets=False):
+    view = memoryview(mapped)
+    try:
+        if end is None:
+            end = len(mapped)
+        size = len(mapped)
+        while start < end:
+            lineend = mapped.find(b'\n', start)
+            if lineend < 0:
+                lineend = size
+            nextstart = lineend + 1
+            if lineend > start and mapped[lineend - 1] == 13:
+                lineend -= 1
+            if offsets:
+                yield nextstart, view[start:lineend]
+            else:
+                yield view[start:lineend]
+            start = nextstart
+    finally:
+        view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            # somebody is still holding onto a line, so let it get cleaned
+            # up when they let go of it
+            pass
+
+
+# This is the fallback for readLines() for things that can't be mapped.
+# Streams can give us bytes (files opened in binary mode, storage backends)
+# or strings (files opened in text mode, lists of lines in tests), so look
+# at the first line to see which it is, and then stick with that instead of
+# checking every line.
+def streamLines(f):
+    lines = iter(f)
+    first = next(lines, None)
+    if first is None:
+        return
+    lines = itertools.chain([first], lines)
+    if isinstance(first, str):
+        lines = (line.encode('utf-8') for line in lines)
+    for line in lines:
+        yield line.rstrip(b'\r\n')
+
+
+# This is readLines() for picking up partway through a file:  it gives back
+# (offset of the next line, line) for the lines from start on.  f has to be
+# a binary file that can seek, if it can't be memory mapped.
+def offsetLines(f, start=0):
+    try:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        f.seek(start)
+        offset = start
+        for line in f:
+            offset += len(line)
+            yield offset, line.rstrip(b'\r\n')
+        return
+    yield from mappedLines(mapped, start, offsets=True)
+
+
+# Turn a line back into something we can print or put in an error message.
+def lineText(line):
+    if isinstance(line, str):
+        return line
+    return str(line, 'utf-8', 'replace')
+
+
+# States can upload their files gzipped or zipped, since they shrink about
+# 10:1, and they are kept that way in storage.  This looks at the first few
+# bytes of a binary file to see if it is compressed, and if it is, gives back
+# a file that decompresses it as it is read, without ever writing out the
+# whole expanded file.  Otherwise it gives back f.  f has to be able to seek.
+#
+# Zip files have to have exactly one file in them.
+#
+# The decompressing file can seek (by decompressing up to the offset, or
+# starting over to go backwards), but has no fileno(), so readLines() and
+# offsetLines() read it as a stream instead of memory mapping the compressed
+# bytes underneath it.
+def decompressed(f):
+    start = f.read(len(ZIP_MAGIC))
+    f.seek(0)
+    if not isinstance(start, bytes):
+        return f
+    try:
+        if start.startswith(GZIP_MAGIC):
+            return io.BufferedReader(_DecompressedStream(gzip.GzipFile(fileobj=f, mode='rb')))
+        if start.startswith(ZIP_MAGIC):
+            archive = zipfile.ZipFile(f)
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            if len(members) != 1:
+                archive.close()
+                raise CompressedFileError('zip files need to have exactly one file in them, this one has {}'.format(len(members)))
+            return io.BufferedReader(_DecompressedStream(archive.open(members[0]), archive))
+    except (OSError, EOFError, zlib.error, zipfile.BadZipFile) as e:
+        raise CompressedFileError('could not decompress the file: {}'.format(e))
+    return f
+
+
+# This is the raw file under the one that decompressed() gives back.  Every
+# way that decompressing can go wrong turns into a CompressedFileError, so
+# that a corrupt upload doesn't look like a file that has gone missing (which
+# is an OSError too).
+class _DecompressedStream(io.RawIOBase):
+    def __init__(self, stream, archive=None):
+        self.stream = stream
+        self.archive = archive
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self.stream.seekable()
+
+    def readinto(self, b):
+        try:
+            return self.stream.readinto(b)
+        except (OSError, EOFError, zlib.error, zipfile.BadZipFile) as e:
+            raise CompressedFileError('could not decompress the file: {}'.format(e))
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        try:
+            return self.stream.seek(offset, whence)
+        except (OSError, EOFError, zlib.error, zipfile.BadZipFile) as e:
+            raise CompressedFileError('could not decompress the file: {}'.format(e))
+
+    def tell(self):
+        return self.stream.tell()
+
+    def close(self):
+        if not self.closed:
+            self.stream.close()
+            if self.archive is not None:
+                self.archive.close()
+        super().close()
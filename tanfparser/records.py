@@ -0,0 +1,112 @@
+import struct
+from tanfparser.layouts import recordlayouts
+from tanfparser.ssn import decryptSsn
+
+
+# A RecordType knows everything about one kind of line in a TANF file:
+#  prefix:      what the line starts with
+#  section:     where the records go in the tanf2json document
+#  layouts:     the compiled layouts that lines of this type can have
+#  ssnfields:   fields that need to be decrypted if the file is encrypted
+#
+# What happens to the records after they are parsed is up to whoever is
+# using this (the upload app stores them in the db, for instance).
+class RecordType:
+    def __init__(self, prefix, section, layouts, ssnfields=()):
+        self.prefix = prefix
+        self.bprefix = prefix.encode()
+        self.section = section
+        self.layouts = tuple(recordlayouts[layout] for layout in layouts)
+
+        # Some record types have variable layouts, and in our example data,
+        # not compliant with the spec.  A line gets the biggest layout that
+        # it is long enough for, so work that out for every length once, up
+        # to the biggest layout.  Anything longer gets the biggest layout.
+        bysize = sorted(self.layouts, key=lambda layout: layout.size)
+        self.biggest = bysize[-1]
+        self.maxsize = self.biggest.size
+        self.layoutsbylength = [None] * self.maxsize
+        for layout in bysize[:-1]:
+            for length in range(layout.size, self.maxsize):
+                self.layoutsbylength[length] = layout
+
+        self.ssnfields = ssnfields
+
+    def __repr__(self):
+        return '<RecordType {}>'.format(self.prefix)
+
+    # This finds the layout for a line that is length chars long.
+    def layoutFor(self, length):
+        if length >= self.maxsize:
+            return self.biggest
+        layout = self.layoutsbylength[length]
+        if layout is None:
+            raise struct.error('{} record is {} chars long, which is too short for any {} layout ({})'.format(
+                self.prefix, length, self.prefix, ', '.join('{}: {} chars'.format(layout.name, layout.size) for layout in self.layouts)))
+        return layout
+
+    def parse(self, line):
+        return self.layoutFor(len(line)).parse(line)
+
+    # The SSN fields are not all there in every layout, so skip missing ones.
+    def decrypt(self, data):
+        for field in self.ssnfields:
+            if field in data:
+                data[field] = decryptSsn(data[field])
+
+
+# This is the dispatch table for all the kinds of lines we know about.  To
+# add a new record type, add it here.  It is keyed by the first two
+# characters of each prefix, so figuring out what a line is is one dict
+# lookup.  The bytes versions of the keys are added below, so that lines that
+# are bytes or memoryviews can be looked up too.
+recordtypes = {rt.prefix[:2]: rt for rt in [
+    RecordType('HEADER', 'header', ['header']),
+    RecordType('T1', 'section1_familydata', ['section1_familydata']),
+    RecordType('T2', 'section1_adultdata', ['section1_adultdata'],
+               ssnfields=('socialsecuritynumber',)),
+    # This is the full spec with all the fields, then one that is truncated
+    # at 59 characters (should be 60) so seems to be for one child, then one
+    # that is truncated at 100 chars, for 2 children, it seems?
+    RecordType('T3', 'section1_childdata', ['section1_childdata', 'section1_childdata_exampledata', 'section1_childdata_twochild'],
+               ssnfields=('socialsecuritynumber_1', 'socialsecuritynumber_2')),
+    RecordType('T4', 'section2_closedcasedata', ['section2_closedcase']),
+    RecordType('T5', 'section2_closedpersondata', ['section2_closedperson'],
+               ssnfields=('socialsecuritynumber',)),
+    RecordType('T6', 'section3_aggregatedata', ['section3_aggregatedata']),
+    RecordType('T7', 'section4_familiesbystratumdata', ['section4_familiesbystratum']),
+    RecordType('TRAILER', 'trailer', ['trailer']),
+]}
+recordtypes.update({key.encode(): rt for key, rt in list(recordtypes.items())})
+
+
+# Lines of the same type in a file are almost always the same length, so
+# this remembers the layout that was picked for the last line of each type
+# and uses it again if the next line is the same length.  Make a new one of
+# these for each file.
+class LayoutCache:
+    def __init__(self):
+        self.detected = {}
+
+    def layoutFor(self, rt, line):
+        length = len(line)
+        cached = self.detected.get(rt.prefix)
+        if cached is not None and cached[0] == length:
+            return cached[1]
+        layout = rt.layoutFor(length)
+        self.detected[rt.prefix] = (length, layout)
+        return layout
+
+    def parse(self, rt, line):
+        return self.layoutFor(rt, line).parse(line)
+
+
+# This figures out what kind of record a line is, or None if we don't know.
+def getRecordType(line):
+    rt = recordtypes.get(line[:2])
+    if rt is None:
+        return None
+    prefix = rt.prefix if isinstance(line, str) else rt.bprefix
+    if line[:len(prefix)] == prefix:
+        return rt
+    return None
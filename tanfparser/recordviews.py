@@ -0,0 +1,149 @@
+import struct
+from tanfparser.errors import ErrorSink, UNKNOWN_RECORD, SHORT_LINE
+from tanfparser.reader import readLines, lineText
+from tanfparser.records import getRecordType, LayoutCache
+from tanfparser.ssn import decrypttable
+
+
+# A record view wraps the raw bytes of one line and only decodes a field when
+# somebody asks for it, so code that only looks at a few fields of each
+# record (previews, validation, counting things) doesn't pay for building a
+# dict of every field.  Fields that have been looked at are kept, so asking
+# again is free.
+#
+# There is a view class for every layout, made by recordView(), with a slot
+# for the line and a slot for each field, so a view is a lot smaller than a
+# dict of the same record.  Fields can be got as attributes or by name:
+#
+#   record.casenumber, record['casenumber']
+#
+# asDict() and asTuple() give back the whole record, decrypted if the file
+# was encrypted, just like layout.parse() and rt.decrypt() would.
+class RecordView:
+    __slots__ = ('_line', '_encrypted')
+    layout = None
+    fields = ()
+
+    def __init__(self, line, encrypted=False):
+        self.layout.checkSize(line)
+        self._line = bytes(line)
+        self._encrypted = encrypted
+
+    def __repr__(self):
+        return '<{} {!r}>'.format(type(self).__name__, self._line)
+
+    def __getitem__(self, field):
+        if field not in self._fieldset:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __eq__(self, other):
+        if isinstance(other, RecordView):
+            return self.layout is other.layout and self.asTuple() == other.asTuple()
+        return NotImplemented
+
+    def keys(self):
+        return self.fields
+
+    # It's one decode for the whole line instead of one per field, so this
+    # doesn't bother with the fields that have already been decoded.
+    def asTuple(self):
+        values = self.layout._slice(str(self._line, 'utf-8'))
+        if self._encrypted and self._ssnindexes:
+            values = list(values)
+            for i in self._ssnindexes:
+                values[i] = values[i].translate(decrypttable)
+            values = tuple(values)
+        return values
+
+    def asDict(self):
+        return dict(zip(self.fields, self.asTuple()))
+
+
+# This makes the property for a field.  The decoded value goes in the field's
+# slot the first time it is looked at.
+def _fieldProperty(field, fieldslice, cache, ssn):
+    def get(self):
+        try:
+            return cache.__get__(self)
+        except AttributeError:
+            value = str(self._line[fieldslice], 'utf-8')
+            if ssn and self._encrypted:
+                value = value.translate(decrypttable)
+            cache.__set__(self, value)
+            return value
+    return property(get, doc=field)
+
+
+_viewclasses = {}
+
+
+# This gives back the view class for a layout, making it the first time.
+# The ssns get decrypted by views of records after an encrypted header, so
+# there is a class for each set of ssnfields a layout is asked for with.
+def recordView(layout, ssnfields=()):
+    key = (layout.name, tuple(ssnfields))
+    viewclass = _viewclasses.get(key)
+    if viewclass is not None and viewclass.layout is layout:
+        return viewclass
+
+    cacheslots = tuple('_' + field for field in layout.fields)
+    name = ''.join(part.capitalize() for part in layout.name.split('_')) + 'View'
+    viewclass = type(name, (RecordView,), {
+        '__slots__': cacheslots,
+        'layout': layout,
+        'fields': layout.fields,
+        '_fieldset': frozenset(layout.fields),
+        '_ssnindexes': tuple(i for i, field in enumerate(layout.fields) if field in ssnfields),
+    })
+    for field, cacheslot in zip(layout.fields, cacheslots):
+        setattr(viewclass, field, _fieldProperty(field, layout.slices[field], viewclass.__dict__[cacheslot], field in ssnfields))
+    _viewclasses[key] = viewclass
+    return viewclass
+
+
+# This reads a TANF file and gives back (record type, view) for every record
+# in it, including the header and trailer.  The views for the records after
+# an encrypted header decrypt their ssns.  Lines that can't be parsed go to
+# errors, and a TANFParseError is raised at the end if there were any.
+def readRecords(f, errors=None):
+    if errors is None:
+        errors = ErrorSink()
+    layouts = LayoutCache()
+    viewclasses = {}
+    encrypted = False
+
+    try:
+        for lineno, line in enumerate(readLines(f), 1):
+            # skip blank lines
+            if not line:
+                continue
+
+            rt = getRecordType(line)
+            if rt is None:
+                errors.add(lineno, UNKNOWN_RECORD, lineText(line))
+                continue
+
+            try:
+                layout = layouts.layoutFor(rt, line)
+            except struct.error:
+                errors.add(lineno, SHORT_LINE, lineText(line))
+                continue
+
+            viewclass = viewclasses.get(layout)
+            if viewclass is None:
+                viewclass = viewclasses[layout] = recordView(layout, rt.ssnfields)
+            record = viewclass(line, encrypted)
+            if rt.section == 'header':
+                encrypted = record.encryptionindicator == 'E'
+            yield rt, record
+
+        errors.check()
+    finally:
+        errors.close()
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import numpy as np
+
+
+# This is the validation rule engine.  The edits for each record type are
+# written down as a list of rules (ranges, sets of allowed codes, conditions
+# between fields) instead of as python code that gets run on every record,
+# and a RuleSet checks a whole batch of records at once:  each rule is a
+# handful of numpy operations over the columns of the batch, no matter how
+# many records there are.
+#
+# Every rule has a short reason code like T1-03.  A RuleSet gives back the
+# codes of the rules that each record broke, which is what goes into
+# invalidreason.  The messages for the codes are in RuleSet.messages.
+#
+# Columns can be lists of the values that the upload app converts records
+# into (ints, strings with the padding stripped, dates, None for blank), or
+# numpy arrays of them.  This module needs numpy, so it isn't imported by
+# tanfparser itself.
+
+
+# This turns a column into a masked array, where blank values are masked.
+def column(values):
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind == 'S':
+            return np.ma.masked_array(values, mask=np.char.strip(values) == b'')
+        return np.ma.asarray(values)
+    mask = np.fromiter((value is None or value == '' for value in values), dtype=bool, count=len(values))
+    if all(type(value) is int for value in values if value is not None):
+        data = np.fromiter((0 if value is None else value for value in values), dtype=np.int64, count=len(values))
+    else:
+        data = np.empty(len(values), dtype=object)
+        data[:] = values
+    return np.ma.masked_array(data, mask=mask)
+
+
+# This gives back a column as numbers.  Text that isn't a number comes out
+# as -1, so that it is outside of every range.
+def numbers(col):
+    kind = col.dtype.kind
+    if kind in 'iu':
+        return col
+    data = [int(value) if value.isdecimal() else -1 for value in
+            (v.decode('utf-8', 'replace').strip() if kind == 'S' else str(v) for v in col.data)]
+    return np.ma.masked_array(np.array(data, dtype=np.int64), mask=np.ma.getmaskarray(col))
+
+
+# This turns the allowed values of a rule into whatever kind of thing is in
+# the column, so that rules can be written with numbers and still work on
+# the CharFields.
+def codesFor(col, values):
+    kind = col.dtype.kind
+    if kind in 'iu':
+        return [int(value) for value in values]
+    if kind == 'S':
+        return [str(value).encode() for value in values]
+    return [str(value) for value in values]
+
+
+# A Rule checks one thing about a record.  test() gives back a boolean array
+# that is True for the records that pass.  Blank fields pass every rule
+# except Required, since whether a field has to be filled in is a separate
+# question from what it can be filled in with.
+class Rule:
+    def __init__(self, field, code=None, message=''):
+        self.field = field
+        self.fields = (field,)
+        self.code = code
+        self.message = message
+
+    def __repr__(self):
+        return '<{} {} {}>'.format(type(self).__name__, self.code, self.field)
+
+    def test(self, columns):
+        col = columns[self.field]
+        return np.ma.getmaskarray(col) | self.testValues(col)
+
+
+class Required(Rule):
+    def test(self, columns):
+        return ~np.ma.getmaskarray(columns[self.field])
+
+
+class Range(Rule):
+    def __init__(self, field, low, high, code=None, message=''):
+        super().__init__(field, code, message or '{} must be between {} and {}'.format(field, low, high))
+        self.low = low
+        self.high = high
+
+    def testValues(self, col):
+        values = numbers(col).filled(self.low)
+        return (values >= self.low) & (values <= self.high)
+
+
+class OneOf(Rule):
+    def __init__(self, field, values, code=None, message=''):
+        super().__init__(field, code, message or '{} must be one of {}'.format(field, ', '.join(str(value) for value in values)))
+        self.values = tuple(values)
+
+    def testValues(self, col):
+        return np.isin(np.asarray(col.data), codesFor(col, self.values))
+
+
+# YYYYMM, like the reporting month.
+class YearMonth(Rule):
+    def __init__(self, field, code=None, message=''):
+        super().__init__(field, code, message or '{} must be a year and month (YYYYMM)'.format(field))
+
+    def testValues(self, col):
+        values = numbers(col).filled(190001)
+        months = values % 100
+        return (values >= 190001) & (months >= 1) & (months <= 12)
+
+
+# Conditions are what When() uses to decide which records a rule applies to.
+# Unlike rules, they are never true for blank fields.
+class Equals:
+    def __init__(self, field, *values):
+        self.fields = (field,)
+        self.field = field
+        self.values = values
+
+    def test(self, columns):
+        col = columns[self.field]
+        return ~np.ma.getmaskarray(col) & np.isin(np.asarray(col.data), codesFor(col, self.values))
+
+
+class Present:
+    def __init__(self, field):
+        self.fields = (field,)
+        self.field = field
+
+    def test(self, columns):
+        return ~np.ma.getmaskarray(columns[self.field])
+
+
+# This applies rule only to the records that match condition, like "if the
+# family doesn't get food stamps, the food stamp amount has to be 0".
+class When:
+    def __init__(self, condition, rule, message=''):
+        self.condition = condition
+        self.rule = rule
+        self.fields = condition.fields + rule.fields
+        self.code = rule.code
+        self.message = message or rule.message
+
+    def __repr__(self):
+        return '<When {} {}>'.format(self.code, self.fields)
+
+    def test(self, columns):
+        return ~self.condition.test(columns) | self.rule.test(columns)
+
+
+# A RuleSet is all of the rules for one record type.  More than one rule can
+# have the same code, when they are really the same check on different
+# fields (like all of the race flags), and a record only gets each code once.
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.codes = []
+        self.messages = {}
+        for rule in self.rules:
+            if rule.code is None:
+                raise ValueError('rule has no reason code: {!r}'.format(rule))
+            if rule.code not in self.messages:
+                self.codes.append(rule.code)
+                self.messages[rule.code] = rule.message
+        self.fields = tuple(sorted({field for rule in self.rules for field in rule.fields}))
+        self._codeindex = np.array([self.codes.index(rule.code) for rule in self.rules], dtype=np.intp)
+
+    def __repr__(self):
+        return '<RuleSet {} rules>'.format(len(self.rules))
+
+    # columns is a dict of field name to the column for that field.  Fields
+    # that aren't there (like the second child in a one child T3 layout) are
+    # blank.  This gives back a list with a tuple of reason codes for each
+    # record, which is empty if the record passed.
+    def check(self, columns, count):
+        prepared = {}
+        for field in self.fields:
+            if field in columns:
+                prepared[field] = column(columns[field])
+            else:
+                prepared[field] = np.ma.masked_array(np.zeros(count, dtype=np.int64), mask=True)
+
+        failed = np.zeros((len(self.codes), count), dtype=bool)
+        for rule, index in zip(self.rules, self._codeindex):
+            failed[index] |= ~rule.test(prepared)
+
+        reasons = [()] * count
+        codes = self.codes
+        for record in np.flatnonzero(failed.any(axis=0)):
+            reasons[record] = tuple(codes[index] for index in np.flatnonzero(failed[:, record]))
+        return reasons
+
+    # This checks records that are tuples of values in the order of fields.
+    def checkRecords(self, fields, records):
+        indexes = {field: i for i, field in enumerate(fields)}
+        columns = {field: [record[indexes[field]] for record in records] for field in self.fields if field in indexes}
+        return self.check(columns, len(records))
+
+
+# Each of the sanction/reduction flags in T1, and the race and benefit flags in
+# T2 and T3, are 1 for yes and 2 for no.
+def yesNo(fields, code):
+    return [OneOf(field, (1, 2), code, message='{} must be 1 (yes) or 2 (no)'.format(', '.join(fields))) for field in fields]
+
+
+##########################################################################
+# These are the edits for each record type, keyed by the record type prefix.
+# The codes are derived from the documentation under
+# https://www.acf.hhs.gov/ofa/resource/tanfedit/index
+
+# T1 records
+section1_familydata_rules = RuleSet([
+    YearMonth('reportingmonth', 'T1-01'),
+    Required('casenumber', 'T1-02', 'casenumber is required'),
+    OneOf('fundingstream', (1, 2), 'T1-03'),
+    OneOf('disposition', (1, 2), 'T1-04'),
+    OneOf('newapplicant', (1, 2), 'T1-05'),
+    Range('numfamilymembers', 1, 99, 'T1-06'),
+    OneOf('typeoffamilyforworkparticipation', (0, 1, 2, 3), 'T1-07'),
+    OneOf('receivessubsidizedhousing', (1, 2, 3), 'T1-08'),
+    OneOf('receivesmedicalassistance', (1, 2), 'T1-09'),
+    OneOf('receivesfoodstamps', (1, 2), 'T1-10'),
+    When(Equals('receivesfoodstamps', 2), Range('amtoffoodstampassistance', 0, 0, 'T1-11'),
+         'amtoffoodstampassistance must be 0 if receivesfoodstamps is 2 (no)'),
+    OneOf('receivessubsidizedchildcare', (1, 2, 3), 'T1-12'),
+    When(Equals('receivessubsidizedchildcare', 3), Range('amtofsubsidizedchildcare', 0, 0, 'T1-13'),
+         'amtofsubsidizedchildcare must be 0 if receivessubsidizedchildcare is 3 (no)'),
+    *yesNo(['workrequirementssanction', 'familysanctionforadultnohsdiploma', 'sanctionforteenparentnotattendingschool',
+            'noncooperatewithchildsupport', 'failuretocomploywithirp', 'othersanction', 'familycap',
+            'reductionbasedonlengthofreceiptofassistance', 'othernonsanction'], 'T1-14'),
+    OneOf('tanffamilynewchildonlyfamily', (1, 2), 'T1-15'),
+])
+
+# T2 records
+section1_adultdata_rules = RuleSet([
+    YearMonth('reportingmonth', 'T2-01'),
+    Required('casenumber', 'T2-02', 'casenumber is required'),
+    OneOf('familyafilliation', (1, 2, 3, 5), 'T2-03'),
+    OneOf('noncustodialparent', (1, 2), 'T2-04'),
+    Required('dateofbirth', 'T2-05', 'dateofbirth is required'),
+    When(Equals('familyafilliation', 1), Required('socialsecuritynumber', 'T2-06'),
+         'socialsecuritynumber is required if familyafilliation is 1'),
+    *yesNo(['racehispanic', 'racenativeamerican', 'raceasian', 'raceblack', 'racewhite'], 'T2-07'),
+    OneOf('gender', (1, 2), 'T2-08'),
+    *yesNo(['oasdibenefits', 'nonssabenefits', 'titlexivapdtbenefits', 'titlexviaabdbenefits', 'titlexvissibenefits'], 'T2-09'),
+    Range('maritalstatus', 1, 5, 'T2-10'),
+    Range('relationshiptohh', 1, 10, 'T2-11'),
+])
+
+# T3 records
+section1_childdata_rules = RuleSet([
+    YearMonth('reportingmonth', 'T3-01'),
+    Required('casenumber', 'T3-02', 'casenumber is required'),
+    OneOf('familyafilliation_1', (1, 2, 4), 'T3-03'),
+    Required('dateofbirth_1', 'T3-04', 'dateofbirth_1 is required'),
+    *yesNo(['racehispanic_1', 'racenativeamerican_1', 'raceasian_1', 'raceblack_1', 'racepacific_1', 'racewhite_1'], 'T3-05'),
+    OneOf('gender_1', (1, 2), 'T3-06'),
+    When(Present('familyafilliation_2'), Required('dateofbirth_2', 'T3-07'),
+         'dateofbirth_2 is required if there is a second child'),
+    OneOf('gender_2', (1, 2), 'T3-08'),
+])
+
+recordrules = {
+    'T1': section1_familydata_rules,
+    'T2': section1_adultdata_rules,
+    'T3': section1_childdata_rules,
+}
+
+
+# This changes whenever any of the rules do, so that anything that was
+# worked out with older rules (like the parse cache in the upload app) can
+# tell that it is out of date.  Only what the rules are made with goes into
+# it, so changing how a kind of rule works needs the version of whatever
+# depends on it bumped by hand.
+def rulesVersion(rules=None):
+    rules = recordrules if rules is None else rules
+    definitions = [[prefix, [ruleDefinition(rule) for rule in ruleset.rules]] for prefix, ruleset in sorted(rules.items())]
+    return hashlib.sha1(json.dumps(definitions).encode()).hexdigest()[:16]
+
+
+def ruleDefinition(rule):
+    return [type(rule).__name__, {name: ruleDefinition(value) if hasattr(value, 'test') else value
+                                  for name, value in sorted(vars(rule).items())}]
+
+
+RULES_VERSION = rulesVersion()
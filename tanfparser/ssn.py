@@ -0,0 +1,50 @@
+# This is the simple subtitution cipher
+encryptmap = {
+    '1': '@',
+    '2': '9',
+    '3': 'Z',
+    '4': 'P',
+    '5': '0',
+    '6': '#',
+    '7': 'Y',
+    '8': 'B',
+    '9': 'W',
+    '0': 'T',
+}
+decryptmap = {}
+for k, v in encryptmap.items():
+    decryptmap[v] = k
+
+# These are translation tables for the cipher, so that decrypting is one
+# str.translate() or bytes.translate() call.  Anything that isn't in the
+# cipher is left alone.
+decrypttable = str.maketrans(decryptmap)
+encrypttable = str.maketrans(encryptmap)
+decryptbytestable = bytes.maketrans(''.join(decryptmap.keys()).encode(), ''.join(decryptmap.values()).encode())
+
+
+# This decrypts the ssn using the silly substitution cipher
+def decryptSsn(ssn):
+    # # Put dashes into SSN
+    # if len(result) == 9:
+    #   result = result[:5] + '-' + result[5:]
+    #   result = result[:3] + '-' + result[3:]
+    if isinstance(ssn, str):
+        return ssn.translate(decrypttable)
+    return bytes(ssn).translate(decryptbytestable)
+
+
+# This puts a decrypted ssn back the way it is in an encrypted file, for
+# anything that keeps ssns around after the file has been parsed.
+def encryptSsn(ssn):
+    return ssn.translate(encrypttable)
+
+
+# This decrypts a whole list of ssns at once.  They are glued together so
+# that the whole column is translated in one go, and then split up again.
+def decryptSsns(ssns):
+    if len(ssns) == 0:
+        return []
+    if isinstance(ssns[0], str):
+        return '\n'.join(ssns).translate(decrypttable).split('\n')
+    return b'\n'.join(ssns).translate(decryptbytestable).split(b'\n')
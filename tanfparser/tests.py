@@ -0,0 +1,573 @@
+import datetime
+import gzip
+import io
+import json
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+import zipfile
+from contextlib import redirect_stdout
+from unittest import mock
+from tanfparser import recordlayouts, getRecordType, LayoutCache, parseFields, encryptSsn, decryptSsn, decryptSsns
+from tanfparser import readLines, streamLines, parseDate, parseDateBytes, parseText, tanf2json, tanf2jsonStream
+from tanfparser import readRecords, recordView, offsetLines, preflight, preview, decompressed, CompressedFileError, CaseIndex, caseKey
+from tanfparser.layouts import section1_familydata_fields, section1_childdata_fields
+from tanfparser.__main__ import main
+from tanfparser.errors import ErrorSink, TANFParseError
+from tanfparser.records import recordtypes
+from tanfparser.pipeline import Pipeline, Sink, NullSink, scanRecords, splitStage, DecryptStage
+from tanfparser.duplicates import KeySet, BloomFilter, DuplicateCheck
+from tanfparser.rules import RuleSet, Range, OneOf, YearMonth, Required, When, Equals, recordrules
+
+# These don't need django or the db, so they are plain unittest tests.
+
+testdata = 'upload/fixtures/testdata.txt'
+
+
+class CheckParser(unittest.TestCase):
+    def setUp(self):
+        with open(testdata) as f:
+            self.lines = [line.rstrip() for line in f]
+
+    def test_layouts_compiled(self):
+        """every record type definition has a compiled layout of the right size"""
+        layout = recordlayouts['section1_familydata']
+        self.assertEqual(layout.fields, tuple(section1_familydata_fields.keys()))
+        self.assertEqual(layout.size, sum(section1_familydata_fields.values()))
+
+    def test_parsefields(self):
+        """parseFields slices a line up into a dict of strings"""
+        data = parseFields(section1_familydata_fields, self.lines[1])
+        self.assertEqual(list(data.keys()), list(section1_familydata_fields.keys()))
+        self.assertEqual(data['recordtype'], 'T1')
+        self.assertEqual(data['reportingmonth'], '201901')
+        self.assertEqual(data['casenumber'], '11223341658')
+        self.assertEqual(data['zipcode'], '97365')
+        self.assertEqual(data['tanffamilynewchildonlyfamily'], '2')
+
+    def test_parsefields_short_line(self):
+        """lines that are too short for a layout raise struct.error like they always have"""
+        with self.assertRaises(struct.error):
+            parseFields(section1_childdata_fields, self.lines[3])
+
+    def test_parsefields_custom(self):
+        """field dicts that are not registered still get parsed"""
+        self.assertEqual(parseFields({'a': 2, 'skip': -1, 'b': 3}, 'abcdef'), {'a': 'ab', 'b': 'def'})
+
+    def test_readlines(self):
+        """mapped files and plain streams give back the same lines"""
+        with open(testdata, 'rb') as f:
+            mapped = [bytes(line) for line in readLines(f)]
+            f.seek(0)
+            streamed = list(readLines(iter(f)))
+        self.assertEqual(mapped, streamed)
+        self.assertEqual(mapped[0], b'HEADER20191A41   TAN1 N')
+        self.assertEqual(list(readLines(['T1abc\r\n', 'T2def'])), [b'T1abc', b'T2def'])
+
+    def test_offsetlines(self):
+        """offsetLines gives back where the next line starts, mapped or not, from anywhere in the file"""
+        with open(testdata, 'rb') as f:
+            data = f.read()
+            f.seek(0)
+            mapped = [(offset, bytes(line)) for offset, line in offsetLines(f)]
+            self.assertEqual(list(offsetLines(io.BytesIO(data))), mapped)
+            self.assertEqual([offset for offset, line in mapped], [data.index(b'\n', offset) + 1 for offset in [0] + [o for o, l in mapped[:-1]]])
+            offset = mapped[1][0]
+            self.assertEqual([(o, bytes(line)) for o, line in offsetLines(f, offset)], mapped[2:])
+            self.assertEqual(list(offsetLines(io.BytesIO(data), offset)), mapped[2:])
+
+    def test_decompressed(self):
+        """gzipped and zipped files are read as if they weren't compressed, and anything else is left alone"""
+        with open(testdata, 'rb') as f:
+            data = f.read()
+            self.assertIs(decompressed(f), f)
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('testdata.txt', data)
+
+        with tempfile.TemporaryFile() as compressed:
+            compressed.write(gzip.compress(data))
+            for original in [compressed, io.BytesIO(archive.getvalue())]:
+                original.seek(0)
+                with decompressed(original) as f:
+                    self.assertEqual([bytes(line) for line in readLines(f)], data.splitlines())
+                    f.seek(0)
+                    offset = data.index(b'\n') + 1
+                    self.assertEqual(list(offsetLines(f, offset)), list(offsetLines(io.BytesIO(data), offset)))
+
+    def test_decompressed_errors(self):
+        """compressed files that are broken or have the wrong number of files in them can't be read"""
+        with open(testdata, 'rb') as f:
+            data = f.read()
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as z:
+            z.writestr('one.txt', data)
+            z.writestr('two.txt', data)
+        archive.seek(0)
+        with self.assertRaises(CompressedFileError):
+            decompressed(archive)
+        with self.assertRaises(CompressedFileError):
+            decompressed(io.BytesIO(gzip.compress(data)[:-20])).read()
+        with self.assertRaises(CompressedFileError):
+            decompressed(io.BytesIO(b'PK\x03\x04 this is not a zip file'))
+
+    def test_decryptssn_passthrough(self):
+        """characters that are not in the cipher are left alone, both ways"""
+        self.assertEqual(decryptSsn('@9Z P0#-YBWT'), '123 456-7890')
+        self.assertEqual(encryptSsn('123 456-7890'), '@9Z P0#-YBWT')
+        self.assertEqual(decryptSsn(b'@9Z    '), b'123    ')
+        self.assertEqual(decryptSsns([]), [])
+
+    def test_layout_by_length(self):
+        """T3 records get the biggest layout they are long enough for"""
+        t3 = getRecordType('T3')
+        self.assertEqual(t3.layoutFor(59).name, 'section1_childdata_exampledata')
+        self.assertEqual(t3.layoutFor(99).name, 'section1_childdata_exampledata')
+        self.assertEqual(t3.layoutFor(100).name, 'section1_childdata_twochild')
+        self.assertEqual(t3.layoutFor(228).name, 'section1_childdata')
+        self.assertEqual(t3.layoutFor(1000).name, 'section1_childdata')
+        with self.assertRaisesRegex(struct.error, 'T3 record is 58 chars long'):
+            t3.layoutFor(58)
+
+    def test_layout_cache(self):
+        """the layout cache gives the same answers as looking the layout up every time"""
+        t3 = getRecordType('T3')
+        cache = LayoutCache()
+        for line in [self.lines[3], self.lines[3] + ' ' * 41, self.lines[3]]:
+            self.assertEqual(cache.parse(t3, line), t3.parse(line))
+        self.assertEqual(cache.detected['T3'][1].name, 'section1_childdata_exampledata')
+
+    def test_parsedate(self):
+        """dates are parsed straight out of the field, and bad ones are None"""
+        self.assertEqual(parseDate('19730704'), datetime.date(1973, 7, 4))
+        self.assertEqual(parseDate('20000229'), datetime.date(2000, 2, 29))
+        self.assertIsNone(parseDate('19000229'))
+        self.assertIsNone(parseDate('19731304'))
+        self.assertIsNone(parseDate('        '))
+        self.assertIsNone(parseDate('1973070'))
+        self.assertIsNone(parseDate('1973-7-4'))
+        self.assertEqual(parseDateBytes(b'19730704'), datetime.date(1973, 7, 4))
+        self.assertIsNone(parseDateBytes(b'19731304'))
+        self.assertIsNone(parseDateBytes(b'        '))
+
+    def test_unpackbytes(self):
+        """unpackBytes cuts the same fields out of bytes lines that unpack does out of strings"""
+        layout = recordlayouts['section1_familydata']
+        line = self.lines[1]
+        self.assertEqual(layout.unpackBytes(memoryview(line.encode())), tuple(field.encode() for field in layout.unpack(line)))
+        with self.assertRaises(struct.error):
+            recordlayouts['section1_childdata'].unpackBytes(self.lines[3].encode())
+        self.assertEqual(parseText(b'  abc '), 'abc')
+        self.assertEqual(parseText(b'     '), '')
+
+    def test_streamlines(self):
+        """streams of strings and streams of bytes give back the same lines"""
+        self.assertEqual(list(streamLines(['T1abc\r\n', 'T2def'])), [b'T1abc', b'T2def'])
+        self.assertEqual(list(streamLines([b'T1abc\r\n', b'T2def'])), [b'T1abc', b'T2def'])
+        self.assertEqual(list(streamLines([])), [])
+
+    def test_recordviews(self):
+        """record views decode fields when they are looked at and match what parse gives back"""
+        records = list(readRecords(self.lines))
+        self.assertEqual([rt.prefix for rt, record in records], ['HEADER', 'T1', 'T2', 'T3', 'TRAILER'])
+        for rt, record in records:
+            line = record._line.decode()
+            self.assertEqual(record.asDict(), rt.parse(line))
+            self.assertEqual(list(record.keys()), list(rt.parse(line).keys()))
+            self.assertFalse(hasattr(record, '__dict__'))
+
+        rt, record = records[1]
+        with self.assertRaises(AttributeError):
+            record._casenumber
+        self.assertEqual(record.casenumber, rt.parse(self.lines[1])['casenumber'])
+        self.assertEqual(record['casenumber'], record.casenumber)
+        self.assertIs(record._casenumber, record.casenumber)
+        with self.assertRaises(KeyError):
+            record['nosuchfield']
+        self.assertIs(type(record), recordView(record.layout, rt.ssnfields))
+
+        with self.assertRaises(struct.error):
+            type(records[3][1])(b'T3')
+
+    def test_recordviews_encrypted(self):
+        """record views after an encrypted header decrypt their ssns"""
+        header = self.lines[0]
+        lines = [header[:21] + 'E' + header[22:]] + self.lines[1:]
+        plain = dict(readRecords(self.lines))
+        encrypted = dict(readRecords(lines))
+        for rt in plain:
+            for field in rt.ssnfields:
+                if field in plain[rt].fields:
+                    self.assertEqual(encrypted[rt][field], decryptSsn(plain[rt][field]))
+                    self.assertEqual(encrypted[rt].asDict()[field], decryptSsn(plain[rt][field]))
+        self.assertNotEqual(plain[recordtypes['T2']], encrypted[recordtypes['T2']])
+
+        # whoever asks for a view class first doesn't decide whether it decrypts
+        layout = recordtypes['T2'].layouts[0]
+        self.assertEqual(recordView(layout)._ssnindexes, ())
+        self.assertNotEqual(recordView(layout, recordtypes['T2'].ssnfields)._ssnindexes, ())
+
+    def test_dispatch(self):
+        """record types are looked up by their prefix"""
+        self.assertEqual(getRecordType('T7whatever').prefix, 'T7')
+        self.assertEqual(getRecordType('TRAILER0000001').prefix, 'TRAILER')
+        self.assertIsNone(getRecordType('HEADLESS'))
+        self.assertIsNone(getRecordType('T9'))
+
+    def test_no_django(self):
+        """the parser can be used without loading django"""
+        modules = subprocess.check_output([sys.executable, '-c', 'import sys, tanfparser; print(" ".join(sys.modules))'])
+        self.assertNotIn(b'django', modules.split())
+        self.assertNotIn(b'numpy', modules.split())
+
+
+class CheckJson(unittest.TestCase):
+    def test_tanf2json(self):
+        """tanf2json puts each kind of record into its section"""
+        with open(testdata, 'rb') as f:
+            tanfdata = json.loads(tanf2json(f))
+        self.assertEqual(tanfdata['header']['calendarquarter'], '20191')
+        self.assertEqual(len(tanfdata['section1_familydata']), 1)
+        self.assertEqual(len(tanfdata['section1_adultdata']), 1)
+        self.assertEqual(tanfdata['section1_childdata'][0]['casenumber'], '11223341658')
+        self.assertEqual(tanfdata['trailer']['title'], 'TRAILER')
+
+    def test_tanf2json_ndjson(self):
+        """tanf2jsonStream can write one record per line"""
+        out = io.StringIO()
+        with open(testdata, 'rb') as f:
+            tanf2jsonStream(f, out, ndjson=True)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r['section'] for r in records], ['header', 'section1_familydata', 'section1_adultdata', 'section1_childdata', 'trailer'])
+        self.assertEqual(records[1]['record']['zipcode'], '97365')
+
+    def test_tanf2json_memory(self):
+        """tanf2jsonStream uses about the same memory no matter how big the file is"""
+        with open(testdata, 'rb') as f:
+            header, t1, t2, t3, trailer = f.readlines()
+
+        def lines(count):
+            yield header
+            for i in range(count):
+                yield t1
+                yield t2
+                yield t3
+            yield trailer
+
+        class CountingSink:
+            written = 0
+
+            def write(self, s):
+                self.written += len(s)
+
+        def peakmemory(count, ndjson):
+            sink = CountingSink()
+            tracemalloc.start()
+            try:
+                tanf2jsonStream(lines(count), sink, ndjson=ndjson)
+                return tracemalloc.get_traced_memory()[1], sink.written
+            finally:
+                tracemalloc.stop()
+
+        with mock.patch('tanfparser.tojson.JSON_SPOOL_SIZE', 64 * 1024):
+            for ndjson in (False, True):
+                smallpeak, smallsize = peakmemory(200, ndjson)
+                bigpeak, bigsize = peakmemory(2000, ndjson)
+                self.assertGreater(bigsize, smallsize * 9)
+                self.assertLess(bigpeak, smallpeak * 1.5)
+
+    def test_tanf2json_errors(self):
+        """bad lines are counted and the first ones are kept, and the rest are spilled"""
+        spill = io.StringIO()
+        spill.close = lambda: None
+        errors = ErrorSink(keep=2, threshold=None, spill=lambda: spill)
+        lines = [b'HEADER20191A41   TAN1 N\n'] + [b'X%d\n' % i for i in range(5)] + [b'T1short\n']
+        with self.assertRaises(TANFParseError) as cm:
+            tanf2json(lines)
+        with self.assertRaises(TANFParseError) as cm:
+            tanf2jsonStream(lines, io.StringIO(), errors=errors)
+        self.assertEqual(cm.exception.counts, {'unknown record type': 5, 'line too short': 1})
+        self.assertEqual(cm.exception.lines, [(2, 'unknown record type', 'X0'), (3, 'unknown record type', 'X1')])
+        self.assertEqual(spill.getvalue().splitlines()[0], '4\tunknown record type\tX2')
+        self.assertEqual(cm.exception.spilled, 4)
+        self.assertFalse(cm.exception.aborted)
+
+        # the errors can be carried over to somebody who picks up where this left off
+        restored = ErrorSink()
+        restored.restore(json.loads(json.dumps(errors.state())))
+        self.assertEqual(TANFParseError(restored).summary(), cm.exception.summary())
+
+    def test_main(self):
+        """the command line tool prints the same json as tanf2json"""
+        out = io.StringIO()
+        with redirect_stdout(out):
+            main([testdata])
+        with open(testdata, 'rb') as f:
+            self.assertEqual(out.getvalue(), tanf2json(f) + '\n')
+
+
+class CheckPreflight(unittest.TestCase):
+    def setUp(self):
+        with open(testdata, 'rb') as f:
+            self.header, self.t1, self.t2, self.t3, self.trailer = f.readlines()
+
+    def problems(self, data):
+        with self.assertRaises(TANFParseError) as cm:
+            preflight(io.BytesIO(data))
+        return [(lineno, kind) for lineno, kind, line in cm.exception.lines]
+
+    def test_preflight(self):
+        """good files get through preflight, a block at a time or all at once"""
+        with open(testdata, 'rb') as f:
+            data = f.read()
+        expected = {'HEADER': 1, 'T1': 1, 'T2': 1, 'T3': 1, 'TRAILER': 1}
+        for blocksize in [1, 7, 100, 1024 * 1024]:
+            with mock.patch('tanfparser.preflight.PREFLIGHT_BLOCK_SIZE', blocksize):
+                info = preflight(io.BytesIO(data))
+            self.assertEqual(info['counts'], expected)
+            self.assertEqual(info['lines'], 5)
+            self.assertEqual(info['header']['calendarquarter'], '20191')
+            self.assertEqual(info['trailer']['numrecords'], '0000003')
+        self.assertEqual(preflight(io.BytesIO(data.rstrip()))['counts'], expected)
+        self.assertEqual(preflight(io.StringIO(data.decode()))['counts'], expected)
+        self.assertEqual(preflight(io.BytesIO(data.replace(b'\r\n', b'\n\r\n')))['lines'], 10)
+
+    def test_preflight_problems(self):
+        """preflight finds bad lines and headers and trailers that are missing or in the wrong place"""
+        trailer = b'TRAILER0000004         \r\n'
+        self.assertEqual(self.problems(self.header + self.t1 + b'T9 what\r\n' + self.t3[:40] + b'\r\n' + self.t2 + trailer),
+                         [(3, 'unknown record type'), (4, 'line too short'), (6, 'trailer count does not match')])
+        self.assertEqual(self.problems(self.t1 + self.t2 + self.t3 + self.trailer), [(1, 'no header')])
+        self.assertEqual(self.problems(self.header + self.t1 + self.t2 + self.t3), [(4, 'no trailer')])
+        self.assertEqual(self.problems(self.t1 + self.header + self.t2 + self.t3 + self.trailer),
+                         [(2, 'header or trailer in the wrong place')])
+        self.assertEqual(self.problems(self.header + self.t1 + self.trailer + self.t2 + self.t3),
+                         [(3, 'header or trailer in the wrong place')])
+        self.assertEqual(self.problems(b'HEADLESS\r\n' + self.t1 + self.t2 + self.t3 + self.trailer),
+                         [(1, 'unknown record type'), (1, 'no header')])
+
+    def test_preview(self):
+        """the preview has the first records of each type, and the problems instead of raising them"""
+        data = self.header + (self.t1 + self.t2) * 20 + self.t3 + self.trailer[:7] + b'0000041' + self.trailer[14:]
+        info = preview(io.BytesIO(data), 3)
+        self.assertEqual(info['counts'], {'HEADER': 1, 'T1': 20, 'T2': 20, 'T3': 1, 'TRAILER': 1})
+        self.assertEqual(info['header']['calendarquarter'], '20191')
+        self.assertEqual({prefix: len(records) for prefix, records in info['records'].items()}, {'T1': 3, 'T2': 3, 'T3': 1})
+        self.assertEqual(info['records']['T2'][0].socialsecuritynumber, '987644682')
+        self.assertEqual((info['problems'], info['problemcount']), ([], 0))
+
+        info = preview(io.BytesIO(data.replace(self.t3, b'T9 what is this\r\n')))
+        self.assertEqual(info['problems'], [(42, 'unknown record type', 'T9 what is this'), (43, 'trailer count does not match', 'trailer says 0000041, but there are 40 records')])
+        self.assertEqual(info['records']['T1'][4].casenumber, '11223341658')
+
+        # it stops reading once it has enough
+        f = io.BytesIO(self.header + (self.t1 + self.t2) * 20 + b'T9' * 10000000)
+        with mock.patch('tanfparser.preflight.preflight', return_value={'counts': {'T1': 20, 'T2': 20}}):
+            info = preview(f, 2)
+        self.assertEqual(len(info['records']['T2']), 2)
+        self.assertLess(f.tell(), 10000000)
+
+
+class CheckPipeline(unittest.TestCase):
+    def test_pipeline(self):
+        """the stages run in order over every batch, with or without threads"""
+        for queuesize in [0, 1, 3]:
+            pipeline = Pipeline(range(95), [lambda batch: [n * 2 for n in batch], lambda batch: [n + 1 for n in batch if n % 3]],
+                                ListSink(), batchsize=10, queuesize=queuesize)
+            self.assertEqual(pipeline.run(), [n * 2 + 1 for n in range(95) if n * 2 % 3])
+
+    def test_pipeline_backpressure(self):
+        """a slow sink holds up the source, so only a few batches are ever in flight"""
+        produced = []
+
+        def source():
+            for n in range(1000):
+                produced.append(n)
+                yield n
+
+        class SlowSink(NullSink):
+            ahead = 0
+
+            def write(self, batch):
+                time.sleep(0.001)
+                super().write(batch)
+                self.ahead = max(self.ahead, len(produced) - self.count)
+
+        sink = SlowSink()
+        self.assertEqual(Pipeline(source(), [list, list], sink, batchsize=10, queuesize=2).run(), 1000)
+        # 3 queues of 2 batches, a batch in each of the 3 threads, and the
+        # one that the source is part way through
+        self.assertLessEqual(sink.ahead, (3 * 2 + 3 + 1) * 10)
+
+    def test_pipeline_errors(self):
+        """anything that goes wrong in a stage is raised by run(), and the sink and threads get closed"""
+        def broken(batch):
+            if 50 in batch:
+                raise ValueError('no fifties')
+            return batch
+
+        threads = threading.active_count()
+        for queuesize in [0, 2]:
+            sink = ListSink()
+            with self.assertRaises(ValueError):
+                Pipeline(range(100), [broken], sink, batchsize=10, queuesize=queuesize).run()
+            self.assertTrue(sink.closed)
+            self.assertEqual(sink.records, list(range(50)))
+            self.assertEqual(threading.active_count(), threads)
+
+    def test_pipeline_records(self):
+        """splitting and decrypting records gives the same values as parsing the lines"""
+        with open(testdata, 'rb') as f:
+            lines = [line.rstrip(b'\r\n') for line in f]
+        sink = ListSink()
+        Pipeline(scanRecords(lines), [splitStage, DecryptStage()], sink).run()
+        self.assertEqual([record.asDict() for record in sink.records],
+                         [record.asDict() for rt, record in readRecords(lines)])
+        self.assertEqual([record.lineno for record in sink.records], [1, 2, 3, 4, 5])
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.records = []
+        self.closed = False
+
+    def write(self, batch):
+        self.records.extend(batch)
+
+    def finish(self):
+        return self.records
+
+    def close(self):
+        self.closed = True
+
+
+class CheckCaseIndex(unittest.TestCase):
+    def test_casekey(self):
+        """padded values from the file and stripped ones from the db give the same key"""
+        self.assertEqual(caseKey('201901', '11223341658 '), caseKey(201901, '11223341658'))
+        self.assertNotEqual(caseKey('201901', '1122334165'), caseKey('20190', '11223341658'))
+
+    def test_orphans(self):
+        """adults and children are orphans when there is no family in the same month"""
+        with open(testdata, 'rb') as f:
+            records = splitStage(list(scanRecords(readLines(f))))
+        index = CaseIndex()
+        for record in records:
+            index.add(record.rt.prefix, record.fields, record.values)
+        self.assertEqual((len(index.families), len(index.members['T2']), len(index.members['T3'])), (1, 1, 1))
+        self.assertEqual(index.orphans(), {})
+
+        index = CaseIndex()
+        fields = ('reportingmonth', 'casenumber')
+        index.add('T1', fields, ('201901', '1'))
+        index.add('T2', fields, ('201901', '1'))
+        index.add('T2', fields, ('201902', '1'))
+        index.add('T3', fields, ('201901', '2'))
+        index.add('T3', fields, ('201901', '  '))
+        index.add('T4', fields, ('201901', '3'))
+        orphans = index.orphans()
+        self.assertEqual(orphans['T2'].tolist(), [caseKey('201902', '1')])
+        self.assertEqual(orphans['T3'].tolist(), [caseKey('201901', '2')])
+
+    def test_unknown_closed(self):
+        """closed people are unknown unless they are an adult or child with the same casenumber"""
+        index = CaseIndex()
+        index.add('T2', ('reportingmonth', 'casenumber', 'socialsecuritynumber'), ('201901', '1', '111'))
+        index.add('T3', ('reportingmonth', 'casenumber', 'socialsecuritynumber_1', 'socialsecuritynumber_2'), ('201901', '1', '222', ''))
+        fields = ('reportingmonth', 'casenumber', 'socialsecuritynumber')
+        for casenumber, ssn in [('1', '111'), ('1', '222'), ('2', '111'), ('1', ''), ('1', '222')]:
+            index.add('T5', fields, ('201903', casenumber, ssn))
+        self.assertEqual(sorted(index.unknownClosed().tolist()), sorted([caseKey('2', '111'), caseKey('1', '')]))
+
+
+class CheckDuplicates(unittest.TestCase):
+    def test_keyset(self):
+        """a KeySet knows every key that went in it, however big it gets"""
+        for seen in [KeySet(), BloomFilter(20000)]:
+            keys = [caseKey(i) for i in range(20000)] + [0, 1]
+            self.assertFalse(any(seen.add(key) for key in keys[:-1]))
+            self.assertTrue(all(seen.add(key) for key in keys))
+            self.assertEqual(len(seen), 20001)
+        self.assertLess(len(seen.bits), 4 * 20000)
+
+    def test_bloomfilter(self):
+        """a BloomFilter almost never says it has seen a key that it hasn't"""
+        seen = BloomFilter(40000, errorrate=0.01)
+        for i in range(20000):
+            seen.add(caseKey(i))
+        mistakes = sum(seen.add(caseKey('other', i)) for i in range(10000))
+        mistakes += sum(seen.addMany([caseKey('more', i) for i in range(10000)]))
+        self.assertLess(mistakes, 400)
+
+    def test_duplicatecheck(self):
+        """records are duplicates when their case, month and people are the same"""
+        family = ('reportingmonth', 'casenumber', 'countyfipscode')
+        adult = ('reportingmonth', 'casenumber', 'socialsecuritynumber')
+        child = ('reportingmonth', 'casenumber', 'socialsecuritynumber_1')
+        children = ('reportingmonth', 'casenumber', 'socialsecuritynumber_1', 'socialsecuritynumber_2')
+        records = [
+            ('T1', family, ('201901', '1', '41')),
+            ('T1', family, ('201901', '1 ', '99')),
+            ('T1', family, ('201902', '1', '41')),
+            ('T1', family, ('201902', '  ', '41')),
+            ('T1', family, ('201902', '  ', '41')),
+            ('T2', adult, ('201901', '1', '123456789')),
+            ('T2', adult, ('201901', '1', '987654321')),
+            ('T2', adult, ('201901', '1', '123456789')),
+            ('T2', adult, ('201901', '1', '         ')),
+            ('T2', adult, ('201901', '1', '         ')),
+            ('T3', child, ('201901', '1', '123456789')),
+            ('T3', children, ('201901', '1', '123456789', None)),
+            ('T3', children, ('201901', '1', '123456789', '987654321')),
+            ('T4', family, ('201901', '1', '41')),
+        ]
+        expected = [None, 'T1-16', None, None, None, None, None, 'T2-13', None, None, None, 'T3-10', None, None]
+        for seen in [KeySet, lambda: BloomFilter(100)]:
+            check = DuplicateCheck(seen())
+            self.assertEqual([check.add(*record) for record in records], expected)
+            check = DuplicateCheck(seen())
+            self.assertEqual(check.addMany(records[:4]) + check.addMany(records[4:]), expected)
+            self.assertEqual(len(check.seen), 6)
+
+
+class CheckRules(unittest.TestCase):
+    def test_rules(self):
+        """each kind of rule passes and fails the right records, and blanks pass"""
+        columns = {
+            'a': [1, 2, 3, None],
+            'b': ['1', '7', '', '2'],
+            'c': [201901, 201913, None, 189912],
+        }
+        rules = RuleSet([
+            Range('a', 1, 2, 'X-01'),
+            OneOf('b', (1, 2), 'X-02'),
+            YearMonth('c', 'X-03'),
+            Required('a', 'X-04'),
+            When(Equals('b', 2), Required('c', 'X-05')),
+        ])
+        self.assertEqual(rules.check(columns, 4), [(), ('X-02', 'X-03'), ('X-01',), ('X-03', 'X-04')])
+
+    def test_rules_missing_fields(self):
+        """fields that a layout doesn't have are blank"""
+        rules = RuleSet([OneOf('gender_2', (1, 2), 'X-01'), Required('dateofbirth_2', 'X-02')])
+        self.assertEqual(rules.checkRecords(('gender_1',), [(1,), (3,)]), [('X-02',), ('X-02',)])
+
+    def test_rules_columns(self):
+        """rules work on numpy columns too"""
+        import numpy
+        rules = RuleSet([OneOf('b', (1, 2), 'X-01'), Range('a', 0, 5, 'X-02')])
+        columns = {'b': numpy.array([b'1', b'3', b' '], dtype='S1'), 'a': numpy.ma.masked_array([4, 9, 0], mask=[False, False, True])}
+        self.assertEqual(rules.check(columns, 3), [(), ('X-01', 'X-02'), ()])
+
+    def test_rules_fields_exist(self):
+        """the rules only use fields that are in the record type layouts"""
+        for prefix, rules in recordrules.items():
+            fields = {field for layout in recordtypes[prefix].layouts for field in layout.fields}
+            self.assertEqual(set(rules.fields) - fields, set(), prefix)
+            for rule in rules.rules:
+                self.assertRegex(rule.code, '^' + prefix + '-[0-9][0-9]$')
@@ -0,0 +1,132 @@
+import datetime
+import io
+import json
+import shutil
+import tempfile
+from tanfparser.pipeline import Pipeline, Sink, scanRecords, splitStage, DecryptStage
+from tanfparser.reader import readLines
+
+
+# These are the sections of the tanf2json document, in order.  The header
+# and trailer are single records, the rest are lists of records.
+jsonsections = [
+    'header',
+    'section1_familydata',
+    'section1_adultdata',
+    'section1_childdata',
+    'section2_closedcasedata',
+    'section2_closedpersondata',
+    'section3_aggregatedata',
+    'section4_familiesbystratumdata',
+    'trailer',
+]
+
+# How much of each section tanf2jsonStream() keeps in memory before it
+# spills the section out to a temp file.
+JSON_SPOOL_SIZE = 1024 * 1024
+
+# How many records tanf2jsonStream() moves through its pipeline at once.
+JSON_BATCH_SIZE = 100
+
+
+# This is for values that json doesn't know about, like the dates that the
+# upload app turns some fields into.
+def jsonValue(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError('cannot turn {!r} into json'.format(value))
+
+
+# This is the pipeline sink that writes records out as json.  It writes one
+# json document with a list of records for each section, or if ndjson is set,
+# a line of json like {"section": "section1_familydata", "record": {...}} for
+# each record in the order they show up in the file.
+#
+# The records of the different sections are all mixed up together in the
+# file, so for the document each section is written to its own spool (which
+# turns into a temp file once it gets big) and the spools are stitched
+# together at the end, so that big files don't have to fit in memory.
+class JsonSink(Sink):
+    def __init__(self, out, ndjson=False):
+        self.out = out
+        self.ndjson = ndjson
+        self.header = {}
+        self.trailer = ()
+        self.spools = {}
+
+    def write(self, batch):
+        for record in batch:
+            data = record.asDict()
+            section = record.rt.section
+            if section == 'header':
+                self.header = data
+            elif section == 'trailer':
+                self.trailer = data
+
+            if self.ndjson:
+                self.out.write(json.dumps({'section': section, 'record': data}, default=jsonValue))
+                self.out.write('\n')
+            elif section not in ('header', 'trailer'):
+                spool = self.spools.get(section)
+                if spool is None:
+                    spool = tempfile.SpooledTemporaryFile(max_size=JSON_SPOOL_SIZE, mode='w+')
+                    self.spools[section] = spool
+                else:
+                    spool.write(', ')
+                spool.write(json.dumps(data, default=jsonValue))
+
+    # This comes out exactly the same as json.dumps() of the whole thing would.
+    def finish(self):
+        if self.ndjson:
+            return
+        self.out.write('{"header": ' + json.dumps(self.header))
+        for section in jsonsections[1:-1]:
+            self.out.write(', ' + json.dumps(section) + ': [')
+            spool = self.spools.get(section)
+            if spool is not None:
+                spool.seek(0)
+                shutil.copyfileobj(spool, self.out)
+            self.out.write(']')
+        self.out.write(', "trailer": ' + json.dumps(self.trailer) + '}')
+
+    def close(self):
+        for spool in self.spools.values():
+            spool.close()
+        self.spools = {}
+
+
+#
+# This function parses the txt files that are sent by STT people to the TDRS
+# app and writes a json document to out as it goes (see JsonSink).
+#
+# Lines that can't be parsed go to errors (an ErrorSink), and a
+# TANFParseError is raised at the end if there were any, or as soon as there
+# are too many of them.  The document is only written if there weren't.
+#
+# Possible tricky bits:
+#  1) We do not parse the fields at all, but just pull them
+#     in as strings.  So we don't do any type parsing or anything.  That might
+#     better be done by code that consumes the json doc and stores it.
+#  2) The social security numbers do not have dashes put into them, which may
+#     not be the way they are parsed/stored in the existing system.
+#
+# This code must be run with python 3.6 or above, because it preserves
+# the order of dictionaries, which we need for this to work.
+#
+#
+# XXX The fields here are incomplete.  More work is required to
+#     make this parse all record types and all sections.
+#
+def tanf2jsonStream(f, out, ndjson=False, errors=None):
+    # it's all parsing, so threads wouldn't help, and small batches keep the
+    # records that are in flight from adding up to much memory
+    pipeline = Pipeline(scanRecords(readLines(f), errors), [splitStage, DecryptStage()], JsonSink(out, ndjson),
+                        batchsize=JSON_BATCH_SIZE, queuesize=0)
+    pipeline.run()
+
+
+# This parses a TANF file and returns it as a json document.
+def tanf2json(f):
+    out = io.StringIO()
+    tanf2jsonStream(f, out)
+    return out.getvalue()
@@ -0,0 +1,55 @@
+import functools
+from datetime import date
+
+
+# This turns a YYYYMMDD field into a date, or None if it isn't a real date.
+# Birth dates repeat a lot within a state, and there are only so many of
+# them, so remember the ones we have already seen.
+@functools.lru_cache(maxsize=32768)
+def parseDate(raw):
+    if len(raw) != 8 or not raw.isdecimal():
+        return None
+    try:
+        return date(int(raw[:4]), int(raw[4:6]), int(raw[6:]))
+    except ValueError:
+        return None
+
+
+# Numbers in the file are zero padded, but blank padding happens too, and
+# fields that aren't filled in are all blanks.  So strip the blanks off, and
+# anything that isn't a number after that is None.
+def parseInt(raw):
+    raw = raw.strip()
+    if raw.isdecimal():
+        return int(raw)
+    return None
+
+
+# These are the versions of parseDate() and parseInt() for fields that are
+# still bytes, straight out of the file.  int() is happy to take bytes, so
+# numbers never get decoded at all.  isdigit() on bytes is only true for
+# 0-9, which is the same thing isdecimal() checks for in ascii strings.
+@functools.lru_cache(maxsize=32768)
+def parseDateBytes(raw):
+    if len(raw) != 8 or not raw.isdigit():
+        return None
+    try:
+        return date(int(raw[:4]), int(raw[4:6]), int(raw[6:]))
+    except ValueError:
+        return None
+
+
+def parseIntBytes(raw):
+    raw = raw.strip()
+    if raw.isdigit():
+        return int(raw)
+    return None
+
+
+# This is for text fields that are still bytes:  the padding is stripped off
+# before decoding, so blank fields never get decoded.
+def parseText(raw):
+    raw = raw.strip()
+    if raw:
+        return raw.decode('utf-8')
+    return ''
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-17 22:39
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('upload', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='adult',
+            name='dateofbirth',
+            field=models.DateField(null=True, verbose_name='date of birth (item 32)'),
+        ),
+        migrations.AlterField(
+            model_name='child',
+            name='dateofbirth_1',
+            field=models.DateField(null=True, verbose_name='date of birth (item 68)'),
+        ),
+        migrations.AlterField(
+            model_name='child',
+            name='dateofbirth_2',
+            field=models.DateField(default=datetime.date.today, null=True, verbose_name='date of birth (item 68)'),
+        ),
+        migrations.AlterField(
+            model_name='closedperson',
+            name='dateofbirth',
+            field=models.DateField(null=True, verbose_name='date of birth (item 15)'),
+        ),
+    ]
@@ -0,0 +1,323 @@
+# Generated by Django 2.2.28 on 2026-10-17 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('upload', '0002_dateofbirth_null'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='adult',
+            name='familyafilliation',
+            field=models.IntegerField(null=True, verbose_name='family affiliation (item 30)'),
+        ),
+        migrations.AlterField(
+            model_name='adult',
+            name='gender',
+            field=models.IntegerField(default=0, null=True, verbose_name='gender (item 35)'),
+        ),
+        migrations.AlterField(
+            model_name='adult',
+            name='noncustodialparent',
+            field=models.IntegerField(null=True, verbose_name='noncustodial parent (item 31)'),
+        ),
+        migrations.AlterField(
+            model_name='adult',
+            name='relationshiptohh',
+            field=models.IntegerField(default=0, null=True, verbose_name='relationship to head of household (item 38)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='calendarquarter',
+            field=models.IntegerField(null=True, verbose_name='calendar quarter (item 3)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='calendaryear',
+            field=models.IntegerField(null=True, verbose_name='calendar year (item 3)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='firstmonthapprovals',
+            field=models.IntegerField(null=True, verbose_name='total number of approved applications: first month (item 5)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='firstmonthapps',
+            field=models.IntegerField(null=True, verbose_name='total number of applicants: first month (item 4)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='firstmonthassist',
+            field=models.IntegerField(default=0, null=True, verbose_name='total amount of assistance: first month (item 7)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='firstmonthdenied',
+            field=models.IntegerField(null=True, verbose_name='total number of denied applications: first month (item 6)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='secondmonthapprovals',
+            field=models.IntegerField(null=True, verbose_name='total number of approved applications: second month (item 5)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='secondmonthapps',
+            field=models.IntegerField(null=True, verbose_name='total number of applicants: second month (item 4)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='secondmonthassist',
+            field=models.IntegerField(default=0, null=True, verbose_name='total amount of assistance: second month (item 7)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='secondmonthdenied',
+            field=models.IntegerField(null=True, verbose_name='total number of denied applications: second month (item 6)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='thirdmonthapprovals',
+            field=models.IntegerField(null=True, verbose_name='total number of approved applications: third month (item 5)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='thirdmonthapps',
+            field=models.IntegerField(null=True, verbose_name='total number of applicants: third month (item 4)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='thirdmonthassist',
+            field=models.IntegerField(default=0, null=True, verbose_name='total amount of assistance: third month (item 7)'),
+        ),
+        migrations.AlterField(
+            model_name='aggregateddata',
+            name='thirdmonthdenied',
+            field=models.IntegerField(null=True, verbose_name='total number of denied applications: third month (item 6)'),
+        ),
+        migrations.AlterField(
+            model_name='child',
+            name='familyafilliation_1',
+            field=models.IntegerField(default=0, null=True, verbose_name='family affiliation1: Child 1,3,5,7,9 (item 67)'),
+        ),
+        migrations.AlterField(
+            model_name='child',
+            name='familyafilliation_2',
+            field=models.IntegerField(default=0, null=True, verbose_name='family affiliation 2: Child 2,4,6,8,10 (item 67)'),
+        ),
+        migrations.AlterField(
+            model_name='child',
+            name='gender_1',
+            field=models.IntegerField(default=0, null=True, verbose_name='gender (item 71)'),
+        ),
+        migrations.AlterField(
+            model_name='child',
+            name='gender_2',
+            field=models.IntegerField(default=0, null=True, verbose_name='gender (item 71)'),
+        ),
+        migrations.AlterField(
+            model_name='child',
+            name='relationshiptohh_1',
+            field=models.IntegerField(default=0, null=True, verbose_name='relationship to head of household (item 73)'),
+        ),
+        migrations.AlterField(
+            model_name='child',
+            name='relationshiptohh_2',
+            field=models.IntegerField(default=0, null=True, verbose_name='relationship to head of household (item 73)'),
+        ),
+        migrations.AlterField(
+            model_name='closedcase',
+            name='closurereason',
+            field=models.IntegerField(null=True, verbose_name='reason for closure (item 9)'),
+        ),
+        migrations.AlterField(
+            model_name='closedcase',
+            name='countyfipscode',
+            field=models.IntegerField(null=True, verbose_name='county fips code (item 2)'),
+        ),
+        migrations.AlterField(
+            model_name='closedcase',
+            name='disposition',
+            field=models.IntegerField(null=True, verbose_name='disposition (item 8)'),
+        ),
+        migrations.AlterField(
+            model_name='closedcase',
+            name='stratum',
+            field=models.IntegerField(null=True, verbose_name='stratum (item 5)'),
+        ),
+        migrations.AlterField(
+            model_name='closedperson',
+            name='countablemonths',
+            field=models.IntegerField(null=True, verbose_name='number of countable months toward federal time limit (item 26)'),
+        ),
+        migrations.AlterField(
+            model_name='closedperson',
+            name='countablemonthsremaining',
+            field=models.IntegerField(null=True, verbose_name='number of countable months remaining under state/tribe limit (item 27)'),
+        ),
+        migrations.AlterField(
+            model_name='closedperson',
+            name='earnedincome',
+            field=models.IntegerField(null=True, verbose_name='amount of earned income (item 29)'),
+        ),
+        migrations.AlterField(
+            model_name='closedperson',
+            name='familyafilliation',
+            field=models.IntegerField(null=True, verbose_name='family affiliation (item 14)'),
+        ),
+        migrations.AlterField(
+            model_name='closedperson',
+            name='gender',
+            field=models.IntegerField(null=True, verbose_name='gender (item 18)'),
+        ),
+        migrations.AlterField(
+            model_name='closedperson',
+            name='relationshiptohh',
+            field=models.IntegerField(null=True, verbose_name='relationship to head of household (item 21)'),
+        ),
+        migrations.AlterField(
+            model_name='closedperson',
+            name='unearnedincome',
+            field=models.IntegerField(null=True, verbose_name='amount of unearned income (item 30)'),
+        ),
+        migrations.AlterField(
+            model_name='familiesbystratumdata',
+            name='calendarquarter',
+            field=models.IntegerField(null=True, verbose_name='calendar quarter (item 3)'),
+        ),
+        migrations.AlterField(
+            model_name='familiesbystratumdata',
+            name='calendaryear',
+            field=models.IntegerField(null=True, verbose_name='calendar year (item 3)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='amtofchildsupport',
+            field=models.IntegerField(null=True, verbose_name='amount of child support (item 19)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='amtoffamilycashresources',
+            field=models.IntegerField(null=True, verbose_name='amount of familys cash resources (item 20)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='amtoffoodstampassistance',
+            field=models.IntegerField(null=True, verbose_name='amount of food stamp assistance (item 16)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='amtofsubsidizedchildcare',
+            field=models.IntegerField(null=True, verbose_name='amount of subsidized child care (item 18)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='cash_amount',
+            field=models.IntegerField(null=True, verbose_name='cash and cash equivalents amount (item 21a)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='cash_nbr_month',
+            field=models.IntegerField(null=True, verbose_name='cash and cash equivalents number of months (item 21b)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='countyfipscode',
+            field=models.IntegerField(null=True, verbose_name='county fips code (item 2)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='disposition',
+            field=models.IntegerField(null=True, verbose_name='disposition (item 9)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='fundingstream',
+            field=models.IntegerField(null=True, verbose_name='funding stream (item 8)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='newapplicant',
+            field=models.IntegerField(null=True, verbose_name='new applicant (item 10)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='numfamilymembers',
+            field=models.IntegerField(null=True, verbose_name='number family members (item 11)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='other_amount',
+            field=models.IntegerField(null=True, verbose_name='other amount (item 25a'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='other_nbr_months',
+            field=models.IntegerField(null=True, verbose_name='other number of months (item 25b)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='sanctionsreduction_amt',
+            field=models.IntegerField(null=True, verbose_name='reason for and amount of assistance reduction: sanctions reduction_amount (item 26a)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='stratum',
+            field=models.IntegerField(null=True, verbose_name='stratum (item 5)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='tanfchildcare_amount',
+            field=models.IntegerField(null=True, verbose_name='TANF child care amount (item 22a)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='tanfchildcare_children_covered',
+            field=models.IntegerField(null=True, verbose_name='TANF child care children covered (item 22b)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='tanfchildcare_nbr_months',
+            field=models.IntegerField(null=True, verbose_name='TANF child care number of months (item 22c)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='tanffamilyexemptfromtimelimits',
+            field=models.IntegerField(null=True, verbose_name='TANF family exempt from time_limits (item 28)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='tanffamilynewchildonlyfamily',
+            field=models.IntegerField(null=True, verbose_name='TANF family new child only family (item 29)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='transitionalservices_amount',
+            field=models.IntegerField(null=True, verbose_name='transitional services amount (item 24a'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='transitionalservices_nbr_months',
+            field=models.IntegerField(null=True, verbose_name='transitional services number of months (item 24b)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='transportation_amount',
+            field=models.IntegerField(null=True, verbose_name='transportation amount (item 23a)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='transportation_nbr_months',
+            field=models.IntegerField(null=True, verbose_name='transportation number of months (item 23b)'),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='typeoffamilyforworkparticipation',
+            field=models.IntegerField(null=True, verbose_name='type of family for work participation (item 12)'),
+        ),
+    ]
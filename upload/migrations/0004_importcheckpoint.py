@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-17 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('upload', '0003_integer_fields_null'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.CharField(max_length=512, unique=True, verbose_name='uploaded file being imported')),
+                ('imported_at', models.DateTimeField(verbose_name='time the records in the file are imported at')),
+                ('imported_by', models.CharField(max_length=64, verbose_name='who the file is being imported by')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='byte offset of the next line to import')),
+                ('lines', models.IntegerField(default=0, verbose_name='number of lines imported')),
+                ('counts', models.TextField(default='{}', verbose_name='number of records of each type stored (json)')),
+                ('header', models.TextField(default='{}', verbose_name='header of the file (json)')),
+                ('trailer', models.TextField(default='{}', verbose_name='trailer of the file (json)')),
+                ('errors', models.TextField(default='null', verbose_name='lines that could not be parsed (json)')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('upload', '0004_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='done',
+            field=models.BooleanField(default=False, verbose_name='whether all of the file has been stored and checked'),
+        ),
+    ]
@@ -24,34 +24,34 @@ class Family(models.Model):
     recordtype = models.CharField('record type (T1)', max_length=2)
     reportingmonth = models.CharField('reporting month (item 4)', max_length=6)
     casenumber = models.CharField('case number (item 6)', max_length=11)
-    countyfipscode = models.IntegerField('county fips code (item 2)')
-    stratum = models.IntegerField('stratum (item 5)')
+    countyfipscode = models.IntegerField('county fips code (item 2)', null=True)
+    stratum = models.IntegerField('stratum (item 5)', null=True)
     zipcode = models.CharField('zipcode (item 7)', max_length=5)
-    fundingstream = models.IntegerField('funding stream (item 8)')
-    disposition = models.IntegerField('disposition (item 9)')
-    newapplicant = models.IntegerField('new applicant (item 10)')
-    numfamilymembers = models.IntegerField('number family members (item 11)')
-    typeoffamilyforworkparticipation = models.IntegerField('type of family for work participation (item 12)')
+    fundingstream = models.IntegerField('funding stream (item 8)', null=True)
+    disposition = models.IntegerField('disposition (item 9)', null=True)
+    newapplicant = models.IntegerField('new applicant (item 10)', null=True)
+    numfamilymembers = models.IntegerField('number family members (item 11)', null=True)
+    typeoffamilyforworkparticipation = models.IntegerField('type of family for work participation (item 12)', null=True)
     receivessubsidizedhousing = models.CharField('receives subsidized housing (item 13)', max_length=1)
     receivesmedicalassistance = models.CharField('receives medical assistance (item 14)', max_length=1)
     receivesfoodstamps = models.CharField('receives food stamps (item 15)', max_length=1)
-    amtoffoodstampassistance = models.IntegerField('amount of food stamp assistance (item 16)')
+    amtoffoodstampassistance = models.IntegerField('amount of food stamp assistance (item 16)', null=True)
     receivessubsidizedchildcare = models.CharField('receives food stamps (item 17)', max_length=1)
-    amtofsubsidizedchildcare = models.IntegerField('amount of subsidized child care (item 18)')
-    amtofchildsupport = models.IntegerField('amount of child support (item 19)')
-    amtoffamilycashresources = models.IntegerField('amount of familys cash resources (item 20)')
-    cash_amount = models.IntegerField('cash and cash equivalents amount (item 21a)')
-    cash_nbr_month = models.IntegerField('cash and cash equivalents number of months (item 21b)')
-    tanfchildcare_amount = models.IntegerField('TANF child care amount (item 22a)')
-    tanfchildcare_children_covered = models.IntegerField('TANF child care children covered (item 22b)')
-    tanfchildcare_nbr_months = models.IntegerField('TANF child care number of months (item 22c)')
-    transportation_amount = models.IntegerField('transportation amount (item 23a)')
-    transportation_nbr_months = models.IntegerField('transportation number of months (item 23b)')
-    transitionalservices_amount = models.IntegerField('transitional services amount (item 24a')
-    transitionalservices_nbr_months = models.IntegerField('transitional services number of months (item 24b)')
-    other_amount = models.IntegerField('other amount (item 25a')
-    other_nbr_months = models.IntegerField('other number of months (item 25b)')
-    sanctionsreduction_amt = models.IntegerField('reason for and amount of assistance reduction: sanctions reduction_amount (item 26a)')
+    amtofsubsidizedchildcare = models.IntegerField('amount of subsidized child care (item 18)', null=True)
+    amtofchildsupport = models.IntegerField('amount of child support (item 19)', null=True)
+    amtoffamilycashresources = models.IntegerField('amount of familys cash resources (item 20)', null=True)
+    cash_amount = models.IntegerField('cash and cash equivalents amount (item 21a)', null=True)
+    cash_nbr_month = models.IntegerField('cash and cash equivalents number of months (item 21b)', null=True)
+    tanfchildcare_amount = models.IntegerField('TANF child care amount (item 22a)', null=True)
+    tanfchildcare_children_covered = models.IntegerField('TANF child care children covered (item 22b)', null=True)
+    tanfchildcare_nbr_months = models.IntegerField('TANF child care number of months (item 22c)', null=True)
+    transportation_amount = models.IntegerField('transportation amount (item 23a)', null=True)
+    transportation_nbr_months = models.IntegerField('transportation number of months (item 23b)', null=True)
+    transitionalservices_amount = models.IntegerField('transitional services amount (item 24a', null=True)
+    transitionalservices_nbr_months = models.IntegerField('transitional services number of months (item 24b)', null=True)
+    other_amount = models.IntegerField('other amount (item 25a', null=True)
+    other_nbr_months = models.IntegerField('other number of months (item 25b)', null=True)
+    sanctionsreduction_amt = models.IntegerField('reason for and amount of assistance reduction: sanctions reduction_amount (item 26a)', null=True)
     workrequirementssanction = models.CharField('reason for and amount of assistance reduction: work requirements sanction (item 26a)', max_length=4)
     familysanctionforadultnohsdiploma = models.CharField('reason for and amount of assistance reduction: family sanction for adult, no high school diploma (item 26a)', max_length=1)
     sanctionforteenparentnotattendingschool = models.CharField('reason for and amount of assistance reduction: sanction for teen parent not attending school (item 26a)', max_length=1)
@@ -64,8 +64,8 @@ class Family(models.Model):
     reductionbasedonlengthofreceiptofassistance = models.CharField('reason for and amount of assistance reduction: reduction based on length of receipt of assistance (item 26c)', max_length=1)
     othernonsanction = models.CharField('reason for and amount of assistance reduction: other, non-sanction (item 26c)', max_length=1)
     waiver_evaluation_control_gprs = models.CharField('waiver_evaluation_control_gprs (item 27)', max_length=1)
-    tanffamilyexemptfromtimelimits = models.IntegerField('TANF family exempt from time_limits (item 28)')
-    tanffamilynewchildonlyfamily = models.IntegerField('TANF family new child only family (item 29)')
+    tanffamilyexemptfromtimelimits = models.IntegerField('TANF family exempt from time_limits (item 28)', null=True)
+    tanffamilynewchildonlyfamily = models.IntegerField('TANF family new child only family (item 29)', null=True)
 
 
 # T2: https://www.acf.hhs.gov/sites/default/files/ofa/tanf_data_report_section1_10_2008.pdf
@@ -85,9 +85,9 @@ class Adult(models.Model):
     recordtype = models.CharField('record type (T2)', max_length=2)
     reportingmonth = models.CharField('reporting month (item 4)', max_length=6)
     casenumber = models.CharField('case number (item 6)', max_length=11)
-    familyafilliation = models.IntegerField('family affiliation (item 30)')
-    noncustodialparent = models.IntegerField('noncustodial parent (item 31)')
-    dateofbirth = models.DateField('date of birth (item 32)')
+    familyafilliation = models.IntegerField('family affiliation (item 30)', null=True)
+    noncustodialparent = models.IntegerField('noncustodial parent (item 31)', null=True)
+    dateofbirth = models.DateField('date of birth (item 32)', null=True)
     socialsecuritynumber = models.CharField('social security number (item 33)', max_length=9)
     racehispanic = models.CharField('race/ethnicity: hispanic or latino (item 34a)', max_length=1)
     racenativeamerican = models.CharField('race/ethnicity: american indian or alaska native (item 34b)', max_length=1)
@@ -95,14 +95,14 @@ class Adult(models.Model):
     raceblack = models.CharField('race/ethnicity: black or african american (item 34d)', max_length=1, default='')
     raceislander = models.CharField('race/ethnicity: islander (item 34e)', max_length=1, default='')
     racewhite = models.CharField('race/ethnicity: white (item 34f)', max_length=1, default='')
-    gender = models.IntegerField('gender (item 35)', default=0)
+    gender = models.IntegerField('gender (item 35)', default=0, null=True)
     oasdibenefits = models.CharField('receives disability benefits: received federal disability insurance benefits under the oasdi program (item 36a)', max_length=1, default='')
     nonssabenefits = models.CharField('receives disability benefits: receives benefits based on federal disability status under non-ssa programs (item 36b)', max_length=1, default='')
     titlexivapdtbenefits = models.CharField('receives disability benefits: received aid to the permanently and totally disabled under title xiv-apdt (item 36c)', max_length=1, default='')
     titlexviaabdbenefits = models.CharField('receives disability benefits: received aid to the aged, blind, and disabled under title xvi-aabd (item 36d)', max_length=1, default='')
     titlexvissibenefits = models.CharField('receives disability benefits: received ssi under title xvi-ssi (item 36e)', max_length=1, default='')
     maritalstatus = models.CharField('marital status (item 37)', max_length=1, default='')
-    relationshiptohh = models.IntegerField('relationship to head of household (item 38)', default=0)
+    relationshiptohh = models.IntegerField('relationship to head of household (item 38)', default=0, null=True)
     parentminorchild = models.CharField('parent with minor child in the family (item 39)', max_length=1, default='')
     pregnantneeds = models.CharField('needs of a pregnant woman (item 40)', max_length=1, default='')
     educationlevel = models.CharField('education level (item 41)', max_length=2, default='')
@@ -171,8 +171,8 @@ class Child(models.Model):
     reportingmonth = models.CharField('reporting month (item 4)', max_length=6)
     casenumber = models.CharField('case number (item 6)', max_length=11)
 
-    familyafilliation_1 = models.IntegerField('family affiliation1: Child 1,3,5,7,9 (item 67)', default=0)
-    dateofbirth_1 = models.DateField('date of birth (item 68)')
+    familyafilliation_1 = models.IntegerField('family affiliation1: Child 1,3,5,7,9 (item 67)', default=0, null=True)
+    dateofbirth_1 = models.DateField('date of birth (item 68)', null=True)
     socialsecuritynumber_1 = models.CharField('social security number (item 69)', max_length=9, default='')
     racehispanic_1 = models.CharField('race/ethnicity: hispanic or latino (item 70a)', max_length=1, default='')
     racenativeamerican_1 = models.CharField('race/ethnicity: american indian or alaska native (item 70b)', max_length=1, default='')
@@ -180,18 +180,18 @@ class Child(models.Model):
     raceblack_1 = models.CharField('race/ethnicity: black or african american islander (item 70d)', max_length=1, default='')
     racepacific_1 = models.CharField('race/ethnicity: native hawaiian or other pacific islander (item 70e)', max_length=1, default='')
     racewhite_1 = models.CharField('race/ethnicity: white (item 70f)', max_length=1, default='')
-    gender_1 = models.IntegerField('gender (item 71)', default=0)
+    gender_1 = models.IntegerField('gender (item 71)', default=0, null=True)
     nonssabenefits_1 = models.CharField('receives disability benefits: receives benefits based on federal disability status under non-ssa programs (item 72a)', max_length=1, default='')
     titlexvissibenefits_1 = models.CharField('receives disability benefits: received ssi under title xvi-ssi (item 72b)', max_length=1, default='')
-    relationshiptohh_1 = models.IntegerField('relationship to head of household (item 73)', default=0)
+    relationshiptohh_1 = models.IntegerField('relationship to head of household (item 73)', default=0, null=True)
     parentminorchild_1 = models.CharField('parent with minor child in the family (item 74)', max_length=1, default='')
     educationlevel_1 = models.CharField('education level (item 75)', max_length=12, default='')
     citizenship_1 = models.CharField('citizenship/alienage (item 76)', max_length=1, default='')
     unearnedincomessi_1 = models.CharField('amount of unearned income: SSI (item 77a)', max_length=4, default='')
     unearnedincomeother_1 = models.CharField('amount of unearned income: other unearned income (item 77b)', max_length=4, default='')
 
-    familyafilliation_2 = models.IntegerField('family affiliation 2: Child 2,4,6,8,10 (item 67)', default=0)
-    dateofbirth_2 = models.DateField('date of birth (item 68)', default=datetime.date.today)
+    familyafilliation_2 = models.IntegerField('family affiliation 2: Child 2,4,6,8,10 (item 67)', default=0, null=True)
+    dateofbirth_2 = models.DateField('date of birth (item 68)', default=datetime.date.today, null=True)
     socialsecuritynumber_2 = models.CharField('social security number (item 69)', max_length=9, default='')
     racehispanic_2 = models.CharField('race/ethnicity: hispanic or latino (item 70a)', max_length=1, default='')
     racenativeamerican_2 = models.CharField('race/ethnicity: american indian or alaska native (item 70b)', max_length=1, default='')
@@ -199,10 +199,10 @@ class Child(models.Model):
     raceblack_2 = models.CharField('race/ethnicity: black or african american islander (item 70d)', max_length=1, default='')
     racepacific_2 = models.CharField('race/ethnicity: native hawaiian or other pacific islander (item 70e)', max_length=1, default='')
     racewhite_2 = models.CharField('race/ethnicity: white (item 70f)', max_length=1, default='')
-    gender_2 = models.IntegerField('gender (item 71)', default=0)
+    gender_2 = models.IntegerField('gender (item 71)', default=0, null=True)
     nonssabenefits_2 = models.CharField('receives disability benefits: receives benefits based on federal disability status under non-ssa programs (item 72a)', max_length=1, default='')
     titlexvissibenefits_2 = models.CharField('receives disability benefits: received ssi under title xvi-ssi (item 72b)', max_length=1, default='')
-    relationshiptohh_2 = models.IntegerField('relationship to head of household (item 73)', default=0)
+    relationshiptohh_2 = models.IntegerField('relationship to head of household (item 73)', default=0, null=True)
     parentminorchild_2 = models.CharField('parent with minor child in the family (item 74)', max_length=1, default='')
     educationlevel_2 = models.CharField('education level (item 75)', max_length=12, default='')
     citizenship_2 = models.CharField('citizenship/alienage (item 76)', max_length=1, default='')
@@ -256,11 +256,11 @@ class ClosedCase(models.Model):
     recordtype = models.CharField('record type (T4)', max_length=2)
     reportingmonth = models.CharField('reporting month (item 4)', max_length=6)
     casenumber = models.CharField('case number (item 6)', max_length=11)
-    countyfipscode = models.IntegerField('county fips code (item 2)')
-    stratum = models.IntegerField('stratum (item 5)')
+    countyfipscode = models.IntegerField('county fips code (item 2)', null=True)
+    stratum = models.IntegerField('stratum (item 5)', null=True)
     zipcode = models.CharField('zipcode (item 7)', max_length=5)
-    disposition = models.IntegerField('disposition (item 8)')
-    closurereason = models.IntegerField('reason for closure (item 9)')
+    disposition = models.IntegerField('disposition (item 8)', null=True)
+    closurereason = models.IntegerField('reason for closure (item 9)', null=True)
     receivessubsidizedhousing = models.CharField('receives subsidized housing (item 10)', max_length=1)
     receivesmedicalassistance = models.CharField('receives medical assistance (item 11)', max_length=1)
     receivesfoodstamps = models.CharField('receives food stamps (item 12)', max_length=1)
@@ -284,8 +284,8 @@ class ClosedPerson(models.Model):
     recordtype = models.CharField('record type (T5)', max_length=2)
     reportingmonth = models.CharField('reporting month (item 4)', max_length=6)
     casenumber = models.CharField('case number (item 6)', max_length=11)
-    familyafilliation = models.IntegerField('family affiliation (item 14)')
-    dateofbirth = models.DateField('date of birth (item 15)')
+    familyafilliation = models.IntegerField('family affiliation (item 14)', null=True)
+    dateofbirth = models.DateField('date of birth (item 15)', null=True)
     socialsecuritynumber = models.CharField('social security number (item 16)', max_length=9)
     racehispanic = models.CharField('race/ethnicity: hispanic or latino (item 17a)', max_length=1)
     racenativeamerican = models.CharField('race/ethnicity: american indian or alaska native (item 17b)', max_length=1)
@@ -293,23 +293,23 @@ class ClosedPerson(models.Model):
     raceblack = models.CharField('race/ethnicity: black or african american (item 17d)', max_length=1)
     racepacific = models.CharField('race/ethnicity: native hawaiian or other pacific islander (item 17e)', max_length=1)
     racewhite = models.CharField('race/ethnicity: white (item 17f)', max_length=1)
-    gender = models.IntegerField('gender (item 18)')
+    gender = models.IntegerField('gender (item 18)', null=True)
     oasdibenefits = models.CharField('receives disability benefits: received federal disability insurance benefits under the oasdi program (item 19a)', max_length=1)
     nonssabenefits = models.CharField('receives disability benefits: receives benefits based on federal disability status under non-ssa programs (item 19b)', max_length=1)
     titlexivapdtbenefits = models.CharField('receives disability benefits: received aid to the permanently and totally disabled under title xiv-apdt (item 19c)', max_length=1)
     titlexviaabdbenefits = models.CharField('receives disability benefits: received aid to the aged, blind, and disabled under title xvi-aabd (item 19d)', max_length=1)
     titlexvissibenefits = models.CharField('receives disability benefits: received ssi under title xvi-ssi (item 19e)', max_length=1)
     maritalstatus = models.CharField('marital status (item 20)', max_length=1)
-    relationshiptohh = models.IntegerField('relationship to head of household (item 21)')
+    relationshiptohh = models.IntegerField('relationship to head of household (item 21)', null=True)
     parentminorchild = models.CharField('parent with minor child in the family (item 22)', max_length=1)
     pregnantneeds = models.CharField('needs of a pregnant woman (item 23)', max_length=11)
     educationlevel = models.CharField('education level (item 24)', max_length=12)
     citizenship = models.CharField('citizenship/alienage (item 25)', max_length=1)
-    countablemonths = models.IntegerField('number of countable months toward federal time limit (item 26)')
-    countablemonthsremaining = models.IntegerField('number of countable months remaining under state/tribe limit (item 27)')
+    countablemonths = models.IntegerField('number of countable months toward federal time limit (item 26)', null=True)
+    countablemonthsremaining = models.IntegerField('number of countable months remaining under state/tribe limit (item 27)', null=True)
     employmentstatus = models.CharField('employment status (item 28)', max_length=1)
-    earnedincome = models.IntegerField('amount of earned income (item 29)')
-    unearnedincome = models.IntegerField('amount of unearned income (item 30)')
+    earnedincome = models.IntegerField('amount of earned income (item 29)', null=True)
+    unearnedincome = models.IntegerField('amount of unearned income (item 30)', null=True)
 
 
 # T6: https://www.acf.hhs.gov/sites/default/files/ofa/tanf_data_report_section3.pdf
@@ -327,20 +327,20 @@ class AggregatedData(models.Model):
 
     # record data
     recordtype = models.CharField('record type (T6)', max_length=2)
-    calendaryear = models.IntegerField('calendar year (item 3)')
-    calendarquarter = models.IntegerField('calendar quarter (item 3)')
-    firstmonthapps = models.IntegerField('total number of applicants: first month (item 4)')
-    secondmonthapps = models.IntegerField('total number of applicants: second month (item 4)')
-    thirdmonthapps = models.IntegerField('total number of applicants: third month (item 4)')
-    firstmonthapprovals = models.IntegerField('total number of approved applications: first month (item 5)')
-    secondmonthapprovals = models.IntegerField('total number of approved applications: second month (item 5)')
-    thirdmonthapprovals = models.IntegerField('total number of approved applications: third month (item 5)')
-    firstmonthdenied = models.IntegerField('total number of denied applications: first month (item 6)')
-    secondmonthdenied = models.IntegerField('total number of denied applications: second month (item 6)')
-    thirdmonthdenied = models.IntegerField('total number of denied applications: third month (item 6)')
-    firstmonthassist = models.IntegerField('total amount of assistance: first month (item 7)', default=0)
-    secondmonthassist = models.IntegerField('total amount of assistance: second month (item 7)', default=0)
-    thirdmonthassist = models.IntegerField('total amount of assistance: third month (item 7)', default=0)
+    calendaryear = models.IntegerField('calendar year (item 3)', null=True)
+    calendarquarter = models.IntegerField('calendar quarter (item 3)', null=True)
+    firstmonthapps = models.IntegerField('total number of applicants: first month (item 4)', null=True)
+    secondmonthapps = models.IntegerField('total number of applicants: second month (item 4)', null=True)
+    thirdmonthapps = models.IntegerField('total number of applicants: third month (item 4)', null=True)
+    firstmonthapprovals = models.IntegerField('total number of approved applications: first month (item 5)', null=True)
+    secondmonthapprovals = models.IntegerField('total number of approved applications: second month (item 5)', null=True)
+    thirdmonthapprovals = models.IntegerField('total number of approved applications: third month (item 5)', null=True)
+    firstmonthdenied = models.IntegerField('total number of denied applications: first month (item 6)', null=True)
+    secondmonthdenied = models.IntegerField('total number of denied applications: second month (item 6)', null=True)
+    thirdmonthdenied = models.IntegerField('total number of denied applications: third month (item 6)', null=True)
+    firstmonthassist = models.IntegerField('total amount of assistance: first month (item 7)', default=0, null=True)
+    secondmonthassist = models.IntegerField('total amount of assistance: second month (item 7)', default=0, null=True)
+    thirdmonthassist = models.IntegerField('total amount of assistance: third month (item 7)', default=0, null=True)
     # XXX many more fields need to be added here
 
 
@@ -359,6 +359,27 @@ class FamiliesByStratumData(models.Model):
 
     # record data
     recordtype = models.CharField('record type (T7)', max_length=2)
-    calendaryear = models.IntegerField('calendar year (item 3)')
-    calendarquarter = models.IntegerField('calendar quarter (item 3)')
+    calendaryear = models.IntegerField('calendar year (item 3)', null=True)
+    calendarquarter = models.IntegerField('calendar quarter (item 3)', null=True)
     # XXX many more fields need to be added here
+
+
+# This is how far the import of an upload has gotten.  The records are
+# stored a chunk at a time, and this is updated in the same transaction as
+# each chunk, so if the worker doing the import gets killed, the retry can
+# carry on from the last chunk that made it into the db.  Once all of the
+# file is in and checked, done is set, so that a retry goes straight on to
+# finishing the import, and the checkpoint is deleted once it is finished.
+# The json fields are so that the retry can pick up the header, trailer and
+# errors of the part of the file before offset.
+class ImportCheckpoint(models.Model):
+    file = models.CharField('uploaded file being imported', max_length=512, unique=True)
+    imported_at = models.DateTimeField('time the records in the file are imported at')
+    imported_by = models.CharField('who the file is being imported by', max_length=64)
+    offset = models.BigIntegerField('byte offset of the next line to import', default=0)
+    lines = models.IntegerField('number of lines imported', default=0)
+    counts = models.TextField('number of records of each type stored (json)', default='{}')
+    header = models.TextField('header of the file (json)', default='{}')
+    trailer = models.TextField('trailer of the file (json)', default='{}')
+    errors = models.TextField('lines that could not be parsed (json)', default='null')
+    done = models.BooleanField('whether all of the file has been stored and checked', default=False)
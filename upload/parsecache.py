@@ -0,0 +1,288 @@
+import datetime
+import gzip
+import hashlib
+import json
+import tempfile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler
+from django.utils import timezone
+from tanfparser.layouts import LAYOUT_VERSION
+from tanfparser.records import recordtypes
+from tanfparser.rules import RULES_VERSION
+from tanfparser.ssn import encryptSsn, decryptSsn
+from upload.tanfDataProcessing import recordconverters, newContext, storeRecords
+
+
+# States often upload the same file more than once, so the parsed and
+# validated records of every upload are kept in the parse cache, keyed by
+# the sha256 of the upload.  If the same file comes in again, the import can
+# skip parsing and validating it and go straight to storing the records.
+#
+# An entry is a gzipped file of json lines in default_storage under
+# PARSE_CACHE_DIR.  The first line has the header, trailer and line count of
+# the upload, and every line after that is a record:
+#
+#   [prefix, layout name, values, reasons]
+#
+# The ssns are kept the way they are in the upload, so if it is encrypted
+# they get encrypted again on the way in, and decrypted on the way out.
+#
+# The reasons in an entry depend on the layouts, the rules and how
+# duplicates are looked for, so the name of an entry has a hash of all of
+# them in it (see parseCacheVersion()).  Entries from before any of them
+# changed are never used, and get evicted like anything else that hasn't
+# been used in a while.  Entries also go when the last upload that uses them
+# is deleted (see useParseCache() and releaseParseCache()).
+#
+# Only uploads that could be parsed are cached.  Files with lines we can't
+# figure out fail before there is anything worth keeping.
+
+# Change this whenever the way entries are written changes, or the way a
+# kind of rule works does (changes to the rules themselves are picked up by
+# RULES_VERSION).
+PARSE_CACHE_VERSION = 2
+
+PARSE_CACHE_DIR = 'parsecache'
+
+
+# This hashes uploaded files as they stream in, before they get written
+# anywhere, and puts the digests in request.upload_digests keyed by the name
+# of the form field.  It has to be the first of the FILE_UPLOAD_HANDLERS,
+# since it hands every chunk on to the handlers after it.
+class HashingUploadHandler(FileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'upload_digests'):
+            self.request.upload_digests = {}
+        self.request.upload_digests[self.field_name] = self.hash.hexdigest()
+        return None
+
+
+def parseCacheName(digest):
+    return '{}/{}-{}.jsonl.gz'.format(PARSE_CACHE_DIR, digest, parseCacheVersion())
+
+
+def parseCacheVersion():
+    config = [LAYOUT_VERSION, RULES_VERSION, PARSE_CACHE_VERSION, settings.TANF_DUPLICATE_CHECK]
+    if settings.TANF_DUPLICATE_CHECK == 'bloom':
+        config.append(settings.TANF_DUPLICATE_BLOOM_CAPACITY)
+    return hashlib.sha1(json.dumps(config).encode()).hexdigest()[:16]
+
+
+# Every upload that uses an entry has an empty file in the directory for
+# its digest, and a file with the digest in it, so that deleting the upload
+# can find the entry.
+def parseCacheUsers(digest):
+    return '{}/uploads/{}'.format(PARSE_CACHE_DIR, digest)
+
+
+def parseCacheDigest(file):
+    return '{}/digests/{}'.format(PARSE_CACHE_DIR, file)
+
+
+# This gives back the indexes of the ssns in the values of converter.
+def ssnIndexes(rt, converter):
+    return [i for i, field in enumerate(converter.fields) if field in rt.ssnfields]
+
+
+def encodeValue(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError('cannot put {!r} in the parse cache'.format(value))
+
+
+# This collects the validated records of an import while importResumable()
+# stores them, and saves them as the entry for digest once the whole file
+# has been parsed.  The records are spooled to a local temp file in the
+# meantime, so they don't have to be kept in memory.  context is the
+# import's, which has the header by the time there are any records.
+class ParseCacheWriter:
+    def __init__(self, digest):
+        self.digest = digest
+        self.spool = tempfile.TemporaryFile(mode='w+')
+        self.ssnindexes = {}
+
+    def __repr__(self):
+        return '<ParseCacheWriter {}>'.format(self.digest)
+
+    def record(self, records, context):
+        for rt, converter, converted, reasons in records:
+            values = converted
+            if rt.ssnfields and context['header']['encryptionindicator'] == 'E':
+                indexes = self.ssnindexes.get(converter)
+                if indexes is None:
+                    indexes = self.ssnindexes[converter] = ssnIndexes(rt, converter)
+                values = list(converted)
+                for i in indexes:
+                    values[i] = encryptSsn(values[i])
+            self.spool.write(json.dumps([rt.prefix, converter.layout.name, values, reasons], default=encodeValue))
+            self.spool.write('\n')
+            yield rt, converter, converted, reasons
+
+    # Nothing gets saved if the file had lines that couldn't be parsed,
+    # which is what context['errors'] will complain about.
+    def save(self, context):
+        try:
+            if len(context['errors']):
+                return
+            meta = {'header': context['header'], 'trailer': context['trailer'], 'lines': context['lines']}
+            self.spool.seek(0)
+            with tempfile.TemporaryFile() as entry:
+                with gzip.GzipFile(fileobj=entry, mode='wb') as compressed:
+                    compressed.write((json.dumps(meta) + '\n').encode())
+                    for line in self.spool:
+                        compressed.write(line.encode())
+                entry.seek(0)
+                name = parseCacheName(self.digest)
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                default_storage.save(name, File(entry))
+        finally:
+            self.spool.close()
+
+
+# This gives back the context and records of the entry for digest, ready to
+# hand to storeRecords(), or None if there isn't one.
+def readParseCache(digest):
+    name = parseCacheName(digest)
+    try:
+        f = default_storage.open(name, 'rb')
+    except (FileNotFoundError, OSError):
+        return None
+    lines = gzip.GzipFile(fileobj=f, mode='rb')
+    meta = json.loads(lines.readline())
+    context = newContext(meta['header'])
+    context['trailer'] = meta['trailer']
+    context['lines'] = meta['lines']
+    encrypted = meta['header']['encryptionindicator'] == 'E'
+
+    def records():
+        try:
+            for line in lines:
+                prefix, layoutname, converted, reasons = json.loads(line)
+                rt = recordtypes[prefix]
+                converter = recordconverters[layoutname]
+                for i in converter.dateindexes:
+                    if converted[i] is not None:
+                        converted[i] = datetime.date.fromisoformat(converted[i])
+                if encrypted and rt.ssnfields:
+                    for i in ssnIndexes(rt, converter):
+                        converted[i] = decryptSsn(converted[i])
+                yield rt, converter, tuple(converted), reasons
+        finally:
+            lines.close()
+            f.close()
+    return context, records()
+
+
+# This stores the records of the entry for digest in the db, like
+# importResumable() would have, imported at now.  It gives back False if
+# there is no entry for digest.
+def loadParseCache(digest, user, now=None):
+    cached = readParseCache(digest)
+    if cached is None:
+        return False
+    context, records = cached
+    storeRecords(records, context, user, now)
+    return True
+
+
+# This deletes entries that are older than maxage seconds, and then the
+# oldest entries until all of them together are no bigger than maxsize.
+def evictParseCache(maxage=None, maxsize=None):
+    maxage = settings.TANF_PARSE_CACHE_MAX_AGE if maxage is None else maxage
+    maxsize = settings.TANF_PARSE_CACHE_MAX_SIZE if maxsize is None else maxsize
+    try:
+        names = default_storage.listdir(PARSE_CACHE_DIR)[1]
+    except (FileNotFoundError, OSError):
+        return
+
+    now = timezone.now()
+    entries = []
+    for name in names:
+        path = PARSE_CACHE_DIR + '/' + name
+        try:
+            modified = default_storage.get_modified_time(path)
+            size = default_storage.size(path)
+        except (FileNotFoundError, OSError):
+            continue
+        if timezone.is_naive(modified):
+            modified = timezone.make_aware(modified)
+        entries.append((modified, size, path))
+
+    entries.sort()
+    total = sum(size for modified, size, path in entries)
+    evicted = set()
+    for modified, size, path in entries:
+        if (now - modified).total_seconds() <= maxage and total <= maxsize:
+            continue
+        try:
+            default_storage.delete(path)
+        except (FileNotFoundError, OSError):
+            continue
+        total -= size
+        evicted.add(path[len(PARSE_CACHE_DIR) + 1:].split('-', 1)[0])
+
+    # Once the last entry for a digest is gone, nothing is using it anymore.
+    kept = {path[len(PARSE_CACHE_DIR) + 1:].split('-', 1)[0] for modified, size, path in entries if default_storage.exists(path)}
+    for digest in evicted - kept:
+        forgetParseCache(digest)
+
+
+# This says that the upload file uses the entry for digest, whether it
+# stored the records from it or wrote it.
+def useParseCache(digest, file):
+    for name, content in [(parseCacheUsers(digest) + '/' + file, ''), (parseCacheDigest(file), digest)]:
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(content.encode()))
+
+
+# This is for when the upload file gets deleted.  If it was the last upload
+# that used its entry, the entry gets deleted too.
+def releaseParseCache(file):
+    digestname = parseCacheDigest(file)
+    try:
+        with default_storage.open(digestname, 'rb') as f:
+            digest = f.read().decode()
+    except (FileNotFoundError, OSError):
+        return
+    default_storage.delete(parseCacheUsers(digest) + '/' + file)
+    default_storage.delete(digestname)
+    try:
+        if default_storage.listdir(parseCacheUsers(digest))[1]:
+            return
+    except (FileNotFoundError, OSError):
+        pass
+    deleteParseCache(digest)
+
+
+# This deletes the files that say which uploads use the entries for digest.
+def forgetParseCache(digest):
+    try:
+        files = default_storage.listdir(parseCacheUsers(digest))[1]
+    except (FileNotFoundError, OSError):
+        return
+    for file in files:
+        default_storage.delete(parseCacheDigest(file))
+        default_storage.delete(parseCacheUsers(digest) + '/' + file)
+
+
+# This deletes the entries for digest, from every version of the layouts.
+def deleteParseCache(digest):
+    try:
+        names = default_storage.listdir(PARSE_CACHE_DIR)[1]
+    except (FileNotFoundError, OSError):
+        return
+    for name in names:
+        if name.startswith(digest + '-'):
+            default_storage.delete(PARSE_CACHE_DIR + '/' + name)
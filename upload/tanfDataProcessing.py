@@ -1,763 +1,693 @@
+import collections
+import concurrent.futures
+import itertools
 import json
+import mmap
 import struct
-import re
+import django
 from datetime import datetime
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateField, IntegerField, CharField, Q, Case, When, Value
+from django.db.models.functions import Concat
 from django.utils.timezone import make_aware
-from upload.models import Family, Adult, Child, ClosedPerson, AggregatedData, ClosedCase, FamiliesByStratumData
-
-
-##########################################################################
-# This is where the record types are defined:  The keys are the json
-# names for the fields, and the values are the size of the fields in bytes.
-# The field sizes and names are derived from the documentation under
-# https://www.acf.hhs.gov/ofa/resource/tanfedit/index
-
-# header records
-header_fields = {
-    "title": 6,
-    "calendarquarter": 5,
-    "datatype": 1,
-    "statefipscode": 2,
-    "tribecode": 3,
-    "programtype": 3,
-    "editindicator": 1,
-    "encryptionindicator": 1,
-    "updateindicator": 1
+from upload.models import Family, Adult, Child, ClosedPerson, AggregatedData, ClosedCase, FamiliesByStratumData, ImportCheckpoint
+from tanfparser.errors import ErrorSink, TANFParseError, UNKNOWN_RECORD, SHORT_LINE
+from tanfparser.records import recordtypes, LayoutCache, getRecordType
+from tanfparser.rules import recordrules
+from tanfparser.reader import mappedLines, offsetLines, lineText
+from tanfparser.ssn import decryptSsn
+from tanfparser.layouts import sliceGetter
+from tanfparser.values import parseDateBytes, parseIntBytes
+from tanfparser.caseindex import CaseIndex, caseKey, NO_FAMILY, UNKNOWN_PERSON
+from tanfparser.duplicates import DuplicateCheck, BloomFilter
+from tanfparser.pipeline import Pipeline, Sink, batches
+
+
+# A closed case means that the family is no longer around.  closed is the
+# ClosedCases that an import stored, and they are read back in batches so
+# each batch of families goes in one delete.
+def closeCases(closed, batchsize=500):
+    cases = list(closed.values_list('calendar_quarter', 'casenumber', 'countyfipscode', 'zipcode'))
+    for i in range(0, len(cases), batchsize):
+        families = Q()
+        for quarter, casenumber, countyfipscode, zipcode in cases[i:i + batchsize]:
+            families |= Q(calendar_quarter=quarter, casenumber=casenumber, countyfipscode=countyfipscode, zipcode=zipcode)
+        Family.objects.filter(families).delete()
+
+    # # XXX do we delete associated person records too?
+    # Adult.objects.filter(calendar_quarter=header['calendarquarter'], casenumber=data['casenumber']).delete()
+    # Child.objects.filter(calendar_quarter=header['calendarquarter'], casenumber=data['casenumber']).delete()
+
+
+# A closed person means that the adult or child is no longer around.  The
+# children are in T3 records that can have two of them, so if only one of
+# them is closed, that child's fields are blanked out (like they are for a
+# T3 with one child) and the other one stays.  Closed people that are
+# invalid (see checkClosedPeople()) don't close anybody.
+def closePeople(closed, batchsize=500):
+    people = list(closed.filter(valid=True).values_list('calendar_quarter', 'casenumber', 'socialsecuritynumber'))
+    for i in range(0, len(people), batchsize):
+        batch = set(people[i:i + batchsize])
+        adults = Q()
+        children = Q()
+        for quarter, casenumber, ssn in batch:
+            adults |= Q(calendar_quarter=quarter, casenumber=casenumber, socialsecuritynumber=ssn)
+            children |= Q(Q(socialsecuritynumber_1=ssn) | Q(socialsecuritynumber_2=ssn), calendar_quarter=quarter, casenumber=casenumber)
+        Adult.objects.filter(adults).delete()
+
+        deleted = []
+        cleared = {'1': [], '2': []}
+        for pk, quarter, casenumber, *ssns in Child.objects.filter(children).values_list(
+                'id', 'calendar_quarter', 'casenumber', 'socialsecuritynumber_1', 'socialsecuritynumber_2'):
+            staying = [suffix for suffix, ssn in zip('12', ssns) if ssn and (quarter, casenumber, ssn) not in batch]
+            if staying:
+                cleared['2' if staying == ['1'] else '1'].append(pk)
+            else:
+                deleted.append(pk)
+        Child.objects.filter(id__in=deleted).delete()
+        for suffix, ids in cleared.items():
+            Child.objects.filter(id__in=ids).update(**childfields[suffix])
+
+
+# These are the fields of the first and second child on a T3, and what they
+# are when that child isn't there.
+childfields = {suffix: {field.name: None if field.null else '' for field in Child._meta.fields if field.name.endswith('_' + suffix)}
+               for suffix in '12'}
+
+
+# A RecordStore knows how one kind of record gets stored in the db:
+#  model:       the model that the records are stored in (which is also
+#               where the types of the fields come from, see RecordConverter)
+#  rules:       the validation rules for the records, if there are any
+#  closes:      what the records close once the import that stored them
+#               has gone through, given the queryset of them (see
+#               closeRecords())
+class RecordStore:
+    def __init__(self, model, rules=None, closes=None):
+        self.model = model
+        self.rules = rules
+        self.closes = closes
+
+    def __repr__(self):
+        return '<RecordStore {}>'.format(self.model.__name__)
+
+
+# This is how each kind of record in tanfparser.recordtypes is stored, keyed
+# by the record type prefix.  The header and trailer aren't stored.
+recordstores = {
+    'T1': RecordStore(Family, rules=recordrules['T1']),
+    'T2': RecordStore(Adult, rules=recordrules['T2']),
+    'T3': RecordStore(Child, rules=recordrules['T3']),
+    'T4': RecordStore(ClosedCase, closes=closeCases),
+    'T5': RecordStore(ClosedPerson, closes=closePeople),
+    'T6': RecordStore(AggregatedData),
+    'T7': RecordStore(FamiliesByStratumData),
 }
 
-# T1 records
-section1_familydata_fields = {
-    "recordtype": 2,
-    "reportingmonth": 6,
-    "casenumber": 11,
-    "countyfipscode": 3,
-    "stratum": 2,
-    "zipcode": 5,
-    "fundingstream": 1,
-    "disposition": 1,
-    "newapplicant": 1,
-    "numfamilymembers": 2,
-    "typeoffamilyforworkparticipation": 1,
-    "receivessubsidizedhousing": 1,
-    "receivesmedicalassistance": 1,
-    "receivesfoodstamps": 1,
-    "amtoffoodstampassistance": 4,
-    "receivessubsidizedchildcare": 1,
-    "amtofsubsidizedchildcare": 4,
-    "amtofchildsupport": 4,
-    "amtoffamilycashresources": 4,
-    "cash_amount": 4,
-    "cash_nbr_month": 3,
-    "tanfchildcare_amount": 4,
-    "tanfchildcare_children_covered": 2,
-    "tanfchildcare_nbr_months": 3,
-    "transportation_amount": 4,
-    "transportation_nbr_months": 3,
-    "transitionalservices_amount": 4,
-    "transitionalservices_nbr_months": 3,
-    "other_amount": 4,
-    "other_nbr_months": 3,
-    "sanctionsreduction_amt": 4,
-    "workrequirementssanction": 1,
-    "familysanctionforadultnohsdiploma": 1,
-    "sanctionforteenparentnotattendingschool": 1,
-    "noncooperatewithchildsupport": 1,
-    "failuretocomploywithirp": 1,
-    "othersanction": 1,
-    "recoupmentofprioroverpayment": 4,
-    "othertotalreductionamt": 4,
-    "familycap": 1,
-    "reductionbasedonlengthofreceiptofassistance": 1,
-    "othernonsanction": 1,
-    "waiver_evaluation_control_gprs": 1,
-    "tanffamilyexemptfromtimelimits": 2,
-    "tanffamilynewchildonlyfamily": 1,
-    # "blank": 39
-}
-
-# T2 records
-section1_adultdata_fields = {
-    "recordtype": 2,
-    "reportingmonth": 6,
-    "casenumber": 11,
-    "familyafilliation": 1,
-    "noncustodialparent": 1,
-    "dateofbirth": 8,
-    "socialsecuritynumber": 9,
-    "racehispanic": 1,
-    "racenativeamerican": 1,
-    "raceasian": 1,
-    "raceblack": 1,
-    "racewhite": 1,
-    "gender": 1,
-    "oasdibenefits": 1,
-    "nonssabenefits": 1,
-    "titlexivapdtbenefits": 1,
-    "titlexviaabdbenefits": 1,
-    "titlexvissibenefits": 1,
-    "maritalstatus": 1,
-    "relationshiptohh": 2,
-    "parentminorchild": 1,
-    "pregnantneeds": 1,
-    "educationlevel": 2,
-    "citizenship": 1,
-    "coopwithchildsupport": 1,
-    "countablemonths": 3,
-    "countablemonthsremaining": 2,
-    "currentmonthexempt": 1,
-    "employmentstatus": 1,
-    "workeligibleindicator": 2,
-    "workparticipationstatus": 2,
-    "unsubsidizedemployment": 2,
-    "subsidizedprivateemployment": 2,
-    "subsidizedpublicemployment": 2,
-    "workexperiencehours": 2,
-    "workexperienceexcusedabsences": 2,
-    "workexperienceholidays": 2,
-    "onthejobtraining": 2,
-    "jobsearchhours": 2,
-    "jobsearchexcusedabsences": 2,
-    "jobsearchholidays": 2,
-    "communitysvchours": 2,
-    "communitysvcexcusedabsences": 2,
-    "communitysvcholidays": 2,
-    "vocationaltraininghours": 2,
-    "vocationaltrainingexcusedabsences": 2,
-    "vocationaltrainingholidays": 2,
-    "jobskillshours": 2,
-    "jobskillsexcusedabsences": 2,
-    "jobskillsholidays": 2,
-    "eduwithnodiplomahours": 2,
-    "eduwithnodiplomaexcusedabsences": 2,
-    "eduwithnodiplomaholidays": 2,
-    "satisfactoryschoolhours": 2,
-    "satisfactoryschoolexcusedabsences": 2,
-    "satisfactoryschoolholidays": 2,
-    "providingchildcarehours": 2,
-    "providingchildcareexcusedabsences": 2,
-    "providingchildcareholidays": 2,
-    "otherwork": 2,
-    "corehoursforoverallrate": 2,
-    "corehoursfortwoparentrate": 2,
-    "earnedincome": 4,
-    "unearnedincomeincometaxcredit": 4,
-    "unearnedincomesocialsecurity": 4,
-    "unearnedincomessi": 4,
-    "unearnedincomeworkerscomp": 4,
-    "unearnedincomeother": 4,
-}
-
-# T3 records
-# These are the full fields as depicted in
-# https://www.acf.hhs.gov/sites/default/files/ofa/tanf_data_report_section1_10_2008.pdf
-section1_childdata_fields = {
-    "recordtype": 2,
-    "reportingmonth": 6,
-    "casenumber": 11,
-
-    "familyafilliation_1": 1,
-    "dateofbirth_1": 8,
-    "socialsecuritynumber_1": 9,
-    "racehispanic_1": 1,
-    "racenativeamerican_1": 1,
-    "raceasian_1": 1,
-    "raceblack_1": 1,
-    "racepacific_1": 1,
-    "racewhite_1": 1,
-    "gender_1": 1,
-    "nonssabenefits_1": 1,
-    "titlexvissibenefits_1": 1,
-    "relationshiptohh_1": 2,
-    "parentminorchild_1": 1,
-    "educationlevel_1": 2,
-    "citizenship_1": 1,
-    "unearnedincomessi_1": 4,
-    "unearnedincomeother_1": 4,
-
-    "familyafilliation_2": 1,
-    "dateofbirth_2": 8,
-    "socialsecuritynumber_2": 9,
-    "racehispanic_2": 1,
-    "racenativeamerican_2": 1,
-    "raceasian_2": 1,
-    "raceblack_2": 1,
-    "racepacific_2": 1,
-    "racewhite_2": 1,
-    "gender_2": 1,
-    "nonssabenefits_2": 1,
-    "titlexvissibenefits_2": 1,
-    "relationshiptohh_2": 2,
-    "parentminorchild_2": 1,
-    "educationlevel_2": 2,
-    "citizenship_2": 1,
-    "unearnedincomessi_2": 4,
-    "unearnedincomeother_2": 4,
-
-    "blank": 55,
-
-    "jobsearchhours": 2,
-    "jobsearchexcusedabsences": 2,
-    "jobsearchholidays": 2,
-    "communitysvchours": 2,
-    "communitysvcexcusedabsences": 2,
-    "communitysvcholidays": 2,
-    "vocationaltraininghours": 2,
-    "vocationaltrainingexcusedabsences": 2,
-    "vocationaltrainingholidays": 2,
-    "jobskillshours": 2,
-    "jobskillsexcusedabsences": 2,
-    "jobskillsholidays": 2,
-    "eduwithnodiplomahours": 2,
-    "eduwithnodiplomaexcusedabsences": 2,
-    "eduwithnodiplomaholidays": 2,
-    "satisfactoryschoolhours": 2,
-    "satisfactoryschoolexcusedabsences": 2,
-    "satisfactoryschoolholidays": 2,
-    "providingchildcarehours": 2,
-    "providingchildcareexcusedabsences": 2,
-    "providingchildcareholidays": 2,
-    "otherwork": 2,
-    "corehoursforoverallrate": 2,
-    "corehoursfortwoparentrate": 2,
-    "earnedincome": 4,
-    "unearnedincomeincometaxcredit": 4,
-    "unearnedincomesocialsecurity": 4,
-    "unearnedincomessi": 4,
-    "unearnedincomeworkerscomp": 4,
-    "unearnedincomeother": 4,
-}
-
-# T3 records:  Our example data seems to be missing a character and is otherwise truncated,
-#      so let's hope that 3 chars for the last field is OK.
-section1_childdata_fields_exampledata = {
-    "recordtype": 2,
-    "reportingmonth": 6,
-    "casenumber": 11,
-
-    "familyafilliation_1": 1,
-    "dateofbirth_1": 8,
-    "socialsecuritynumber_1": 9,
-    "racehispanic_1": 1,
-    "racenativeamerican_1": 1,
-    "raceasian_1": 1,
-    "raceblack_1": 1,
-    "racepacific_1": 1,
-    "racewhite_1": 1,
-    "gender_1": 1,
-    "nonssabenefits_1": 1,
-    "titlexvissibenefits_1": 1,
-    "relationshiptohh_1": 2,
-    "parentminorchild_1": 1,
-    "educationlevel_1": 2,
-    "citizenship_1": 1,
-    "unearnedincomessi_1": 4,
-    "unearnedincomeother_1": 3,
-}
-
-# T3 records:  Our example data seems to be missing a character, sometimes
-#      has 2 children in it and is also truncated,
-#      so let's hope that 3 chars for the last field of the first child is OK.
-section1_childdata_fields_twochild = {
-    "recordtype": 2,
-    "reportingmonth": 6,
-    "casenumber": 11,
-
-    "familyafilliation_1": 1,
-    "dateofbirth_1": 8,
-    "socialsecuritynumber_1": 9,
-    "racehispanic_1": 1,
-    "racenativeamerican_1": 1,
-    "raceasian_1": 1,
-    "raceblack_1": 1,
-    "racepacific_1": 1,
-    "racewhite_1": 1,
-    "gender_1": 1,
-    "nonssabenefits_1": 1,
-    "titlexvissibenefits_1": 1,
-    "relationshiptohh_1": 2,
-    "parentminorchild_1": 1,
-    "educationlevel_1": 2,
-    "citizenship_1": 1,
-    "unearnedincomessi_1": 4,
-    "unearnedincomeother_1": 3,
-
-    "familyafilliation_2": 1,
-    "dateofbirth_2": 8,
-    "socialsecuritynumber_2": 9,
-    "racehispanic_2": 1,
-    "racenativeamerican_2": 1,
-    "raceasian_2": 1,
-    "raceblack_2": 1,
-    "racepacific_2": 1,
-    "racewhite_2": 1,
-    "gender_2": 1,
-    "nonssabenefits_2": 1,
-    "titlexvissibenefits_2": 1,
-    "relationshiptohh_2": 2,
-    "parentminorchild_2": 1,
-    "educationlevel_2": 2,
-    "citizenship_2": 1,
-    "unearnedincomessi_2": 4,
-    "unearnedincomeother_2": 4,
-}
-
-
-# T4 records
-section2_closedcase_fields = {
-    "recordtype": 2,
-    "reportingmonth": 6,
-    "casenumber": 11,
-    "countyfipscode": 3,
-    "stratum": 2,
-    "zipcode": 5,
-    "disposition": 1,
-    "reason": 2,
-    "receivessubsidizedhousing": 1,
-    "receivesmedicalassistance": 1,
-    "receivesfoodstamps": 1,
-    "receivessubsidizedchildcare": 1,
-}
-
-# T5 records
-section2_closedperson_fields = {
-    "recordtype": 2,
-    "reportingmonth": 6,
-    "casenumber": 11,
-    "familyafilliation": 1,
-    "dateofbirth": 8,
-    "socialsecuritynumber": 9,
-    "racehispanic": 1,
-    "racenativeamerican": 1,
-    "raceasian": 1,
-    "raceblack": 1,
-    "racepacific": 1,
-    "racewhite": 1,
-    "gender": 1,
-    "oasdibenefits": 1,
-    "nonssabenefits": 1,
-    "titlexivapdtbenefits": 1,
-    "titlexviaabdbenefits": 1,
-    "titlexvissibenefits": 1,
-    "maritalstatus": 1,
-    "relationshiptohh": 2,
-    "parentminorchild": 1,
-    "pregnantneeds": 1,
-    "educationlevel": 2,
-    "citizenship": 1,
-    "countablemonths": 3,
-    "countablemonthsremaining": 2,
-    "employmentstatus": 1,
-    "earnedincome": 4,
-    "unearnedincome": 4,
-}
-
-# T6 records
-section3_aggregatedata_fields = {
-    "recordtype": 2,
-    # XXX many more fields need to be added here
-}
 
-# T7 records
-section4_familiesbystratum_fields = {
-    "recordtype": 2,
-    # XXX many more fields need to be added here
-}
-
-# trailer records
-trailer_fields = {
-    "title": 7,
-    "numrecords": 7,
-    # "blank": 9
-}
-
-# The record type definitions end here.
-##########################################################################
-
-
-# This parses a particular record and gives back a dictionary
-def parseFields(fieldinfo, linestring):
-    fields = list(fieldinfo.keys())
-    fieldwidths = list(fieldinfo.values())
-    fmtstring = ' '.join('{}{}'.format(abs(fw), 'x' if fw < 0 else 's')
-                         for fw in fieldwidths)
-    fieldstruct = struct.Struct(fmtstring)
-    unpack = fieldstruct.unpack_from
-    parse = lambda line: tuple(s.decode() for s in unpack(line.encode()))
-    return dict(zip(fields, parse(linestring)))
-
-
-# This is the simple subtitution cipher
-encryptmap = {
-    '1': '@',
-    '2': '9',
-    '3': 'Z',
-    '4': 'P',
-    '5': '0',
-    '6': '#',
-    '7': 'Y',
-    '8': 'B',
-    '9': 'W',
-    '0': 'T',
-}
-decryptmap = {}
-for k, v in encryptmap.items():
-    decryptmap[v] = k
-
-
-# This decrypts the ssn using the silly substitution cipher
-def decryptSsn(ssn):
-    result = ''
-    for z in ssn:
-        try:
-            result = result + decryptmap[z]
-        except Exception:
-            result = result + z
-    # # Put dashes into SSN
-    # if len(result) == 9:
-    #   result = result[:5] + '-' + result[5:]
-    #   result = result[:3] + '-' + result[3:]
-    return result
+def decryptStrippedSsn(ssn):
+    return decryptSsn(ssn.strip())
 
 
+# A RecordConverter turns a line into the types that the model for the
+# record type wants, in one pass:  IntegerFields go straight from the bytes
+# in the file to ints with parseIntBytes(), DateFields go through
+# parseDateBytes(), and everything else is a string with the padding
+# stripped off.  Fields in the layout that the model doesn't have (like
+# blank) are dropped.
 #
-# This function parses the txt files that are sent by STT people to the TDRS
-# app and returns a json document.
+# The text fields are cut out of the line decoded as a whole, since one
+# decode of the line is a lot cheaper than decoding each field by itself,
+# and most of the fields in the models are text.  The numbers and dates
+# never get decoded.  fields has the text fields first, then the rest.
 #
-# Possible tricky bits:
-#  1) We do not parse the fields at all, but just pull them
-#     in as strings.  So we don't do any type parsing or anything.  That might
-#     better be done by code that consumes the json doc and stores it.
-#  2) The social security numbers do not have dashes put into them, which may
-#     not be the way they are parsed/stored in the existing system.
+# They are made once for every layout that gets stored, from the model
+# field metadata, so there is nothing to figure out per line and the ORM has
+# nothing left to coerce.
+class RecordConverter:
+    def __init__(self, layout, model, ssnfields=()):
+        modelfields = {field.name: field for field in model._meta.get_fields()}
+        self.layout = layout
+        self.model = model
+        textfields = []
+        numberfields = []
+        numberconverters = []
+        intfields = []
+        datefields = []
+        for field in layout.fields:
+            modelfield = modelfields.get(field)
+            if modelfield is None:
+                continue
+            if isinstance(modelfield, IntegerField):
+                numberfields.append(field)
+                numberconverters.append(parseIntBytes)
+                intfields.append(field)
+            elif isinstance(modelfield, DateField):
+                numberfields.append(field)
+                numberconverters.append(parseDateBytes)
+                datefields.append(field)
+            else:
+                textfields.append(field)
+        self.textfields = tuple(textfields)
+        self.fields = tuple(textfields + numberfields)
+        self.intfields = tuple(intfields)
+        self.datefields = tuple(datefields)
+        self.dateindexes = tuple(i for i, field in enumerate(self.fields) if field in datefields)
+        self.converters = [str.strip] * len(textfields) + numberconverters
+        self.encryptedconverters = [decryptStrippedSsn if field in ssnfields else str.strip for field in textfields] + numberconverters
+        self._text = sliceGetter([layout.slices[field] for field in textfields])
+        self._numbers = sliceGetter([layout.slices[field] for field in numberfields])
+
+    def __repr__(self):
+        return '<RecordConverter {} -> {}>'.format(self.layout.name, self.model.__name__)
+
+    # This gives back the values for self.fields.  If the file is encrypted,
+    # the ssns get decrypted on the way through too.
+    def convert(self, line, encrypted=False):
+        self.layout.checkSize(line)
+        line = bytes(line)
+        values = self._text(str(line, 'utf-8')) + self._numbers(line)
+        converters = self.encryptedconverters if encrypted else self.converters
+        return tuple([convert(value) for convert, value in zip(converters, values)])
+
+    # Anything that came out as None but wasn't blank in the file wasn't a
+    # number or a date when it should have been.
+    def problems(self, line, converted):
+        problems = []
+        numbers = converted[len(self.textfields):]
+        if None not in numbers:
+            return problems
+        for field, raw, value in zip(self.fields[len(self.textfields):], self._numbers(bytes(line)), numbers):
+            if value is None and raw.strip():
+                problems.append('{} is not a valid {}: {}'.format(field, 'date' if field in self.datefields else 'number', raw.decode('utf-8', 'replace')))
+        return problems
+
+
+# This is a converter for every layout that gets stored in the db.
+recordconverters = {}
+for _prefix, _store in recordstores.items():
+    _rt = recordtypes[_prefix]
+    for _layout in _rt.layouts:
+        recordconverters[_layout.name] = RecordConverter(_layout, _store.model, _rt.ssnfields)
+
+
+# This parses the lines of a TANF file into records that are ready to go into
+# the db, and gives back (recordtype, converter, values, problems) for each of
+# them.  values are the typed values for converter.fields, and problems is a
+# list of things wrong with the data that should make the record fail
+# validation.
 #
-# This code must be run with python 3.6 or above, because it preserves
-# the order of dictionaries, which we need for this to work.
+# The header and trailer are put in context as they go by, and the lines
+# that we couldn't figure out what to do with go to the ErrorSink in
+# context['errors'].  If the header has already been parsed (like it has
+# been for the chunks that parseParallel() hands out), it should already be
+# in context.  context['lines'] is how many lines have been read, counting
+# the lineoffset lines before these ones.
 #
-#
-# XXX The fields here are incomplete.  More work is required to
-#     make this parse all record types and all sections.
-#
-def tanf2json(f):
-    # This is the TANF data structure which we fill up with data and convert
-    # into json at the end.
-    tanfdata = {
-        'header': {},
-        'section1_familydata': [],
-        'section1_adultdata': [],
-        'section1_childdata': [],
-        'section2_closedcasedata': [],
-        'section2_closedpersondata': [],
-        'section3_aggregatedata': [],
-        'section4_familiesbystratumdata': [],
-        'trailer': ()
-    }
-
-    # This is the list of lines that we couldn't figure out what to do with
-    errorlines = []
-
-    # XXX really need to make this write to a stream rather than memory
-    #     Write records into db or files, then serialize into json?
-    for line in f:
-        line = line.decode('utf-8')
+# If offsets is True, lines are the (offset, line) pairs that offsetLines()
+# gives back, and context['offset'] is where the line after the last record
+# starts.
+def parseRecords(lines, context, offsets=False, lineoffset=0):
+    layouts = LayoutCache()
+    errors = context['errors']
+    for lineno, line in enumerate(lines, lineoffset + 1):
+        context['lines'] = lineno
+        if offsets:
+            context['offset'], line = line
 
         # skip blank lines
-        if line in ['\n', '\r\n']:
+        if not line:
             continue
 
-        if re.match(r'^T1', line):
-            tanfdata['section1_familydata'].append(parseFields(section1_familydata_fields, line))
-
-        elif re.match(r'^T2', line):
-            adult = parseFields(section1_adultdata_fields, line)
-            if tanfdata['header']['encryptionindicator'] == 'E':
-                adult['socialsecuritynumber'] = decryptSsn(adult['socialsecuritynumber'])
-            tanfdata['section1_adultdata'].append(adult)
-
-        elif re.match(r'^T3', line):
-            child = parseFields(section1_childdata_fields, line)
-            if tanfdata['header']['encryptionindicator'] == 'E':
-                child['socialsecuritynumber_1'] = decryptSsn(child['socialsecuritynumber_1'])
-                try:
-                    child['socialsecuritynumber_2'] = decryptSsn(child['socialsecuritynumber_2'])
-                except KeyError:
-                    # This is because our sample data seems not to have all the fields we ought to have,
-                    # so we are just handling the situation in case it gets put in later.
-                    pass
-            tanfdata['section1_childdata'].append(child)
-
-        elif re.match(r'^T4', line):
-            tanfdata['section2_closedcasedata'].append(parseFields(section2_closedcase_fields, line))
-
-        elif re.match(r'^T5', line):
-            person = parseFields(section2_closedperson_fields, line)
-            if tanfdata['header']['encryptionindicator'] == 'E':
-                person['socialsecuritynumber'] = decryptSsn(person['socialsecuritynumber'])
-            tanfdata['section2_closedpersondata'].append(person)
-
-        elif re.match(r'^T6', line):
-            tanfdata['section3_aggregatedata'].append(parseFields(section3_aggregatedata_fields, line))
-
-        elif re.match(r'^T7', line):
-            tanfdata['section4_familiesbystratumdata'].append(parseFields(section4_familiesbystratum_fields, line))
-
-        elif re.match(r'^HEADER', line):
-            tanfdata['header'] = parseFields(header_fields, line)
-
-        elif re.match(r'^TRAILER', line):
-            tanfdata['trailer'] = parseFields(trailer_fields, line)
-
-        else:
-            errorlines.append(line)
-
-    if len(errorlines) > 0:
-        raise Exception('could not parse lines', errorlines)
-
-    # return what we found out as a json document
-    return json.dumps(tanfdata)
+        rt = getRecordType(line)
+        if rt is None:
+            errors.add(lineno, UNKNOWN_RECORD, lineText(line))
+            continue
 
+        try:
+            layout = layouts.layoutFor(rt, line)
+        except struct.error:
+            errors.add(lineno, SHORT_LINE, lineText(line))
+            continue
 
-def section1_familydata_check(data):
-    # XXX need to check stuff actually here!
-    reasons = []
-    status = {
-        'check': True,
-        'reasons': ", ".join(reasons)
+        try:
+            if rt.section == 'header':
+                context['header'] = layout.parse(line)
+                continue
+            if rt.section == 'trailer':
+                context['trailer'] = layout.parse(line)
+                continue
+            converter = recordconverters[layout.name]
+            converted = converter.convert(line, context['header']['encryptionindicator'] == 'E')
+        except Exception as e:
+            print('Parsing ' + rt.prefix + ':', e, lineText(line))
+            raise e
+
+        yield rt, converter, converted, converter.problems(line, converted)
+
+
+def newContext(header=None, errors=None):
+    if errors is None:
+        errors = ErrorSink(keep=settings.TANF_ERROR_SAMPLES, threshold=settings.TANF_ERROR_THRESHOLD)
+    return {
+        'header': header or {},
+        'trailer': {},
+        'errors': errors,
+        'lines': 0,
+        'offset': 0,
     }
-    return status
 
 
-def section1_adultdata_check(data):
-    # XXX need to check stuff actually here!
-    reasons = []
-    status = {
-        'check': True,
-        'reasons': ", ".join(reasons)
+# This gives back the DuplicateCheck for an import that settings ask for,
+# or None if imports shouldn't look for duplicates.
+def newDuplicateCheck():
+    if settings.TANF_DUPLICATE_CHECK == 'off':
+        return None
+    if settings.TANF_DUPLICATE_CHECK == 'bloom':
+        return DuplicateCheck(BloomFilter(settings.TANF_DUPLICATE_BLOOM_CAPACITY))
+    return DuplicateCheck()
+
+
+# This runs the validation rules over a batch of records, and gives back the
+# reasons that each of them is invalid (an empty list if it is valid).  The
+# records are grouped by layout so that each group can be checked in one go
+# by the rules for its record type.  If duplicates (a DuplicateCheck) is
+# given, the records that came up before are invalid too.
+def checkRecords(batch, duplicates=None):
+    reasons = [list(problems) for rt, converter, converted, problems in batch]
+    groups = {}
+    for i, (rt, converter, converted, problems) in enumerate(batch):
+        rules = recordstores[rt.prefix].rules
+        if rules is not None:
+            groups.setdefault((rules, converter), []).append(i)
+    for (rules, converter), indexes in groups.items():
+        codes = rules.checkRecords(converter.fields, [batch[i][2] for i in indexes])
+        for i, failed in zip(indexes, codes):
+            # the rule codes go first, then the things that couldn't be parsed
+            reasons[i][:0] = failed
+    if duplicates is not None:
+        found = duplicates.addMany([(rt.prefix, converter.fields, converted) for rt, converter, converted, problems in batch])
+        for i, duplicate in enumerate(found):
+            if duplicate is not None:
+                reasons[i].append(duplicate)
+    return reasons
+
+
+# This validates the records that parseRecords() or parseParallel() give
+# back, batchsize records at a time, and gives back (recordtype, converter,
+# values, reasons) for each of them in the order they came in.  duplicates
+# is for checkRecords(), and has to be the same one for the whole file.
+def validateRecords(records, duplicates=None, batchsize=1000):
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, batchsize))
+        if not batch:
+            break
+        for (rt, converter, converted, problems), reasons in zip(batch, checkRecords(batch, duplicates)):
+            yield rt, converter, converted, reasons
+
+
+# This takes the records that validateRecords() gives back and puts them
+# into the db.  now is the time they are imported at, which is right now if
+# it isn't given.
+def storeRecords(records, context, user, now=None):
+    if now is None:
+        now = make_aware(datetime.now())
+    index = CaseIndex()
+    for rt, converter, converted, reasons in records:
+        storeRecord(rt, converter, converted, reasons, context['header'], user, now)
+        index.add(rt.prefix, converter.fields, converted)
+
+    context['errors'].check()
+    checkCases(index, lambda model: model.objects.filter(imported_at=now, imported_by=user))
+
+
+def storeRecord(rt, converter, converted, reasons, header, user, now):
+    record = newRecord(rt, converter, converted, reasons, header, user, now)
+    try:
+        record.save(force_insert=True)
+    except Exception as e:
+        print('Creating ' + type(record).__name__ + ' object:', e, converted)
+        raise e
+
+
+# This gives back the model object for a record, without saving it.
+def newRecord(rt, converter, converted, reasons, header, user, now):
+    store = recordstores[rt.prefix]
+    data = dict(zip(converter.fields, converted))
+    extra = {}
+    if reasons:
+        extra = {'valid': False, 'invalidreason': ', '.join(reasons)}
+    return store.model(
+        imported_at=now,
+        imported_by=user,
+        calendar_quarter=header['calendarquarter'],
+        state_code=header['statefipscode'],
+        tribe_code=header['tribecode'],
+        # This is where all the parsed data gets added in
+        **extra,
+        **data)
+
+
+# This runs the cross record edits once a whole file has been stored (see
+# tanfparser/caseindex.py), and marks the adults and children without a
+# family, and the closed people that aren't there, invalid.
+# imported(model) is the queryset of the records of model that the import
+# stored.  The adults and children only get read back from the db if some
+# of them failed, and then only the ids and keys.
+def checkCases(index, imported):
+    for prefix, orphans in index.orphans().items():
+        model = recordstores[prefix].model
+        orphans = set(orphans.tolist())
+        ids = [pk for pk, month, casenumber in imported(model).values_list('id', 'reportingmonth', 'casenumber').iterator()
+               if caseKey(month, casenumber) in orphans]
+        markInvalid(model, ids, NO_FAMILY[prefix])
+    unknown = index.unknownClosed()
+    if len(unknown):
+        checkClosedPeople(imported(ClosedPerson), set(unknown.tolist()))
+
+
+# A closed person has to be an adult or child that was reported in the same
+# calendar quarter, in this file or an earlier one.  The ones in the file
+# are found with the CaseIndex, so this only looks in the db for the closed
+# people with the keys in unknown, batchsize at a time, with one query for
+# the adults and one for the children that they could be.
+def checkClosedPeople(closed, unknown, batchsize=500):
+    people = [(pk, quarter, casenumber, ssn) for pk, quarter, casenumber, ssn
+              in closed.values_list('id', 'calendar_quarter', 'casenumber', 'socialsecuritynumber').iterator()
+              if caseKey(casenumber, ssn) in unknown]
+    missing = []
+    for i in range(0, len(people), batchsize):
+        batch = people[i:i + batchsize]
+        quarters = {quarter for pk, quarter, casenumber, ssn in batch}
+        casenumbers = {casenumber for pk, quarter, casenumber, ssn in batch}
+        known = set(Adult.objects.filter(calendar_quarter__in=quarters, casenumber__in=casenumbers)
+                    .values_list('calendar_quarter', 'casenumber', 'socialsecuritynumber').iterator())
+        for quarter, casenumber, *ssns in (Child.objects.filter(calendar_quarter__in=quarters, casenumber__in=casenumbers)
+                                           .values_list('calendar_quarter', 'casenumber', 'socialsecuritynumber_1', 'socialsecuritynumber_2').iterator()):
+            known.update((quarter, casenumber, ssn) for ssn in ssns)
+        missing += [pk for pk, quarter, casenumber, ssn in batch if not ssn or (quarter, casenumber, ssn) not in known]
+    markInvalid(ClosedPerson, missing, UNKNOWN_PERSON)
+
+
+# This is where the closed cases and people of an import close the families
+# and people that they are for.  It only happens once the import has gone
+# through, so that a file that fails doesn't delete anything.  imported is
+# like it is for checkCases().
+def closeRecords(imported):
+    for store in recordstores.values():
+        if store.closes is not None:
+            store.closes(imported(store.model))
+
+
+# This adds code to the reasons of the records of model with the given ids,
+# unless it's already there.
+def markInvalid(model, ids, code, batchsize=500):
+    reasons = Case(When(invalidreason='', then=Value(code)), default=Concat('invalidreason', Value(', ' + code)),
+                   output_field=CharField())
+    for i in range(0, len(ids), batchsize):
+        model.objects.filter(id__in=ids[i:i + batchsize]).exclude(invalidreason__contains=code).update(valid=False, invalidreason=reasons)
+
+
+# This splits the part of a file between start and end up into about
+# chunks pieces, where every piece starts at the start of a line.
+def chunkRanges(mapped, start, chunks):
+    size = len(mapped)
+    chunksize = max(1, (size - start) // chunks)
+    ranges = []
+    while start < size:
+        end = mapped.find(b'\n', min(start + chunksize, size) - 1)
+        end = size if end < 0 else end + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+# This is what the worker processes in parseParallel() run.  It gives back
+# the records in the chunk with the record types and converters swapped out
+# for their names, since those are much cheaper to send back, along with the
+# errors (numbered from the start of the chunk) and how many lines there were.
+# Each record also has the line number it was on (from the start of the
+# chunk) and the offset of the line after it.
+#
+# The workers keep all of their errors, up to the point where the whole file
+# would be given up on, and leave the spilling and giving up to the parent.
+def parseChunk(path, start, end, header, threshold):
+    context = newContext(header, ErrorSink(keep=threshold + 1, threshold=threshold))
+    records = []
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        lines = mappedLines(mapped, start, end, offsets=True)
+        try:
+            for rt, converter, converted, problems in parseRecords(lines, context, offsets=True):
+                records.append((rt.prefix, converter.layout.name, converted, problems, context['lines'], context['offset']))
+        except TANFParseError:
+            pass
+    return records, context['trailer'], context['errors'].lines, context['lines']
+
+
+# This is the multi-core version of parseRecords() for big files that are on
+# local disk.  The header is parsed here, and then the rest of the file is
+# split up into chunks at line boundaries which get parsed by a pool of
+# workers processes, which all get a copy of the header.  The records come
+# back in the same order they are in the file.
+#
+# Only a couple of chunks per worker are in flight at once, so that if the
+# db is slower than the parsing, parsed records don't pile up in memory.
+#
+# context['lines'] and context['offset'] are kept up to date for every
+# record, just like parseRecords() does with offsets.  If start is given,
+# the parsing carries on from there, and context should already have the
+# header and the number of lines before start in it.
+def parseParallel(path, context, workers, chunksperworker=4, start=None):
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if start is None:
+                firstline = mapped.readline()
+                start = len(firstline)
+                for record in parseRecords([(start, firstline.rstrip(b'\r\n'))], context, offsets=True):
+                    # the first line isn't a header, so hand it back like any other
+                    yield record
+            ranges = chunkRanges(mapped, start, workers * chunksperworker)
+        finally:
+            mapped.close()
+
+    errors = context['errors']
+    lineoffset = context['lines']
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        pending = collections.deque()
+        ranges = iter(ranges)
+        while True:
+            while len(pending) < workers * 2:
+                chunk = next(ranges, None)
+                if chunk is None:
+                    break
+                pending.append((executor.submit(parseChunk, path, chunk[0], chunk[1], context['header'], errors.threshold), chunk[1]))
+            if not pending:
+                break
+
+            future, chunkend = pending.popleft()
+            records, trailer, chunkerrors, chunklines = future.result()
+            # the errors go in as the records around them go by, so that the
+            # errors and context agree about how far into the file we are
+            chunkerrors = collections.deque(chunkerrors)
+            for prefix, layoutname, converted, problems, lineno, offset in records:
+                while chunkerrors and chunkerrors[0][0] < lineno:
+                    errors.extend([chunkerrors.popleft()], lineoffset)
+                context['lines'] = lineoffset + lineno
+                context['offset'] = offset
+                yield recordtypes[prefix], recordconverters[layoutname], converted, problems
+            errors.extend(chunkerrors, lineoffset)
+            if trailer:
+                context['trailer'] = trailer
+            lineoffset += chunklines
+            context['lines'] = lineoffset
+            context['offset'] = chunkend
+
+
+# Read the data, parse the different line types, validate them and put them
+# into the db.  If the file is on local disk and workers is more than 1, the
+# parsing is spread out over that many processes.  Lines that can't be
+# parsed go to errors, which is a default ErrorSink if it isn't given.
+#
+# Imports have to survive the worker doing them getting killed partway
+# through, so instead of one big transaction, the records are stored
+# chunksize at a time, and each chunk is committed along with the
+# ImportCheckpoint for file, which says how far into the file the import
+# has gotten.  If there is already a checkpoint for file, the import
+# carries on from the end of the last chunk that was committed, so nothing
+# gets stored twice.  If the checkpoint says the import is already done,
+# there is nothing left to store.
+#
+# f has to be opened in binary mode, and has to be able to seek if it can't
+# be memory mapped.  Every record from the import is imported at the same
+# time (checkpoint.imported_at), which is how importedRecords() tells them
+# apart.  It gives back the checkpoint, which the caller should hand to
+# finishImport() or rollbackImport() once it has decided what to do.
+#
+# If cache is given (a ParseCacheWriter from upload/parsecache.py), the
+# validated records are written to it on their way into the db, and it is
+# saved once the whole file has been parsed.  The parse cache only gets
+# written by imports that started at the top of the file, since otherwise it
+# would only have the end of the file in it.
+#
+# The chunks go through a Pipeline (see tanfparser/pipeline.py):  parsing,
+# validating and writing the parse cache each run in their own thread, and
+# ImportSink stores the chunks in this one, so the next chunks get parsed
+# and validated while the db is busy with the last one.  queuesize is how
+# many chunks can wait between each of them, and 0 does it all one chunk at
+# a time in this thread.
+def importResumable(f, file, user, path=None, workers=1, errors=None, cache=None, chunksize=10000, queuesize=2):
+    checkpoint, created = ImportCheckpoint.objects.get_or_create(
+        file=file, defaults={'imported_at': make_aware(datetime.now()), 'imported_by': user})
+    if checkpoint.done:
+        return checkpoint
+    context = newContext(json.loads(checkpoint.header), errors)
+    context['trailer'] = json.loads(checkpoint.trailer)
+    context['lines'] = checkpoint.lines
+    context['offset'] = checkpoint.offset
+    errorstate = json.loads(checkpoint.errors)
+    if errorstate is not None:
+        context['errors'].restore(errorstate)
+    counts = collections.Counter(json.loads(checkpoint.counts))
+    index = CaseIndex()
+    duplicates = newDuplicateCheck()
+    if checkpoint.offset > 0:
+        print('resuming import of', file, 'at line', checkpoint.lines)
+        cache = None
+        reindexCases(index, f, checkpoint.offset, duplicates)
+
+    if path is not None and workers > 1:
+        records = parseParallel(path, context, workers, start=checkpoint.offset or None)
+    else:
+        records = parseRecords(offsetLines(f, checkpoint.offset), context, offsets=True, lineoffset=checkpoint.lines)
+
+    def validate(batch):
+        return [(list(validateRecords(chunk, duplicates)), position) for chunk, position in batch]
+
+    def record(batch):
+        return [(list(cache.record(chunk, context)), position) for chunk, position in batch]
+
+    # every batch that goes through the pipeline is one chunk
+    stages = [validate] if cache is None else [validate, record]
+    sink = ImportSink(checkpoint, context, counts, index)
+    Pipeline(importChunks(records, context, chunksize), stages, sink, batchsize=1, queuesize=queuesize).run()
+
+    # the lines at the end of the file after the last record
+    saveCheckpoint(checkpoint, parsePosition(context), counts)
+    context['errors'].check()
+    with transaction.atomic():
+        checkCases(index, lambda model: importedRecords(model, checkpoint))
+        checkpoint.done = True
+        checkpoint.save()
+    if cache is not None:
+        cache.save(context)
+    return checkpoint
+
+
+# The CaseIndex (and DuplicateCheck, if there is one) of an import that
+# gets picked up partway through has to be built again from the part of the
+# file before end, which was imported before.
+def reindexCases(index, f, end, duplicates=None):
+    lines = itertools.takewhile(lambda line: line[0] <= end, offsetLines(f))
+    context = newContext(errors=ErrorSink(threshold=None))
+    try:
+        for rt, converter, converted, problems in parseRecords(lines, context, offsets=True):
+            index.add(rt.prefix, converter.fields, converted)
+            if duplicates is not None:
+                duplicates.add(rt.prefix, converter.fields, converted)
+    finally:
+        context['errors'].close()
+
+
+# This splits the records of an import up into the chunks that get
+# committed one at a time, and gives back (records, position) for each of
+# them, where position is what parsePosition() says right after the last
+# record of the chunk.  The parsing has moved on by the time a chunk gets
+# stored, so context can't be used for that anymore.
+def importChunks(records, context, chunksize):
+    try:
+        for chunk in batches(records, chunksize):
+            yield chunk, parsePosition(context)
+    finally:
+        if hasattr(records, 'close'):
+            records.close()
+
+
+# This is how far the parsing of a file has gotten, the way it goes into
+# its ImportCheckpoint.
+def parsePosition(context):
+    return {
+        'offset': context['offset'],
+        'lines': context['lines'],
+        'header': json.dumps(context['header']),
+        'trailer': json.dumps(context['trailer']),
+        'errors': json.dumps(context['errors'].state()),
     }
-    return status
-
 
-def section1_childdata_check(data):
-    # XXX need to check stuff actually here!
-    reasons = []
-    status = {
-        'check': True,
-        'reasons': ", ".join(reasons)
-    }
-    return status
 
+def saveCheckpoint(checkpoint, position, counts):
+    checkpoint.offset = position['offset']
+    checkpoint.lines = position['lines']
+    checkpoint.counts = json.dumps(counts)
+    checkpoint.header = position['header']
+    checkpoint.trailer = position['trailer']
+    checkpoint.errors = position['errors']
+    checkpoint.save()
+
+
+# This is the end of the Pipeline in importResumable().  Each chunk of
+# validated records is stored with one bulk insert per model, and committed
+# along with the checkpoint for where it ends.  The records go into index
+# and counts as they are stored.
+class ImportSink(Sink):
+    def __init__(self, checkpoint, context, counts, index):
+        self.checkpoint = checkpoint
+        self.context = context
+        self.counts = counts
+        self.index = index
+
+    def write(self, batch):
+        checkpoint = self.checkpoint
+        for chunk, position in batch:
+            created = collections.defaultdict(list)
+            for rt, converter, converted, reasons in chunk:
+                record = newRecord(rt, converter, converted, reasons, self.context['header'], checkpoint.imported_by, checkpoint.imported_at)
+                created[type(record)].append(record)
+                self.index.add(rt.prefix, converter.fields, converted)
+                self.counts[rt.prefix] += 1
+            with transaction.atomic():
+                for model, records in created.items():
+                    try:
+                        model.objects.bulk_create(records)
+                    except Exception as e:
+                        print('Creating ' + model.__name__ + ' objects:', e)
+                        raise e
+                saveCheckpoint(checkpoint, position, self.counts)
 
-# Read the data, parse the different line types, put it into the db
-def tanf2db(f, user):
-    # This is the list of lines that we couldn't figure out what to do with
-    errorlines = []
 
-    now = make_aware(datetime.now())
-    header = {}
-    trailer = {}
+# These are the records of one model that were stored by the import that
+# checkpoint is for.
+def importedRecords(model, checkpoint):
+    return model.objects.filter(imported_at=checkpoint.imported_at, imported_by=checkpoint.imported_by)
 
-    for line in f:
-        # different environments can result in a string or bytes, so decode if we need to
-        try:
-            line = line.decode().rstrip()
-        except (UnicodeDecodeError, AttributeError):
-            line = line.rstrip()
 
-        # skip blank lines
-        if line in ['\n', '\r\n']:
-            continue
+# This is the end of an import that went well, which is when its closed
+# cases and people get to close anything.
+def finishImport(checkpoint):
+    with transaction.atomic():
+        closeRecords(lambda model: importedRecords(model, checkpoint))
+        checkpoint.delete()
 
-        if re.match(r'^T1', line):
-            try:
-                data = parseFields(section1_familydata_fields, line)
-            except Exception as e:
-                print('Parsing T1:', e, line)
-                raise e
-
-            # clean up data
-            try:
-                del data['blank']
-            except KeyError:
-                pass
-            data['countyfipscode'] = int(data['countyfipscode'])
-
-            # store data
-            check = section1_familydata_check(data)
-            try:
-                family = Family.objects.create(
-                    imported_at=now,
-                    imported_by=user,
-                    valid=check['check'],
-                    invalidreason=check['reasons'],
-                    calendar_quarter=header['calendarquarter'],
-                    state_code=header['statefipscode'],
-                    tribe_code=header['tribecode'],
-                    **data)
-            except Exception as e:
-                print('Creating Family object:', e, line)
-                raise e
-            family.save()
-
-        elif re.match(r'^T2', line):
-            try:
-                data = parseFields(section1_adultdata_fields, line)
-            except Exception as e:
-                print('Parsing T2:', e, line)
-                raise e
-
-            # clean up data
-            data['dateofbirth'] = make_aware(datetime.strptime(data['dateofbirth'], '%Y%m%d')).strftime('%Y-%m-%d')
-            if header['encryptionindicator'] == 'E':
-                data['socialsecuritynumber'] = decryptSsn(data['socialsecuritynumber'])
-
-            # store data
-            check = section1_adultdata_check(data)
-            try:
-                adult = Adult.objects.create(
-                    imported_at=now,
-                    imported_by=user,
-                    valid=check['check'],
-                    invalidreason=check['reasons'],
-                    calendar_quarter=header['calendarquarter'],
-                    state_code=header['statefipscode'],
-                    tribe_code=header['tribecode'],
-                    **data)
-            except Exception as e:
-                print('Creating Adult object:', e, '"', line, '"')
-                raise e
-            adult.save()
-
-        elif re.match(r'^T3', line):
-            # Child fields seem to be strangely variable, and in our example data, not
-            # compliant with the spec.  Thus, we try a few different field configs.
-            try:
-                # This is the full spec with all the fields
-                data = parseFields(section1_childdata_fields, line)
-            except Exception:
-                try:
-                    # This is truncated at 59 characters (should be 60) so seems to be for one child
-                    data = parseFields(section1_childdata_fields_exampledata, line)
-                except Exception:
-                    try:
-                        # This is truncated at 100 chars.  For 2 children, it seems?
-                        data = parseFields(section1_childdata_fields_twochild, line)
-                    except Exception as e:
-                        # Default:  throw up our hands in exasperation.
-                        print('Parsing T3:', e, line)
-                        raise e
 
-            # clean up data
-            data['dateofbirth_1'] = make_aware(datetime.strptime(data['dateofbirth_1'], '%Y%m%d')).strftime('%Y-%m-%d')
-            try:
-                data['dateofbirth_2'] = make_aware(datetime.strptime(data['dateofbirth_2'], '%Y%m%d')).strftime('%Y-%m-%d')
-            except KeyError:
-                # This is because our sample data seems not to have all the fields we ought to have,
-                # so we are just handling the situation in case it gets put in later.
-                pass
-            if header['encryptionindicator'] == 'E':
-                data['socialsecuritynumber_1'] = decryptSsn(data['socialsecuritynumber_1'])
-                try:
-                    data['socialsecuritynumber_2'] = decryptSsn(data['socialsecuritynumber_2'])
-                except KeyError:
-                    # This is because our sample data seems not to have all the fields we ought to have,
-                    # so we are just handling the situation in case it gets put in later.
-                    pass
-            try:
-                del data['blank']
-            except KeyError:
-                pass
-
-            check = section1_childdata_check(data)
-            try:
-                child = Child.objects.create(
-                    imported_at=now,
-                    imported_by=user,
-                    valid=check['check'],
-                    invalidreason=check['reasons'],
-                    calendar_quarter=header['calendarquarter'],
-                    state_code=header['statefipscode'],
-                    tribe_code=header['tribecode'],
-                    # This is where all the json data gets added in
-                    **data)
-            except Exception as e:
-                print('Creating Child object:', e, line)
-                raise e
-            child.save()
-
-        elif re.match(r'^T4', line):
-            try:
-                data = parseFields(section2_closedcase_fields, line)
-            except Exception as e:
-                print('Parsing T4:', e, line)
-                raise e
-            try:
-                closedcase = ClosedCase.objects.create(
-                    imported_at=now,
-                    imported_by=user,
-                    calendar_quarter=header['calendarquarter'],
-                    state_code=header['statefipscode'],
-                    tribe_code=header['tribecode'],
-                    **data)
-            except Exception as e:
-                print('Creating ClosedCase object:', e, line)
-                raise e
-            closedcase.save()
-
-            Family.objects.filter(calendar_quarter=header['calendarquarter'], casenumber=data['casenumber'], countyfipscode=data['countyfipscode'], zipcode=data['zipcode']).delete()
-
-            # # XXX do we delete associated person records too?
-            # Adult.objects.filter(calendar_quarter=header['calendarquarter'], casenumber=data['casenumber']).delete()
-            # Child.objects.filter(calendar_quarter=header['calendarquarter'], casenumber=data['casenumber']).delete()
-
-        elif re.match(r'^T5', line):
-            data = parseFields(section2_closedperson_fields, line)
-
-            if header['encryptionindicator'] == 'E':
-                data['socialsecuritynumber'] = decryptSsn(data['socialsecuritynumber'])
-
-            closedperson = ClosedPerson.objects.create(
-                imported_at=now,
-                imported_by=user,
-                calendar_quarter=header['calendarquarter'],
-                state_code=header['statefipscode'],
-                tribe_code=header['tribecode'],
-                **data)
-            closedperson.save()
-
-            Adult.objects.filter(calendar_quarter=header['calendarquarter'], casenumber=data['casenumber'], socialsecuritynumber=data['socialsecuritynumber']).delete()
-            Child.objects.filter(calendar_quarter=header['calendarquarter'], casenumber=data['casenumber'], socialsecuritynumber=data['socialsecuritynumber']).delete()
-
-        elif re.match(r'^T6', line):
-            data = parseFields(section3_aggregatedata_fields, line)
-            aggregatedata = AggregatedData.objects.create(
-                imported_at=now,
-                imported_by=user,
-                calendar_quarter=header['calendarquarter'],
-                state_code=header['statefipscode'],
-                tribe_code=header['tribecode'],
-                **data)
-            aggregatedata.save()
-
-        elif re.match(r'^T7', line):
-            data = parseFields(section4_familiesbystratum_fields, line)
-            stratumdata = FamiliesByStratumData.objects.create(
-                imported_at=now,
-                imported_by=user,
-                calendar_quarter=header['calendarquarter'],
-                state_code=header['statefipscode'],
-                tribe_code=header['tribecode'],
-                **data)
-            stratumdata.save()
-
-        elif re.match(r'^HEADER', line):
-            header = parseFields(header_fields, line)
-
-        elif re.match(r'^TRAILER', line):
-            trailer = parseFields(trailer_fields, line)
-
-        else:
-            errorlines.append(line)
-
-    if len(errorlines) > 0:
-        raise Exception('could not parse lines', errorlines)
-
-    return
+# This deletes everything that the import that checkpoint is for stored,
+# and the checkpoint.  Nothing from before the import has been touched,
+# since its closed cases and people haven't closed anything yet.
+def rollbackImport(checkpoint):
+    with transaction.atomic():
+        for store in recordstores.values():
+            importedRecords(store.model, checkpoint).delete()
+        checkpoint.delete()
@@ -1,11 +1,18 @@
 import json
 from django.core import serializers
 from django.core.files.storage import default_storage
-from upload.models import Family, Adult, Child, ClosedPerson, AggregatedData, FamiliesByStratumData
+from upload.models import Family, Adult, Child, ClosedPerson, AggregatedData, FamiliesByStratumData, ImportCheckpoint
 from django.db import transaction
 from background_task import background
-from upload.tanfDataProcessing import tanf2db
+from upload.tanfDataProcessing import importResumable, importedRecords, finishImport, rollbackImport
+from upload.parsecache import ParseCacheWriter, loadParseCache, evictParseCache, useParseCache
+from tanfparser.errors import ErrorSink, TANFParseError
+from tanfparser.preflight import preflight
+from tanfparser.reader import decompressed, CompressedFileError
 from django.core.files.base import ContentFile
+from django.conf import settings
+from django.utils.timezone import make_aware
+from datetime import datetime
 
 
 # This is for tasks that need to be run in the background.
@@ -13,89 +20,134 @@ class TANFDataImport(Exception):
     pass
 
 
-@background
-def importRecords(file=None, user=None):
-    print('starting to process', file)
-    statusfile = file + '.status'
-    status = {'status': 'Importing'}
-    default_storage.save(statusfile, ContentFile(json.dumps(status).encode()))
-    invalidcount = 0
-
-    # wrap this whole thing in a transaction.  If we encounter problems
-    # importing data, or we have invalid records, store the invalid records
-    # and then rollback.
-    try:
-        with transaction.atomic():
-            try:
-                with default_storage.open(file, 'r') as f:
-                    tanf2db(f, user)
-            except (FileNotFoundError, OSError):
-                print('missing file, assuming job was deleted before we could process it:', file)
-                return
-            except Exception as e:
-                print('Import Error:', e)
-                status = {'status': 'Error While Importing'}
-                default_storage.delete(statusfile)
-                default_storage.save(statusfile, ContentFile(json.dumps(status).encode()))
-                raise TANFDataImport('Error While Importing ' + repr(e))
+# These are the messages about lines that couldn't be parsed that get shown
+# to people on the file info page.
+def errorMessages(e):
+    messages = [e.summary()]
+    for lineno, kind, line in e.lines:
+        messages.append('line {}: {}: {}'.format(lineno, kind, line))
+    if e.spilled:
+        messages.append('and {} more'.format(e.spilled))
+    return messages
 
-            print('finished importing', file)
 
-            # check if we had any invalid things
-            invalidcount = Family.objects.filter(valid=False).count()
-            invalidcount += Adult.objects.filter(valid=False).count()
-            invalidcount += Child.objects.filter(valid=False).count()
-            invalidcount += ClosedPerson.objects.filter(valid=False).count()
-            invalidcount += AggregatedData.objects.filter(valid=False).count()
-            invalidcount += FamiliesByStratumData.objects.filter(valid=False).count()
-            if invalidcount > 0:
-                status = {'status': 'Failed Validation'}
-                default_storage.delete(statusfile)
-                default_storage.save(statusfile, ContentFile(json.dumps(status).encode()))
+def saveStatus(statusfile, status):
+    if default_storage.exists(statusfile):
+        default_storage.delete(statusfile)
+    default_storage.save(statusfile, ContentFile(json.dumps(status).encode()))
 
-                # Write out an invalid file with all the invalid stuff.
-                invalidfile = file + '.invalid'
-                with default_storage.open(invalidfile, 'w') as f:
-                    # invalidstring = '["invalid: ' + str(invalidcount) + '"]'
-                    # f.write(invalidstring)
-                    # XXX write out the invalid records
-                    f.write('[')
 
-                    tmplist = Family.objects.filter(valid=False)
-                    tmpjson = serializers.serialize('json', tmplist)
-                    f.write(json.loads(tmpjson))
-                    f.write(',')
+# This deletes whatever the import of file has stored so far.
+def rollbackFile(file):
+    checkpoint = ImportCheckpoint.objects.filter(file=file).first()
+    if checkpoint is not None:
+        rollbackImport(checkpoint)
 
-                    tmplist = Adult.objects.filter(valid=False)
-                    tmpjson = serializers.serialize('json', tmplist)
-                    f.write(json.loads(tmpjson))
-                    f.write(',')
 
-                    tmplist = Child.objects.filter(valid=False)
-                    tmpjson = serializers.serialize('json', tmplist)
-                    f.write(json.loads(tmpjson))
-                    f.write(',')
+# The file can be gzipped or zipped (see tanfparser.reader.decompressed()),
+# in which case it is decompressed as it is read.
+#
+# digest is the sha256 of the file, if the upload view worked it out.  If
+# the same file has been parsed before, the records that were parsed and
+# validated then are stored instead of parsing it again.
+#
+# The records are committed a chunk at a time with an ImportCheckpoint (see
+# importResumable()), so if the worker gets killed partway through, the
+# retry of this task carries on from the last chunk that was committed.  If
+# the import fails or there are invalid records, everything the import
+# stored is deleted again.
+@background
+def importRecords(file=None, user=None, digest=None):
+    print('starting to process', file)
+    statusfile = file + '.status'
+    errorsfile = file + '.errors'
+    saveStatus(statusfile, {'status': 'Importing'})
+    invalidcount = 0
+    checkpoint = None
 
-                    tmplist = ClosedPerson.objects.filter(valid=False)
-                    tmpjson = serializers.serialize('json', tmplist)
-                    f.write(json.loads(tmpjson))
-                    f.write(',')
+    try:
+        try:
+            # the file can only be parsed in parallel if it is on local disk
+            # (and not compressed, see below)
+            try:
+                path = default_storage.path(file)
+            except NotImplementedError:
+                path = None
+            # the lines that can't be parsed past the first few go into
+            # the .errors file, so a broken file can't use up all the memory
+            errors = ErrorSink(keep=settings.TANF_ERROR_SAMPLES, threshold=settings.TANF_ERROR_THRESHOLD,
+                               spill=lambda: default_storage.open(errorsfile, 'w'))
+            usecache = settings.TANF_PARSE_CACHE and digest is not None
+            with default_storage.open(file, 'rb') as original, decompressed(original) as f:
+                # compressed uploads are read through the decompressor, which
+                # parallel parsing can't use since it maps the file itself
+                parsepath = path if f is original else None
+                # files that are broken in ways that can be seen without
+                # parsing them fail here, before anything is stored
+                preflight(f, errors)
+                f.seek(0)
+                if usecache:
+                    useParseCache(digest, file)
+                if usecache and not ImportCheckpoint.objects.filter(file=file).exists():
+                    # the cached records all go in at once along with their
+                    # checkpoint, which is done right away, so a retry only
+                    # has to finish the import
+                    now = make_aware(datetime.now())
+                    with transaction.atomic():
+                        if loadParseCache(digest, user, now):
+                            checkpoint = ImportCheckpoint.objects.create(file=file, imported_at=now, imported_by=user, done=True)
+                if checkpoint is not None:
+                    print('stored the records of an earlier upload of', file)
+                else:
+                    cache = ParseCacheWriter(digest) if usecache else None
+                    checkpoint = importResumable(f, file, user, path=parsepath, workers=settings.TANF_PARSE_WORKERS,
+                                                 errors=errors, cache=cache, chunksize=settings.TANF_IMPORT_CHUNK_SIZE)
+                    if usecache:
+                        evictParseCache()
+        except CompressedFileError as e:
+            print('Import Error:', e)
+            saveStatus(statusfile, {'status': 'Error While Importing', 'errors': [str(e)]})
+            rollbackFile(file)
+            raise TANFDataImport('Error While Importing ' + str(e))
+        except (FileNotFoundError, OSError):
+            print('missing file, assuming job was deleted before we could process it:', file)
+            rollbackFile(file)
+            return
+        except TANFParseError as e:
+            print('Import Error:', e)
+            saveStatus(statusfile, {'status': 'Error While Importing', 'errors': errorMessages(e)})
+            rollbackFile(file)
+            raise TANFDataImport('Error While Importing ' + e.summary())
+        except Exception as e:
+            print('Import Error:', e)
+            saveStatus(statusfile, {'status': 'Error While Importing'})
+            rollbackFile(file)
+            raise TANFDataImport('Error While Importing ' + repr(e))
 
-                    tmplist = AggregatedData.objects.filter(valid=False)
-                    tmpjson = serializers.serialize('json', tmplist)
-                    f.write(json.loads(tmpjson))
-                    f.write(',')
+        print('finished importing', file)
 
-                    tmplist = FamiliesByStratumData.objects.filter(valid=False)
-                    tmpjson = serializers.serialize('json', tmplist)
-                    f.write(json.loads(tmpjson))
+        # check if we had any invalid things
+        models = [Family, Adult, Child, ClosedPerson, AggregatedData, FamiliesByStratumData]
+        for model in models:
+            invalidcount += importedRecords(model, checkpoint).filter(valid=False).count()
+        if invalidcount > 0:
+            saveStatus(statusfile, {'status': 'Failed Validation'})
 
-                    f.write(']')
-                raise TANFDataImport('invalid records: rolling back')
-            else:
-                status = {'status': 'Imported'}
-                default_storage.delete(statusfile)
-                default_storage.save(statusfile, ContentFile(json.dumps(status).encode()))
+            # Write out an invalid file with all the invalid stuff.
+            invalidfile = file + '.invalid'
+            with default_storage.open(invalidfile, 'w') as f:
+                f.write('[')
+                for i, model in enumerate(models):
+                    if i > 0:
+                        f.write(',')
+                    tmplist = importedRecords(model, checkpoint).filter(valid=False)
+                    f.write(serializers.serialize('json', tmplist))
+                f.write(']')
+            rollbackImport(checkpoint)
+            raise TANFDataImport('invalid records: rolling back')
+        else:
+            finishImport(checkpoint)
+            saveStatus(statusfile, {'status': 'Imported'})
     except TANFDataImport as e:
         # if we have a data import/validation problem, it should be rolled
         # back and then we should exit the job cleanly so that we don't
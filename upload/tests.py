@@ -1,6 +1,28 @@
-from django.test import TestCase
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import random
+import string
+import time
+import zipfile
+from unittest import mock
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.test import Client
 from django.contrib.auth import get_user_model
+from upload.models import Family, Adult, Child, ClosedPerson, ImportCheckpoint
+from tanfparser import readLines, encryptmap, decryptSsn, decryptSsns, parseInt, parseIntBytes
+from tanfparser.errors import ErrorSink, TANFParseError
+from upload.tanfDataProcessing import recordconverters, newContext, parseParallel, parseRecords
+from upload.tanfDataProcessing import importResumable, importedRecords, finishImport, rollbackImport, newRecord as realNewRecord
+from upload.tasks import importRecords
+from upload.parsecache import loadParseCache, evictParseCache, useParseCache, parseCacheName, PARSE_CACHE_VERSION
+from tanfparser.rules import rulesVersion, RuleSet, Required
 
 # Create your tests here.
 
@@ -74,10 +96,560 @@ class CheckUI(TestCase):
         self.assertIn(b'Upload to the TANF Data Reporting system', response.content)
 
     def test_upload_data(self):
-        """upload page accepts data, sends us to the Status page, and status page has a file"""
+        """upload page accepts data, sends us to the Preview page, and status page has a file"""
         self.client.force_login(self.user)
         with open('upload/fixtures/testdata.txt') as f:
             response = self.client.post("/", {'name': 'myfile', 'myfile': f}, follow=True)
+            self.assertIn(b'Upload Preview', response.content)
+            self.assertIn(b'<td>20191</td>', response.content)
+            self.assertIn(b'<td>765403471</td>', response.content)
+            response = self.client.get('/status/')
             self.assertIn(b'<th>Status</th>', response.content)
             self.assertIn(b'tanfuser@gsa.gov_', response.content)
             self.assertIn(b'_testdata.txt', response.content)
+
+    def test_preview(self):
+        """the preview shows what is wrong with a file, and only to whoever uploaded it"""
+        with tempfile.TemporaryDirectory() as tempdir, override_settings(MEDIA_ROOT=tempdir):
+            with open('upload/fixtures/testdata.txt', 'rb') as f:
+                data = f.read()
+            file = 'tanfuser@gsa.gov_preview.txt'
+            with open(os.path.join(tempdir, file), 'wb') as f:
+                f.write(gzip.compress(data.replace(b'T3', b'T9')))
+
+            self.client.force_login(self.user)
+            response = self.client.get('/preview/' + file + '/')
+            self.assertIn(b'Problems (2)', response.content)
+            self.assertIn(b'line 4: unknown record type', response.content)
+            self.assertIn(b'<tr><td>T2</td><td>1</td></tr>', response.content)
+            self.assertIn(b'<td>987644682</td>', response.content)
+
+            # the file is only read the first time
+            with mock.patch('upload.views.previewFile') as previewFile:
+                response = self.client.get('/preview/' + file + '/')
+            previewFile.assert_not_called()
+            self.assertIn(b'line 4: unknown record type', response.content)
+            self.assertIn(b'<td>987644682</td>', response.content)
+            self.client.get('/delete/' + file + '/?confirmed=yes')
+            self.assertFalse(default_storage.exists(file + '.preview'))
+
+            self.client.force_login(self.staffuser)
+            self.assertRedirects(self.client.get('/preview/' + file + '/'), '/status/')
+
+
+class CheckParsing(SimpleTestCase):
+    def setUp(self):
+        with open('upload/fixtures/testdata.txt') as f:
+            self.lines = [line.rstrip() for line in f]
+
+    def test_decryptssn_roundtrip(self):
+        """decrypting an encrypted ssn gives back the ssn, one at a time or in batches"""
+        encrypttable = str.maketrans(encryptmap)
+        rng = random.Random(1234)
+        ssns = [''.join(rng.choice(string.digits) for i in range(9)) for n in range(500)]
+        encrypted = [ssn.translate(encrypttable) for ssn in ssns]
+        self.assertEqual([decryptSsn(ssn) for ssn in encrypted], ssns)
+        self.assertEqual(decryptSsns(encrypted), ssns)
+        self.assertEqual(decryptSsns([ssn.encode() for ssn in encrypted]), [ssn.encode() for ssn in ssns])
+
+    def test_converters(self):
+        """converters give back the types that the models want"""
+        converter = recordconverters['section1_familydata']
+        self.assertNotIn('blank', converter.fields)
+        self.assertIn('countyfipscode', converter.intfields)
+        line = self.lines[1].encode()
+        data = dict(zip(converter.fields, converter.convert(memoryview(line))))
+        self.assertEqual(data['countyfipscode'], 41)
+        self.assertEqual(data['amtoffoodstampassistance'], 353)
+        self.assertEqual(data['zipcode'], '97365')
+        self.assertEqual(data['waiver_evaluation_control_gprs'], '')
+        self.assertEqual(converter.problems(line, converter.convert(line)), [])
+
+        adult = recordconverters['section1_adultdata']
+        self.assertEqual(dict(zip(adult.fields, adult.convert(self.lines[2].encode())))['dateofbirth'],
+                         datetime.date(1973, 7, 4))
+
+    def test_blank_numbers(self):
+        """blank padded numbers are numbers, blanks are None, and garbage is a problem"""
+        self.assertEqual(parseInt(' 41'), 41)
+        self.assertEqual(parseInt('41 '), 41)
+        self.assertIsNone(parseInt('   '))
+        self.assertIsNone(parseInt('4 1'))
+        self.assertIsNone(parseInt('-41'))
+        self.assertEqual(parseIntBytes(b' 41'), 41)
+        self.assertIsNone(parseIntBytes(b'4 1'))
+        self.assertIsNone(parseIntBytes(b'-41'))
+        self.assertIsNone(parseIntBytes(b'4_1'))
+        converter = recordconverters['section1_familydata']
+        line = (self.lines[1][:19] + '4 1' + self.lines[1][22:24] + '     ' + self.lines[1][29:]).encode()
+        converted = converter.convert(line)
+        self.assertEqual(converter.problems(line, converted), ['countyfipscode is not a valid number: 4 1'])
+        self.assertEqual(dict(zip(converter.fields, converted))['zipcode'], '')
+
+
+class CheckParseCache(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.media = override_settings(MEDIA_ROOT=self.tempdir.name)
+        self.media.enable()
+        with open('upload/fixtures/testdata.txt', 'rb') as f:
+            self.data = f.read()
+        self.digest = hashlib.sha256(self.data).hexdigest()
+
+    def tearDown(self):
+        self.media.disable()
+        self.tempdir.cleanup()
+
+    # This imports data the way the upload view has the import task do it,
+    # with digest as the sha256 of the file.
+    def importFile(self, data, digest):
+        file = default_storage.save('tanfuser@gsa.gov_{}.txt'.format(digest), ContentFile(data))
+        with override_settings(TANF_PARSE_CACHE=True):
+            importRecords.now(file, 'tanfuser@gsa.gov', digest)
+        return file
+
+    def storedRecords(self):
+        return [list(model.objects.values_list('casenumber', 'valid', 'invalidreason', 'imported_by').order_by('id'))
+                for model in (Family, Adult, Child)]
+
+    def test_parsecache(self):
+        """storing the cached records of a file gives the same rows as parsing it"""
+        self.assertFalse(loadParseCache(self.digest, 'tanfuser@gsa.gov'))
+        self.importFile(self.data, self.digest)
+        parsed = self.storedRecords()
+        adult = Adult.objects.get()
+        for model in (Family, Adult, Child):
+            model.objects.all().delete()
+
+        with mock.patch('upload.tanfDataProcessing.parseRecords') as parseRecords:
+            self.assertTrue(loadParseCache(self.digest, 'tanfuser@gsa.gov'))
+        parseRecords.assert_not_called()
+        self.assertEqual(self.storedRecords(), parsed)
+        self.assertEqual(Adult.objects.get().dateofbirth, adult.dateofbirth)
+
+        # a new version of the layouts or rules means parsing it all over again
+        with mock.patch('upload.parsecache.PARSE_CACHE_VERSION', PARSE_CACHE_VERSION + 1):
+            self.assertFalse(loadParseCache(self.digest, 'tanfuser@gsa.gov'))
+        with mock.patch('upload.parsecache.RULES_VERSION', rulesVersion({'T1': RuleSet([Required('casenumber', 'T1-02')])})):
+            self.assertFalse(loadParseCache(self.digest, 'tanfuser@gsa.gov'))
+        with self.settings(TANF_DUPLICATE_CHECK='bloom'):
+            self.assertFalse(loadParseCache(self.digest, 'tanfuser@gsa.gov'))
+        self.assertTrue(loadParseCache(self.digest, 'tanfuser@gsa.gov'))
+
+    def test_parsecache_ssns(self):
+        """the ssns of encrypted files stay encrypted in the cache"""
+        data = self.data[:21] + b'E' + self.data[22:].replace(b'987644682', b'@9ZP0#YBW')
+        self.importFile(data, self.digest)
+        self.assertEqual(Adult.objects.get().socialsecuritynumber, '123456789')
+        Adult.objects.all().delete()
+        with default_storage.open(parseCacheName(self.digest), 'rb') as f:
+            entry = gzip.decompress(f.read())
+        self.assertIn(b'"@9ZP0#YBW"', entry)
+        self.assertNotIn(b'123456789', entry)
+        loadParseCache(self.digest, 'tanfuser@gsa.gov')
+        self.assertEqual(Adult.objects.get().socialsecuritynumber, '123456789')
+
+    def test_parsecache_errors(self):
+        """files with lines that can't be parsed aren't cached"""
+        file = self.importFile(self.data + b'T9 what is this\n', self.digest)
+        with default_storage.open(file + '.status') as f:
+            self.assertEqual(json.load(f)['status'], 'Error While Importing')
+        self.assertFalse(loadParseCache(self.digest, 'tanfuser@gsa.gov'))
+
+        # even if they only show up once the records are parsed
+        with mock.patch('upload.tasks.preflight'):
+            file = self.importFile(self.data + b'T9 what is this\n', self.digest)
+        with default_storage.open(file + '.status') as f:
+            self.assertEqual(json.load(f)['status'], 'Error While Importing')
+        self.assertFalse(loadParseCache(self.digest, 'tanfuser@gsa.gov'))
+
+    def test_parsecache_evict(self):
+        """old entries are evicted first, and then the oldest until the cache is small enough"""
+        for digest in ['a', 'b', 'c']:
+            self.importFile(self.data, digest)
+        now = time.time()
+        for digest, modified in [('a', 1000000), ('b', now - 20), ('c', now - 10)]:
+            os.utime(os.path.join(self.tempdir.name, parseCacheName(digest)), (modified, modified))
+        size = default_storage.size(parseCacheName('c'))
+        entries = {digest: os.path.basename(parseCacheName(digest)) for digest in ['a', 'b', 'c']}
+
+        evictParseCache(maxage=3600, maxsize=size * 10)
+        self.assertEqual(sorted(default_storage.listdir('parsecache')[1]), [entries['b'], entries['c']])
+        evictParseCache(maxage=3600, maxsize=size)
+        self.assertEqual(default_storage.listdir('parsecache')[1], [entries['c']])
+
+        # the uploads that used the evicted entries are forgotten with them
+        self.assertEqual(default_storage.listdir('parsecache/digests')[1], ['tanfuser@gsa.gov_c.txt'])
+        self.assertEqual(default_storage.listdir('parsecache/uploads/a')[1], [])
+        self.assertEqual(default_storage.listdir('parsecache/uploads/c')[1], ['tanfuser@gsa.gov_c.txt'])
+
+    def test_parsecache_delete(self):
+        """an entry is deleted along with the last upload that uses it"""
+        self.client.force_login(get_user_model().objects.create_user(email='tanfuser@gsa.gov'))
+        files = [self.importFile(self.data, self.digest), 'tanfuser@gsa.gov_again.txt']
+        default_storage.save(files[1], ContentFile(self.data))
+        default_storage.save(files[1] + '.status', ContentFile(b'{"status": "Imported"}'))
+        useParseCache(self.digest, files[1])
+        for file, cached in zip(files, [True, False]):
+            self.client.get('/delete/{}/'.format(file))
+            self.assertFalse(default_storage.exists(file))
+            self.assertEqual(default_storage.exists(parseCacheName(self.digest)), cached)
+
+    def test_upload_digest(self):
+        """the upload view hashes the file and hands the digest to the import"""
+        user = get_user_model().objects.create_user(email='tanfuser@gsa.gov')
+        self.client.force_login(user)
+        with mock.patch('upload.views.importRecords') as importRecords:
+            with open('upload/fixtures/testdata.txt', 'rb') as f:
+                self.client.post("/", {'name': 'myfile', 'myfile': f})
+        filename, username, digest = importRecords.call_args[0]
+        self.assertEqual(digest, self.digest)
+
+
+# This is what the tests kill imports with.  It isn't an Exception, so
+# nothing gets a chance to clean up after it, just like a SIGKILL.
+class Killed(BaseException):
+    pass
+
+
+def killAfter(count):
+    stored = []
+
+    def newRecord(*args):
+        if len(stored) >= count:
+            raise Killed()
+        stored.append(args)
+        return realNewRecord(*args)
+    return mock.patch('upload.tanfDataProcessing.newRecord', side_effect=newRecord)
+
+
+# This imports lines the way the import task does, without the files.
+def importLines(lines, user='tanfuser@gsa.gov', **kwargs):
+    checkpoint = importResumable(io.BytesIO(b''.join(lines)), 'tanfuser@gsa.gov_lines.txt', user, **kwargs)
+    finishImport(checkpoint)
+
+
+class CheckResume(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.media = override_settings(MEDIA_ROOT=self.tempdir.name, TANF_IMPORT_CHUNK_SIZE=7, TANF_PARSE_CACHE=False)
+        self.media.enable()
+        with open('upload/fixtures/testdata.txt', 'rb') as f:
+            header, t1, t2, t3, trailer = f.readlines()
+        # every record has its own casenumber, so duplicates would show
+        self.families = [t1[:8] + '{:011d}'.format(i).encode() + t1[19:] for i in range(40)]
+        t2 = t2[:8] + b'%011d' % 0 + t2[19:]
+        t3 = t3[:8] + b'%011d' % 0 + t3[19:]
+        trailer = trailer[:7] + b'%07d' % 42 + trailer[14:]
+        self.data = header + b''.join(self.families) + t2 + t3 + trailer
+        self.file = 'tanfuser@gsa.gov_resume.txt'
+        with open(os.path.join(self.tempdir.name, self.file), 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.media.disable()
+        self.tempdir.cleanup()
+
+    def casenumbers(self):
+        return sorted(Family.objects.values_list('casenumber', flat=True))
+
+    def test_resume(self):
+        """an import that gets killed carries on from its last checkpoint without storing anything twice"""
+        for workers, queuesize in [(1, 0), (1, 2), (2, 2)]:
+            path = os.path.join(self.tempdir.name, self.file)
+            with killAfter(17), self.assertRaises(Killed):
+                with open(path, 'rb') as f:
+                    importResumable(f, self.file, 'tanfuser@gsa.gov', path=path, workers=workers, chunksize=7, queuesize=queuesize)
+            checkpoint = ImportCheckpoint.objects.get(file=self.file)
+            self.assertEqual(Family.objects.count(), 14)
+            self.assertEqual(json.loads(checkpoint.counts), {'T1': 14})
+            self.assertEqual(checkpoint.lines, 15)
+            self.assertEqual(self.data[:checkpoint.offset].count(b'\n'), 15)
+
+            with open(path, 'rb') as f:
+                checkpoint = importResumable(f, self.file, 'tanfuser@gsa.gov', path=path, workers=workers, chunksize=7, queuesize=queuesize)
+            self.assertEqual(self.casenumbers(), ['{:011d}'.format(i) for i in range(40)])
+            self.assertEqual(Adult.objects.count(), 1)
+            # the families from before the kill still count for the adult and child
+            self.assertTrue(Adult.objects.get().valid)
+            self.assertTrue(Child.objects.get().valid)
+            self.assertEqual(json.loads(checkpoint.counts), {'T1': 40, 'T2': 1, 'T3': 1})
+            self.assertEqual(checkpoint.offset, len(self.data))
+            self.assertEqual(set(importedRecords(Family, checkpoint)), set(Family.objects.all()))
+            rollbackImport(checkpoint)
+            self.assertEqual(Family.objects.count(), 0)
+            self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_resume_duplicates(self):
+        """records that were imported before the kill still count for finding duplicates"""
+        path = os.path.join(self.tempdir.name, self.file)
+        data = self.data.replace(self.families[30], self.families[3])
+        with open(path, 'wb') as f:
+            f.write(data)
+        with killAfter(10), self.assertRaises(Killed):
+            with open(path, 'rb') as f:
+                importResumable(f, self.file, 'tanfuser@gsa.gov', chunksize=7)
+        with open(path, 'rb') as f:
+            importResumable(f, self.file, 'tanfuser@gsa.gov', chunksize=7)
+        self.assertEqual(list(Family.objects.filter(valid=False).values_list('casenumber', 'invalidreason')), [('00000000003', 'T1-16')])
+
+    def test_resume_stream(self):
+        """files that can't be memory mapped are picked up at the checkpoint too"""
+        with killAfter(10), self.assertRaises(Killed):
+            importResumable(io.BytesIO(self.data), self.file, 'tanfuser@gsa.gov', chunksize=7)
+        checkpoint = importResumable(io.BytesIO(self.data), self.file, 'tanfuser@gsa.gov', chunksize=7)
+        self.assertEqual(self.casenumbers(), ['{:011d}'.format(i) for i in range(40)])
+        self.assertEqual(checkpoint.lines, 44)
+
+    def test_resume_task(self):
+        """a retry of an import task that was killed finishes the import"""
+        with killAfter(20), self.assertRaises(Killed):
+            importRecords.now(self.file, 'tanfuser@gsa.gov')
+        with default_storage.open(self.file + '.status') as f:
+            self.assertEqual(json.load(f)['status'], 'Importing')
+        self.assertEqual(Family.objects.count(), 14)
+
+        importRecords.now(self.file, 'tanfuser@gsa.gov')
+        with default_storage.open(self.file + '.status') as f:
+            self.assertEqual(json.load(f)['status'], 'Imported')
+        self.assertEqual(self.casenumbers(), ['{:011d}'.format(i) for i in range(40)])
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_resume_cached(self):
+        """a retry of an import that stored the records of an earlier upload only has to finish it"""
+        digest = hashlib.sha256(self.data).hexdigest()
+        again = 'tanfuser@gsa.gov_again.txt'
+        default_storage.save(again, ContentFile(self.data))
+        with override_settings(TANF_PARSE_CACHE=True):
+            importRecords.now(self.file, 'tanfuser@gsa.gov', digest)
+            with mock.patch('upload.tasks.finishImport', side_effect=Killed), self.assertRaises(Killed):
+                importRecords.now(again, 'tanfuser@gsa.gov', digest)
+            self.assertEqual(Family.objects.count(), 80)
+            self.assertTrue(ImportCheckpoint.objects.get(file=again).done)
+
+            with mock.patch('upload.tanfDataProcessing.parseRecords') as parseRecords:
+                importRecords.now(again, 'tanfuser@gsa.gov', digest)
+            parseRecords.assert_not_called()
+        with default_storage.open(again + '.status') as f:
+            self.assertEqual(json.load(f)['status'], 'Imported')
+        self.assertEqual(Family.objects.count(), 80)
+        self.assertFalse(Family.objects.filter(valid=False).exists())
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_failed_validation(self):
+        """imports with invalid records are rolled back, even though they were committed in chunks"""
+        with open(os.path.join(self.tempdir.name, self.file), 'wb') as f:
+            f.write(self.data.replace(b'19730704', b'19731304'))
+        importRecords.now(self.file, 'tanfuser@gsa.gov')
+        with default_storage.open(self.file + '.status') as f:
+            self.assertEqual(json.load(f)['status'], 'Failed Validation')
+        with default_storage.open(self.file + '.invalid') as f:
+            invalid = json.load(f)
+        self.assertEqual(len(invalid[1]), 1)
+        self.assertEqual(Family.objects.count(), 0)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_failed_closures(self):
+        """closed cases and people in an import that fails don't delete anything, and do once it goes through"""
+        with open('upload/fixtures/testdata.txt', 'rb') as f:
+            header, t1, t2, t3, trailer = f.readlines()
+        importLines([header, t1, t2, t3, trailer])
+        closedcase = b'T4' + t1[2:29] + b'1012222\n'
+        closedperson = b'T5' + t2[2:20] + t2[21:72] + b'\n'
+        broken = t2[:8] + b'%011d' % 1 + t2[19:21] + b'19731304' + t2[29:]
+        for lines, status in [([closedcase, closedperson, broken], 'Failed Validation'), ([closedcase, closedperson], 'Imported')]:
+            self.assertEqual((Family.objects.count(), Adult.objects.count(), Child.objects.count()), (1, 1, 1))
+            with open(os.path.join(self.tempdir.name, self.file), 'wb') as f:
+                f.write(header + b''.join(lines) + trailer[:7] + b'%07d' % len(lines) + trailer[14:])
+            importRecords.now(self.file, 'tanfuser@gsa.gov')
+            with default_storage.open(self.file + '.status') as f:
+                self.assertEqual(json.load(f)['status'], status)
+        self.assertEqual((Family.objects.count(), Adult.objects.count(), Child.objects.count()), (0, 0, 1))
+
+    def test_compressed(self):
+        """gzipped and zipped uploads are imported as they are, and stay compressed"""
+        path = os.path.join(self.tempdir.name, self.file)
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('resume.txt', self.data)
+        for compressed in [gzip.compress(self.data), archive.getvalue()]:
+            with open(path, 'wb') as f:
+                f.write(compressed)
+            with override_settings(TANF_PARSE_WORKERS=2):
+                importRecords.now(self.file, 'tanfuser@gsa.gov')
+            with default_storage.open(self.file + '.status') as f:
+                self.assertEqual(json.load(f)['status'], 'Imported')
+            self.assertEqual(self.casenumbers(), ['{:011d}'.format(i) for i in range(40)])
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), compressed)
+
+            self.client.force_login(get_user_model().objects.get_or_create(email='tanfuser@gsa.gov')[0])
+            self.assertEqual(self.client.get('/download/' + self.file).content, self.data)
+            Family.objects.all().delete()
+            Adult.objects.all().delete()
+            Child.objects.all().delete()
+
+    def test_compressed_broken(self):
+        """compressed uploads that are cut off fail with an error that says so"""
+        with open(os.path.join(self.tempdir.name, self.file), 'wb') as f:
+            f.write(gzip.compress(self.data)[:-100])
+        importRecords.now(self.file, 'tanfuser@gsa.gov')
+        with default_storage.open(self.file + '.status') as f:
+            status = json.load(f)
+        self.assertEqual(status['status'], 'Error While Importing')
+        self.assertTrue(status['errors'][0].startswith('could not decompress the file'))
+        self.assertFalse(Family.objects.exists())
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_failed_preflight(self):
+        """files with a trailer that has the wrong count fail before anything is stored"""
+        with open(os.path.join(self.tempdir.name, self.file), 'wb') as f:
+            f.write(self.data.replace(b'TRAILER0000042', b'TRAILER0000041'))
+        with killAfter(0):
+            importRecords.now(self.file, 'tanfuser@gsa.gov')
+        with default_storage.open(self.file + '.status') as f:
+            status = json.load(f)
+        self.assertEqual(status['status'], 'Error While Importing')
+        self.assertIn('line 44: trailer count does not match: trailer says 0000041, but there are 42 records', status['errors'])
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+
+class CheckImport(TestCase):
+    def test_import(self):
+        """importing the test data stores each kind of record in it"""
+        with open('upload/fixtures/testdata.txt', 'rb') as f:
+            finishImport(importResumable(f, 'tanfuser@gsa.gov_testdata.txt', 'tanfuser@gsa.gov'))
+        family = Family.objects.get()
+        self.assertEqual(family.calendar_quarter, 20191)
+        self.assertEqual(family.countyfipscode, 41)
+        self.assertEqual(Adult.objects.get().dateofbirth, datetime.date(1973, 7, 4))
+        self.assertEqual(Child.objects.get().socialsecuritynumber_1, '765403471')
+
+    def test_invalid_dateofbirth(self):
+        """records with dates that don't exist fail validation instead of blowing up"""
+        with open('upload/fixtures/testdata.txt', 'rb') as f:
+            header, t1, t2, t3, trailer = f.readlines()
+        t2 = t2[:21] + b'19731304' + t2[29:]
+        importLines([header, t2, trailer])
+        adult = Adult.objects.get()
+        self.assertFalse(adult.valid)
+        self.assertIsNone(adult.dateofbirth)
+        self.assertIn('dateofbirth is not a valid date: 19731304', adult.invalidreason)
+
+    def test_validation_rules(self):
+        """records that break the rules are stored as invalid with the reason codes"""
+        with open('upload/fixtures/testdata.txt', 'rb') as f:
+            header, t1, t2, t3, trailer = f.readlines()
+        broken = t1[:8] + b'%011d' % 1 + t1[19:29] + b'9' + t1[30:]
+        importLines([header, t1, broken, t2, t3, trailer])
+        self.assertEqual(Family.objects.filter(valid=True).count(), 1)
+        self.assertEqual(Family.objects.get(valid=False).invalidreason, 'T1-03')
+        self.assertTrue(Adult.objects.get().valid)
+        self.assertTrue(Child.objects.get().valid)
+
+    def test_case_checks(self):
+        """adults and children without a family, and closed people that aren't there, are invalid"""
+        with open('upload/fixtures/testdata.txt', 'rb') as f:
+            header, t1, t2, t3, trailer = f.readlines()
+        t3 = t3[:8] + b'%011d' % 99 + t3[19:]
+        # a T5 is a T2 without the byte after the casenumber, and shorter
+        closed = b'T5' + t2[2:20] + t2[21:72] + b'\n'
+        unknown = closed[:28] + b'000000001' + closed[37:]
+        lines = [header, t1, t2, t3, closed, unknown, trailer]
+        importLines(lines)
+        self.assertTrue(Family.objects.get().valid)
+        self.assertFalse(Adult.objects.exists())
+        child = Child.objects.get()
+        self.assertFalse(child.valid)
+        self.assertEqual(child.invalidreason, 'T3-09')
+        self.assertEqual(sorted(ClosedPerson.objects.values_list('socialsecuritynumber', 'invalidreason')),
+                         [('000000001', 'T5-01'), (t2[29:38].decode(), '')])
+
+    def test_closed_children(self):
+        """closing one child on a T3 leaves the other one there, and closing both deletes it"""
+        with open('upload/fixtures/testdata.txt', 'rb') as f:
+            header, t1, t2, t3, trailer = f.readlines()
+        twochild = t3[:59] + t3[19:28] + b'000000002' + t3[37:59] + b' \n'
+        closed = b'T5' + t3[2:37] + (b'T5' + t2[2:20] + t2[21:72])[37:] + b'\n'
+        importLines([header, t1, twochild, closed[:28] + b'000000002' + closed[37:], trailer])
+        child = Child.objects.get()
+        self.assertEqual((child.socialsecuritynumber_1, child.socialsecuritynumber_2), ('765403471', ''))
+        self.assertIsNone(child.dateofbirth_2)
+        self.assertEqual(child.dateofbirth_1, datetime.date(2002, 1, 26))
+
+        importLines([header, closed, trailer])
+        self.assertFalse(Child.objects.exists())
+        self.assertFalse(ClosedPerson.objects.filter(valid=False).exists())
+
+    def test_duplicates(self):
+        """records that are in a file twice are invalid the second time"""
+        with open('upload/fixtures/testdata.txt', 'rb') as f:
+            header, t1, t2, t3, trailer = f.readlines()
+        other = t2[:29] + b'000000001' + t2[38:]
+        lines = [header, t1, t2, t3, t1, t2, other, trailer]
+        for mode in ['exact', 'bloom']:
+            with override_settings(TANF_DUPLICATE_CHECK=mode, TANF_DUPLICATE_BLOOM_CAPACITY=1000):
+                importLines(lines)
+            self.assertEqual(list(Family.objects.values_list('invalidreason', flat=True).order_by('id')), ['', 'T1-16'])
+            self.assertEqual(list(Adult.objects.values_list('invalidreason', flat=True).order_by('id')), ['', 'T2-13', ''])
+            self.assertTrue(Child.objects.get().valid)
+            for model in [Family, Adult, Child]:
+                model.objects.all().delete()
+
+        with override_settings(TANF_DUPLICATE_CHECK='off'):
+            importLines(lines)
+        self.assertEqual(Family.objects.filter(valid=True).count(), 2)
+
+    def test_unknown_records(self):
+        """lines we do not know about make the import fail"""
+        with self.assertRaises(TANFParseError) as cm:
+            importLines([b'HEADER20191A41   TAN1 N\n', b'T9 what is this\n', b'T1short\n'])
+        self.assertEqual(cm.exception.counts, {'unknown record type': 1, 'line too short': 1})
+        self.assertEqual(cm.exception.lines[0], (2, 'unknown record type', 'T9 what is this'))
+
+    def test_error_threshold(self):
+        """garbage files are given up on as soon as there are too many errors"""
+        garbage = [b'HEADER20191A41   TAN1 N\n'] + [b'garbage\n'] * 10000
+        with self.assertRaises(TANFParseError) as cm:
+            importLines(garbage, errors=ErrorSink(keep=5, threshold=50))
+        self.assertTrue(cm.exception.aborted)
+        self.assertEqual(cm.exception.total, 51)
+        self.assertEqual(len(cm.exception.lines), 5)
+        self.assertEqual(cm.exception.spilled, 46)
+
+    def test_parse_parallel(self):
+        """parsing a file with a pool of workers gives the same records as parsing it in one go"""
+        with open('upload/fixtures/testdata.txt', 'rb') as f:
+            header, t1, t2, t3, trailer = f.readlines()
+        t2 = t2[:21] + b'19731304' + t2[29:]
+
+        def simplify(records):
+            return [(rt.prefix, converter.layout.name, converted, problems)
+                    for rt, converter, converted, problems in records]
+
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(header + (t1 + t2 + t3) * 500 + trailer)
+            f.flush()
+            f.seek(0)
+            serialcontext = newContext()
+            serial = simplify(parseRecords(readLines(f), serialcontext))
+            parallelcontext = newContext()
+            parallel = simplify(parseParallel(f.name, parallelcontext, 2))
+
+        self.assertEqual(len(serial), 1500)
+        self.assertEqual(parallel, serial)
+        for key in ['header', 'trailer', 'lines']:
+            self.assertEqual(parallelcontext[key], serialcontext[key])
+        self.assertEqual(parallelcontext['trailer']['title'], 'TRAILER')
+
+    def test_parse_parallel_errors(self):
+        """errors from the workers are numbered from the start of the file"""
+        with open('upload/fixtures/testdata.txt', 'rb') as f:
+            header, t1, t2, t3, trailer = f.readlines()
+
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(header + (t1 + t2 + t3) * 500 + b'T9 what is this\r\n' + trailer)
+            f.flush()
+            context = newContext(errors=ErrorSink())
+            self.assertEqual(len(list(parseParallel(f.name, context, 2))), 1500)
+        self.assertEqual(context['errors'].lines, [(1502, 'unknown record type', 'T9 what is this')])
@@ -8,6 +8,7 @@ urlpatterns = [
     path('useradmin', views.useradmin, name='useradmin'),
     path('status/', views.status, name='status'),
     path('fileinfo/<file>/', views.fileinfo, name='fileinfo'),
+    path('preview/<file>/', views.preview, name='preview'),
     path('deletesuccessful/', views.deletesuccessful, name='deletesuccessful'),
     path('delete/<file>/', views.delete, name='delete'),
     path('delete/<file>/<confirmed>', views.delete, name='delete'),
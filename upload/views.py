@@ -1,5 +1,10 @@
 from django.shortcuts import render, redirect
 from upload.tasks import importRecords
+from upload.parsecache import releaseParseCache
+from tanfparser.reader import decompressed, CompressedFileError
+from tanfparser.preflight import preview as previewFile
+from django.conf import settings
+from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 import datetime
 import json
@@ -9,6 +14,7 @@ from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core import serializers
 from django.http import HttpResponse, Http404
 from upload.querysetchain import QuerySetChain
+from upload.models import ImportCheckpoint
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 
@@ -28,15 +34,18 @@ def upload(request):
         datestr = datetime.datetime.now().strftime('%Y%m%d%H%M%SZ')
         originalname = myfile.name
 
-        # save a copy for processing
+        # save a copy for processing.  Gzipped and zipped files are saved as
+        # they are, and decompressed whenever they are read.
         originalfilename = '_'.join([user, datestr, originalname, '.txt'])
         default_storage.save(originalfilename, myfile)
 
-        # process file (validate and store records)
-        importRecords(originalfilename, user)
+        # process file (validate and store records).  The digest comes from
+        # upload.parsecache.HashingUploadHandler.
+        digest = getattr(request, 'upload_digests', {}).get('myfile')
+        importRecords(originalfilename, user, digest)
 
-        # redirect to status page
-        return redirect('status')
+        # show them what is in it while the import waits its turn
+        return redirect('preview', file=originalfilename)
 
     return render(request, 'upload.html')
 
@@ -75,15 +84,75 @@ def download(request, file=None, json=None):
         if json is not None:
             file = file + '.json'
         try:
-            with default_storage.open(file, 'r') as f:
+            # compressed uploads are kept compressed, so expand them on the way out
+            with default_storage.open(file, 'rb') as original, decompressed(original) as f:
                 response = HttpResponse(f.read(), content_type="text/plain")
                 response['Content-Disposition'] = 'inline; filename=' + file
                 return response
-        except (FileNotFoundError, OSError):
+        except (FileNotFoundError, OSError, CompressedFileError):
             raise Http404
     return redirect('status')
 
 
+# This is a quick look at what is in an upload (see
+# tanfparser.preflight.preview()), which can be shown as soon as it has been
+# uploaded instead of once the import has gotten to it, so that people find
+# out about files for the wrong quarter or that are all wrong right away.
+@login_required
+def preview(request, file=None):
+    if not (file.endswith('.txt') and file.startswith(str(request.user))):
+        return redirect('status')
+    info = previewInfo(file)
+
+    try:
+        with default_storage.open(file + '.status', 'r') as f:
+            status = json.load(f)['status']
+    except (FileNotFoundError, OSError):
+        status = 'Queued'
+
+    context = dict(info, file=file, status=status)
+    return render(request, "preview.html", context)
+
+
+# Working out the preview means reading all of the upload, which is too slow
+# to do every time someone reloads the page, so it is done once and kept in
+# <file>.preview.
+def previewInfo(file):
+    previewfile = file + '.preview'
+    try:
+        with default_storage.open(previewfile, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, OSError, JSONDecodeError):
+        pass
+
+    try:
+        with default_storage.open(file, 'rb') as original, decompressed(original) as f:
+            info = previewFile(f, settings.TANF_PREVIEW_RECORDS)
+    except (FileNotFoundError, OSError):
+        raise Http404
+    except CompressedFileError as e:
+        info = {'problems': [(1, str(e), '')], 'problemcount': 1}
+
+    # a table for each layout, since some record types have more than one
+    records = []
+    for prefix, views in info.get('records', {}).items():
+        layouts = {}
+        for view in views:
+            layouts.setdefault(view.layout, []).append(view.asTuple())
+        for layout, rows in layouts.items():
+            records.append((prefix, layout.fields, rows))
+    info = {
+        'header': info.get('header', {}),
+        'counts': sorted(info.get('counts', {}).items()),
+        'problems': info['problems'],
+        'problemcount': info['problemcount'],
+        'records': records,
+    }
+    if not default_storage.exists(previewfile):
+        default_storage.save(previewfile, ContentFile(json.dumps(info, default=str).encode()))
+    return info
+
+
 # This is where we should be able to delve in and edit data that needs fixing.
 # For now, we will just show the issues, so they can reupload.  Maybe this is
 # better, because this will enforce good data hygiene on the STT end?
@@ -95,7 +164,7 @@ def fileinfo(request, file=None):
     try:
         with default_storage.open(statusfile, 'r') as f:
             statusdata = json.load(f)
-            status = [statusdata['status']]
+            status = [statusdata['status']] + statusdata.get('errors', [])
     except (FileNotFoundError, OSError):
         status = ['No status yet.  This probably means the file was interrupted during processing and thus is stuck.',
                   'You will probably want to delete and re-import this file.']
@@ -113,6 +182,14 @@ def fileinfo(request, file=None):
     return render(request, "fileinfo.html", context)
 
 
+# This deletes what is cached about an upload that is being deleted.  The
+# parse cache entry only goes if no other upload uses it.
+def deleteCache(file):
+    if default_storage.exists(file + '.preview'):
+        default_storage.delete(file + '.preview')
+    releaseParseCache(file)
+
+
 @login_required
 def deletesuccessful(request):
     files = []
@@ -133,6 +210,9 @@ def deletesuccessful(request):
         if default_storage.exists(file) and default_storage.exists(statusfile):
             default_storage.delete(file)
             default_storage.delete(statusfile)
+            if default_storage.exists(file + '.errors'):
+                default_storage.delete(file + '.errors')
+            deleteCache(file)
     return redirect('status')
 
 
@@ -141,20 +221,19 @@ def delete(request, file=None):
     confirmed = request.GET.get('confirmed')
     statusfile = file + '.status'
     invalidfile = file + '.invalid'
+    errorsfile = file + '.errors'
 
     try:
         with default_storage.open(statusfile, 'r') as f:
             status = json.load(f)
     except (FileNotFoundError, OSError):
         # no status, so probably stuck.  Clean everything.
-        try:
-            default_storage.delete(file)
-        except (FileNotFoundError, OSError):
-            pass
-        try:
-            default_storage.delete(invalidfile)
-        except (FileNotFoundError, OSError):
-            pass
+        for i in [file, invalidfile, errorsfile]:
+            try:
+                default_storage.delete(i)
+            except (FileNotFoundError, OSError):
+                pass
+        deleteCache(file)
         return redirect('status')
 
     try:
@@ -173,20 +252,29 @@ def delete(request, file=None):
     if default_storage.exists(file) and default_storage.exists(statusfile):
         default_storage.delete(file)
         default_storage.delete(statusfile)
-        try:
-            default_storage.delete(invalidfile)
-        except (FileNotFoundError, OSError):
-            pass
+        for i in [invalidfile, errorsfile]:
+            try:
+                default_storage.delete(i)
+            except (FileNotFoundError, OSError):
+                pass
+        deleteCache(file)
 
     return redirect('status')
 
 
+# These are the names of the models that records from uploads are stored
+# in, which is everything in the upload app except for the bookkeeping
+# (ImportCheckpoint).
+def datamodels():
+    return [name for name, model in apps.all_models['upload'].items() if model is not ImportCheckpoint]
+
+
 # Look at various things in the tables
 @login_required
 def viewTables(request):
     # choose what table to view
     tablelist = []
-    for model in apps.all_models['upload']:
+    for model in datamodels():
         tablelist.append(model)
     table = request.GET.get('table')
     if table is None:
@@ -245,7 +333,7 @@ def uniquelist(list):
 def viewquarter(request):
     # enumerate all the available calendarquarters in all tables.
     calquarters = []
-    for model in apps.all_models['upload']:
+    for model in datamodels():
         mymodel = apps.get_model('upload', model)
         for cq in mymodel.objects.values('calendar_quarter').distinct():
             calquarters.append(cq['calendar_quarter'])
@@ -262,7 +350,7 @@ def viewquarter(request):
 
     # select all data for the selected calquarter
     qslist = []
-    for model in apps.all_models['upload']:
+    for model in datamodels():
         mymodel = apps.get_model('upload', model)
         newdata = mymodel.objects.filter(calendar_quarter=calquarter)
         qslist.append(newdata)
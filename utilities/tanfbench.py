@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+#
+# This script does some quick and dirty microbenchmarks of the TANF
+# parsing code, so that we can tell whether changes to it make things
+# faster or slower.
+#
+# It needs to be able to load the django app, so run it from the top of
+# the repo with the same environment you would use for manage.py:
+#
+# usage:  NOLOGINGOV=true python3 utilities/tanfbench.py [numlines] [megabytes] [parallelmegabytes]
+#
+# There is also a suite that runs the parser over made up TANF files of a
+# few sizes and writes the results out as json, so that runs on different
+# branches or machines can be compared.  The files are made from the record
+# type definitions with a fixed random seed, so every run parses exactly the
+# same data:
+#
+# usage:  NOLOGINGOV=true python3 utilities/tanfbench.py --suite [--sizes 10000,100000,1000000] [--json results.json]
+#
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import struct
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tanf.settings')
+
+import django  # noqa: E402
+django.setup()
+
+import tanfparser  # noqa: E402
+import tanfparser.duplicates  # noqa: E402
+from upload import tanfDataProcessing  # noqa: E402
+
+
+# This is what the line for each record type starts with.
+recordprefixes = {
+    'header': 'HEADER',
+    'section1_familydata': 'T1',
+    'section1_adultdata': 'T2',
+    'section1_childdata': 'T3',
+    'section1_childdata_exampledata': 'T3',
+    'section1_childdata_twochild': 'T3',
+    'section2_closedcase': 'T4',
+    'section2_closedperson': 'T5',
+    'section3_aggregatedata': 'T6',
+    'section4_familiesbystratum': 'T7',
+    'trailer': 'TRAILER',
+}
+
+
+# This is how parseFields() used to work, before the layouts were compiled.
+def legacyParseFields(fieldinfo, linestring):
+    fields = list(fieldinfo.keys())
+    fieldwidths = list(fieldinfo.values())
+    fmtstring = ' '.join('{}{}'.format(abs(fw), 'x' if fw < 0 else 's')
+                         for fw in fieldwidths)
+    fieldstruct = struct.Struct(fmtstring)
+    unpack = fieldstruct.unpack_from
+
+    def parse(line):
+        return tuple(s.decode() for s in unpack(line.encode()))
+    return dict(zip(fields, parse(linestring)))
+
+
+# This is how decryptSsn() used to work, before it used translation tables.
+def legacyDecryptSsn(ssn):
+    result = ''
+    for z in ssn:
+        try:
+            result = result + tanfparser.decryptmap[z]
+        except Exception:
+            result = result + z
+    return result
+
+
+# Make up a line that is the right size for a layout.  The contents don't
+# matter for parsing, only the length does.
+def sampleLine(name, layout):
+    prefix = recordprefixes[name]
+    return prefix + ''.join(str(i % 10) for i in range(layout.size - len(prefix)))
+
+
+def linesPerSecond(func, lines):
+    start = time.perf_counter()
+    for line in lines:
+        func(line)
+    elapsed = time.perf_counter() - start
+    return len(lines) / elapsed
+
+
+def benchParseFields(numlines):
+    print('{:32} {:>14} {:>14} {:>8}'.format('record type', 'before lines/s', 'after lines/s', 'speedup'))
+    for name, layout in tanfparser.recordlayouts.items():
+        lines = [sampleLine(name, layout)] * numlines
+        fieldinfo = layout.fieldinfo
+        before = linesPerSecond(lambda line: legacyParseFields(fieldinfo, line), lines)
+        after = linesPerSecond(lambda line: tanfparser.parseFields(fieldinfo, line), lines)
+        print('{:32} {:14.0f} {:14.0f} {:7.1f}x'.format(name, before, after, after / before))
+
+
+# Compare the ways of decrypting ssns.  The batch ones are timed over the
+# whole list at once.
+def benchSsn(numlines):
+    encrypttable = str.maketrans(tanfparser.encryptmap)
+    ssns = ['{:09d}'.format(i * 7919 % 1000000000).translate(encrypttable) for i in range(numlines)]
+
+    print('{:32} {:>14}'.format('ssn decryption', 'ssns/s'))
+    for name, func in [
+            ('before (loop)', lambda: [legacyDecryptSsn(ssn) for ssn in ssns]),
+            ('decryptSsn', lambda: [tanfparser.decryptSsn(ssn) for ssn in ssns]),
+            ('decryptSsns', lambda: tanfparser.decryptSsns(ssns))]:
+        start = time.perf_counter()
+        func()
+        print('{:32} {:14.0f}'.format(name, numlines / (time.perf_counter() - start)))
+
+
+# Compare reading a big file through the memory mapped reader to reading it
+# a line at a time like we have to for streams that can't be mapped.  We
+# look up the record type of each line too, since that is the least that
+# anybody does with a line.
+def benchReader(megabytes):
+    lines = []
+    for prefix in ['T1', 'T2', 'T3']:
+        layout = tanfparser.recordtypes[prefix].layouts[0]
+        lines.append(sampleLine(layout.name, layout).encode() + b'\r\n')
+    block = b''.join(lines) * 1000
+
+    with tempfile.TemporaryFile() as f:
+        f.write(block * (megabytes * 1024 * 1024 // len(block) + 1))
+        f.flush()
+        size = f.tell() / (1024 * 1024)
+
+        print('{:32} {:>14} {:>14}'.format('reader ({:.0f} MB)'.format(size), 'lines/s', 'MB/s'))
+        for name, source in [('mmap', lambda: f), ('stream', lambda: iter(f))]:
+            f.seek(0)
+            count = 0
+            start = time.perf_counter()
+            for line in tanfparser.readLines(source()):
+                tanfparser.getRecordType(line)
+                count += 1
+            elapsed = time.perf_counter() - start
+            print('{:32} {:14.0f} {:14.1f}'.format(name, count / elapsed, size / elapsed))
+
+
+# See how parsing a file into records scales with the number of worker
+# processes.  The records are thrown away instead of going into the db, so
+# this is only the parsing side of an import.
+def benchParallel(megabytes):
+    header = b'HEADER20191A41   TAN1 N'
+    lines = []
+    for prefix in ['T1', 'T2', 'T3']:
+        layout = tanfparser.recordtypes[prefix].layouts[0]
+        lines.append(sampleLine(layout.name, layout).encode() + b'\r\n')
+    block = b''.join(lines) * 1000
+
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(header + b'\r\n')
+        f.write(block * (megabytes * 1024 * 1024 // len(block) + 1))
+        f.flush()
+        size = f.tell() / (1024 * 1024)
+
+        print('{:32} {:>14} {:>14} {:>8}'.format('parse ({:.0f} MB)'.format(size), 'records/s', 'MB/s', 'speedup'))
+        baseline = None
+        for workers in range(1, (os.cpu_count() or 1) + 1):
+            f.seek(0)
+            context = tanfDataProcessing.newContext()
+            start = time.perf_counter()
+            if workers == 1:
+                records = tanfDataProcessing.parseRecords(tanfparser.readLines(f), context)
+            else:
+                records = tanfDataProcessing.parseParallel(f.name, context, workers)
+            count = sum(1 for record in records)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = elapsed
+            print('{:32} {:14.0f} {:14.1f} {:7.1f}x'.format('{} workers'.format(workers), count / elapsed, size / elapsed, baseline / elapsed))
+
+
+##########################################################################
+# The benchmark suite
+
+
+# This is how many of each kind of record there are in the made up files,
+# for every family.  Real files are mostly T1/T2/T3 records, with a closed
+# case or person here and there.
+corpusmix = [
+    ('section1_familydata', 10),
+    ('section1_adultdata', 12),
+    ('section1_childdata', 18),
+    ('section2_closedcase', 1),
+    ('section2_closedperson', 1),
+    ('section3_aggregatedata', 1),
+    ('section4_familiesbystratum', 1),
+]
+
+# Making up every line from scratch takes longer than parsing them, so the
+# files are made out of this many different lines of each kind.
+CORPUS_POOL_SIZE = 1000
+
+
+# Make up the value of a field.  Dates have to be real dates, and the rest
+# are numbers, which is what almost all of the fields are.
+def sampleValue(rng, field, width):
+    if field.startswith('dateofbirth') and width == 8:
+        return '{:04d}{:02d}{:02d}'.format(rng.randint(1940, 2019), rng.randint(1, 12), rng.randint(1, 28))
+    return ''.join(rng.choice('0123456789') for i in range(width))
+
+
+def sampleRecord(rng, name):
+    layout = tanfparser.recordlayouts[name]
+    values = []
+    for field, width in layout.fieldinfo.items():
+        if field == 'recordtype':
+            values.append(recordprefixes[name])
+        elif width < 0:
+            values.append(' ' * -width)
+        else:
+            values.append(sampleValue(rng, field, width))
+    return ''.join(values)
+
+
+# This makes up a TANF file with numlines lines (counting the header and
+# trailer) as bytes.  The same numlines and seed always give the same file.
+def makeCorpus(numlines, seed=0):
+    rng = random.Random(seed)
+    pools = {name: [(sampleRecord(rng, name) + '\r\n').encode() for i in range(CORPUS_POOL_SIZE)]
+             for name, weight in corpusmix}
+    names = [name for name, weight in corpusmix]
+    weights = [weight for name, weight in corpusmix]
+
+    lines = [b'HEADER20191A41   TAN1 N\r\n']
+    for name in rng.choices(names, weights, k=max(0, numlines - 2)):
+        lines.append(rng.choice(pools[name]))
+    lines.append('TRAILER{:07d}         \r\n'.format(len(lines) - 1).encode())
+    return b''.join(lines)
+
+
+# Run func() once for the time, and then again under tracemalloc for the
+# peak memory, since tracemalloc slows everything down a lot.
+def measure(func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def result(benchmark, recordtype, numlines, numfields, elapsed, peak):
+    return {
+        'benchmark': benchmark,
+        'recordtype': recordtype,
+        'lines': numlines,
+        'fields': numfields,
+        'seconds': round(elapsed, 6),
+        'lines_per_sec': round(numlines / elapsed),
+        'ns_per_field': round(elapsed * 1e9 / numfields, 1) if numfields else None,
+        'peak_bytes': peak,
+    }
+
+
+# This is a null file for tanf2jsonStream() to write to, so that we measure
+# the parsing and not a StringIO getting bigger.
+class NullSink:
+    def write(self, s):
+        return len(s)
+
+
+def benchSuite(sizes, seed=0):
+    results = []
+    for size in sizes:
+        corpus = makeCorpus(size, seed)
+        lines = corpus.decode().splitlines()
+
+        # parseFields() by itself for every kind of record
+        bylayout = {}
+        for line in lines:
+            rt = tanfparser.getRecordType(line)
+            layout = rt.layoutFor(len(line))
+            bylayout.setdefault(layout, []).append(line)
+        for layout in tanfparser.recordlayouts.values():
+            layoutlines = bylayout.get(layout)
+            if not layoutlines:
+                continue
+            fieldinfo = layout.fieldinfo
+
+            def parse():
+                for line in layoutlines:
+                    tanfparser.parseFields(fieldinfo, line)
+            elapsed, peak = measure(parse)
+            results.append(result('parseFields', layout.name, len(layoutlines), len(layoutlines) * len(layout.fields), elapsed, peak))
+
+        numfields = sum(len(layout.fields) * len(layoutlines) for layout, layoutlines in bylayout.items())
+        del lines, bylayout
+
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(corpus)
+            f.flush()
+            del corpus
+
+            # the whole file to json, like the tanf2json tool does it
+            def tojson():
+                f.seek(0)
+                tanfparser.tanf2jsonStream(f, NullSink())
+            elapsed, peak = measure(tojson)
+            results.append(result('tanf2json', 'all', size, numfields, elapsed, peak))
+
+            # everything an import does before validating and storing records
+            def parserecords():
+                f.seek(0)
+                context = tanfDataProcessing.newContext()
+                for record in tanfDataProcessing.parseRecords(tanfparser.readLines(f), context):
+                    pass
+            elapsed, peak = measure(parserecords)
+            results.append(result('import parse', 'all', size, numfields, elapsed, peak))
+
+            # the validation rules, in the same batches that validateRecords() uses
+            f.seek(0)
+            records = list(tanfDataProcessing.parseRecords(tanfparser.readLines(f), tanfDataProcessing.newContext()))
+
+            def validate():
+                for i in range(0, len(records), 1000):
+                    tanfDataProcessing.checkRecords(records[i:i + 1000])
+            elapsed, peak = measure(validate)
+            results.append(result('import validate', 'all', size, numfields, elapsed, peak))
+
+            # the duplicate check by itself, with each kind of key set, in
+            # the same batches again
+            keyed = [(rt.prefix, converter.fields, converted) for rt, converter, converted, problems in records]
+            for name, seen in [('duplicates', tanfparser.duplicates.KeySet), ('duplicates bloom', lambda: tanfparser.duplicates.BloomFilter(size))]:
+                def duplicates():
+                    check = tanfparser.duplicates.DuplicateCheck(seen())
+                    for i in range(0, len(keyed), 1000):
+                        check.addMany(keyed[i:i + 1000])
+                elapsed, peak = measure(duplicates)
+                results.append(result(name, 'all', size, numfields, elapsed, peak))
+    return results
+
+
+# This is what the machine and code were when the suite was run, so that
+# results can be compared fairly.
+def suiteInfo(seed):
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seed': seed,
+    }
+
+
+def printSuite(results):
+    print('{:17} {:32} {:>9} {:>12} {:>10} {:>12}'.format('benchmark', 'record type', 'lines', 'lines/s', 'ns/field', 'peak MB'))
+    for r in results:
+        print('{:17} {:32} {:9d} {:12d} {:10.1f} {:12.1f}'.format(
+            r['benchmark'], r['recordtype'], r['lines'], r['lines_per_sec'], r['ns_per_field'], r['peak_bytes'] / (1024 * 1024)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the TANF parser.')
+    parser.add_argument('numlines', type=int, nargs='?', default=100000)
+    parser.add_argument('megabytes', type=int, nargs='?', default=300)
+    parser.add_argument('parallelmegabytes', type=int, nargs='?', default=50)
+    parser.add_argument('--suite', action='store_true', help='run the benchmark suite instead of the comparisons')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='how many lines the suite files have')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed the suite files are made with')
+    parser.add_argument('--json', help='write the suite results to this file')
+    args = parser.parse_args()
+
+    if args.suite:
+        results = benchSuite([int(size) for size in args.sizes.split(',')], args.seed)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'info': suiteInfo(args.seed), 'results': results}, f, indent=2)
+        printSuite(results)
+        sys.exit(0)
+
+    benchParseFields(args.numlines)
+    print()
+    benchSsn(args.numlines)
+    print()
+    benchReader(args.megabytes)
+    print()
+    benchParallel(args.parallelmegabytes)